@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/3.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -129,6 +130,109 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 
+# PDF text extraction
+# PDF_TEXT_BACKEND selects the extractor used by every handler ('pymupdf' or 'pypdf2').
+# Registers with at least PDF_PARALLEL_MIN_PAGES pages are split into page ranges
+# for PDF_EXTRACTION_WORKERS processes of the shared worker pool, which is sized to
+# the larger of PDF_EXTRACTION_WORKERS and BATCH_ANALYSIS_WORKERS.
+
+PDF_TEXT_BACKEND = 'pymupdf'
+
+PDF_EXTRACTION_WORKERS = int(os.environ.get('PDF_EXTRACTION_WORKERS', os.cpu_count() or 1))
+
+PDF_PARALLEL_MIN_PAGES = 40
+
+# Streaming mode reads register pages lazily and writes get-analysis-data artifacts
+# as students are parsed, keeping peak memory flat regardless of page count.
+# Page-sharded extraction is not used in this mode.
+
+ANALYSIS_STREAMING = os.environ.get('ANALYSIS_STREAMING', '') == '1'
+
+# Uploads are parsed in place (memory-mapped temporary files or in-memory buffers).
+# Set RETAIN_UPLOADED_PDFS to also keep a copy of each uploaded PDF in MEDIA_ROOT/uploads.
+
+RETAIN_UPLOADED_PDFS = os.environ.get('RETAIN_UPLOADED_PDFS', '') == '1'
+
+# Batch analysis
+# batch-analysis-data and the multi-semester percentage merge parse whole PDFs
+# in BATCH_ANALYSIS_WORKERS processes of the shared worker pool. A batch holds at
+# most BATCH_MAX_FILES PDFs and BATCH_MAX_BYTES of PDF data once extracted from its ZIPs.
+
+BATCH_ANALYSIS_WORKERS = int(os.environ.get('BATCH_ANALYSIS_WORKERS', os.cpu_count() or 1))
+
+BATCH_MAX_FILES = 200
+
+BATCH_MAX_BYTES = 1024 * 1024 * 1024
+
+
+# Uploads are hashed (SHA-256) while they stream in, so repeated uploads of the
+# same file can be answered from the result cache.
+
+FILE_UPLOAD_HANDLERS = [
+    'analysis.upload_handlers.HashingMemoryFileUploadHandler',
+    'analysis.upload_handlers.HashingTemporaryFileUploadHandler',
+]
+
+
+# Result cache
+# Entries live in MEDIA_ROOT/cache and are evicted least recently used first,
+# together with their artifacts, once they take more than RESULT_CACHE_MAX_BYTES.
+
+RESULT_CACHE_ENABLED = True
+
+RESULT_CACHE_MAX_BYTES = 2 * 1024 ** 3
+
+
+# Result database
+# Every analysis is also stored in the analysis app's tables (Register, Student,
+# PaperResult, SemesterPercentage), inserted in batches of RESULT_DATABASE_BATCH_SIZE.
+
+RESULT_DATABASE_ENABLED = True
+
+RESULT_DATABASE_BATCH_SIZE = 1000
+
+
+# Export formats
+# Analysis endpoints take ?format=json,json-compact,xlsx,csv,parquet,arrow (json and xlsx
+# by default) and only write those artifacts. parquet and arrow need pyarrow installed.
+# DRF's own ?format= renderer override is turned off so the parameter reaches the views.
+# With LAZY_ARTIFACTS only the results JSON is written during analysis; the other formats
+# are built on first download through analysis/artifacts/<id>/<format>/ and kept on disk.
+
+REST_FRAMEWORK = {
+    'URL_FORMAT_OVERRIDE': None,
+}
+
+LAZY_ARTIFACTS = True
+
+
+# Charts
+# pass-fail-analysis renders its chart as ?chart=png|svg (or answers with the counts
+# alone for ?chart=data) at ?dpi=CHART_DEFAULT_DPI..CHART_MAX_DPI. Rendered charts are
+# kept in the result cache, keyed by the chart data and these options.
+
+CHART_DEFAULT_DPI = 150
+
+CHART_MAX_DPI = 600
+
+
+# Analysis job queue
+# Endpoints called with ?async=1 queue their uploads in this SQLite file; any number of
+# `manage.py run_analysis_workers` processes (on hosts sharing the file and MEDIA_ROOT)
+# drain it. A job whose worker stops renewing its lease is retried up to JOB_MAX_ATTEMPTS times.
+# Workers send the job's progress (pages or files processed) every JOB_PROGRESS_SECONDS.
+
+JOB_QUEUE_PATH = BASE_DIR / 'jobs.sqlite3'
+
+JOB_LEASE_SECONDS = 300
+
+JOB_MAX_ATTEMPTS = 3
+
+JOB_PROGRESS_SECONDS = 2
+
+JOB_WORKER_PROCESSES = int(os.environ.get('JOB_WORKER_PROCESSES', os.cpu_count() or 1))
+
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/3.1/howto/static-files/
 
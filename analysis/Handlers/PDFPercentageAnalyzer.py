@@ -1,10 +1,17 @@
-import PyPDF2
 import pandas as pd
 import re
 import os
-import json
 from uuid import uuid4
 from django.conf import settings
+from .pdf_text import PdfSource, extract_text_from_pdf, retain_upload, upload_path
+from . import exports, result_cache
+from .worker_pool import map_tasks
+from .name_matching import NameIndex, name_similarity
+from . import result_store
+
+# Bump whenever parsing changes what a PDF endpoint returns, so cached results are not reused.
+# Shared by every endpoint that parses registers (see analysis_handler and batch_handler).
+PARSER_VERSION = 2
 
 
 def normalize_name(name):
@@ -19,24 +26,6 @@ def normalize_name(name):
     return name
 
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF file"""
-    text = ""
-    try:
-        with open(pdf_path, 'rb') as pdf_file:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            num_pages = len(pdf_reader.pages)
-            
-            for page_num in range(num_pages):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() or ""
-                   
-    except Exception as e:
-        return f"An error occurred: {e}"
-       
-    return text
-
-
 def parse_subject_structure(text):
     """Parse subject codes and max marks"""
     university_pattern = r'University\s+of\s+Mumbai'
@@ -70,84 +59,88 @@ def parse_subject_structure(text):
     return {code: total_marks_map[code] for code in subject_order}
 
 
+# Compiled once; the scanner runs them on every line of every register
+_THREE_TOKEN_CELL_RE = re.compile(r'^([A-Z0-9]+)\s+([A-Z0-9]+)\s+([A-Z0-9]+)$')
+_DASH_CELL_RE = re.compile(r'^[‐\-–]+\s+([A-Z0-9]+)\s+([A-Z0-9]+)$')
+_DIGITS_RE = re.compile(r'(\d+)')
+_STUDENT_LINE_RE = re.compile(r'(\d{7})\s+(/\s+)?([A-Z][A-Z\s]+?)\s+\|')
+_UNIVERSITY_RE = re.compile(r'University\s+of\s+Mumbai', re.IGNORECASE)
+
+# A student's marks must appear within this many lines of its seat number
+STUDENT_WINDOW_LINES = 20
+
+# Semester merge: names must be at least this similar for a fuzzy match. Seat numbers
+# are reissued between exams, so a seat number match with a different name needs it too.
+FUZZY_MATCH_THRESHOLD = 0.85
+
+
 def extract_marks_from_cell(cell):
     """Extract marks from cell, handles AA, --, 7F, 10E, etc."""
     cell = cell.strip()
     
-    match1 = re.match(r'^([A-Z0-9]+)\s+([A-Z0-9]+)\s+([A-Z0-9]+)$', cell)
+    match1 = _THREE_TOKEN_CELL_RE.match(cell)
     if match1:
-        val3 = match1.group(3)
-        num = re.search(r'(\d+)', val3)
+        num = _DIGITS_RE.search(match1.group(3))
         return int(num.group(1)) if num else 0
     
-    match2 = re.match(r'^[‐\-–]+\s+([A-Z0-9]+)\s+([A-Z0-9]+)$', cell)
+    match2 = _DASH_CELL_RE.match(cell)
     if match2:
-        val2 = match2.group(2)
-        num = re.search(r'(\d+)', val2)
+        num = _DIGITS_RE.search(match2.group(2))
         return int(num.group(1)) if num else 0
     
     return None
 
 
-def parse_students(text, num_subjects):
-    """Parse students from PDF text"""
-    students = []
-    
-    match = re.search(r'University\s+of\s+Mumbai', text, re.IGNORECASE)
+def scan_students(text, num_subjects):
+    """
+    Single pass over the register lines, yielding (seat_no, name, marks) per student.
+    Each line is tokenized once and its marks go to every student whose window is
+    still open, so overlapping windows give the same marks as rescanning them.
+    """
+    match = _UNIVERSITY_RE.search(text)
     if match:
         text = text[match.start():]
-    
-    lines = text.split('\n')
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        student_match = re.search(r'(\d{7})\s+(/\s+)?([A-Z][A-Z\s]+?)\s+\|', line)
-        
+    return scan_student_lines(text.split('\n'), num_subjects)
+
+def scan_student_lines(lines, num_subjects):
+    """scan_students over an iterable of lines that starts at the register header"""
+    # Open students in seat order: [seat_no, name, marks, last line of window]
+    open_students = []
+
+    for i, line in enumerate(lines):
+        student_match = _STUDENT_LINE_RE.search(line)
         if student_match:
-            seat_no = student_match.group(1)
-            name = student_match.group(3).strip()
-            
-            marks = []
-            for j in range(i, min(i + 20, len(lines))):
-                cells = lines[j].split('|')
-                for cell in cells:
-                    mark = extract_marks_from_cell(cell)
-                    if mark is not None and len(marks) < num_subjects:
-                        marks.append(mark)
-                if len(marks) >= num_subjects:
-                    break
-            
+            open_students.append([student_match.group(1), student_match.group(3).strip(), [], i + STUDENT_WINDOW_LINES - 1])
+
+        if not open_students:
+            continue
+
+        line_marks = [mark for mark in map(extract_marks_from_cell, line.split('|')) if mark is not None]
+        if line_marks:
+            for student in open_students:
+                marks = student[2]
+                if len(marks) < num_subjects:
+                    marks.extend(line_marks[:num_subjects - len(marks)])
+
+        # Students leave in seat order once complete or out of lines
+        while open_students and (len(open_students[0][2]) >= num_subjects or open_students[0][3] <= i):
+            seat_no, name, marks, _ = open_students.pop(0)
             if len(marks) >= num_subjects:
-                students.append({
-                    'seat_no': seat_no,
-                    'name': name,
-                    'normalized_name': normalize_name(name),
-                    'marks': marks[:num_subjects]
-                })
-        
-        i += 1
-    
-    return students
+                yield seat_no, name, marks
 
+    for seat_no, name, marks, _ in open_students:
+        if len(marks) >= num_subjects:
+            yield seat_no, name, marks
 
-def calculate_percentages_single(students, total_marks_map):
-    """Calculate percentages for single PDF"""
-    total_maximum_marks = sum(total_marks_map.values())
-    results = []
-    
-    for student in students:
-        name = student['name']
-        marks = student['marks']
-        total_obtained = sum(marks)
-        percentage = (total_obtained / total_maximum_marks) * 100
-        
-        results.append({
-            'Name': name,
-            'Percentage': round(percentage, 2)
-        })
-    
-    return results, total_maximum_marks
+
+def parse_students(text, num_subjects):
+    """Parse students from PDF text"""
+    return [{
+        'seat_no': seat_no,
+        'name': name,
+        'normalized_name': normalize_name(name),
+        'marks': marks
+    } for seat_no, name, marks in scan_students(text, num_subjects)]
 
 
 def calculate_percentages_multiple(students, total_marks_map):
@@ -164,180 +157,240 @@ def calculate_percentages_multiple(students, total_marks_map):
         
         results[normalized_name] = {
             'original_name': original_name,
+            'seat_no': student['seat_no'],
             'percentage': round(percentage, 2)
         }
     
     return results
 
 
-def merge_results(sem1_data, sem2_data):
-    """Merge SEM1 and SEM2 results with space-agnostic matching"""
-    all_normalized_names = set(sem1_data.keys()) | set(sem2_data.keys())
-    
+def merge_results(*semester_data):
+    """
+    Merge any number of semesters' results.
+    Each semester's students are joined to the students seen so far on seat number and
+    identical name first, then on normalized name, then on seat number alone when the
+    names are at least FUZZY_MATCH_THRESHOLD similar, and the rest through an n-gram
+    index of the unmatched names. Match Confidence is the lowest name similarity over a
+    student's matches (1.0 for exact matches), or None for students found in one semester only.
+    The display name comes from the first semester a student appears in; the average
+    is only given for students present in every semester.
+    """
+    semester_count = len(semester_data)
+    merged = []
+    by_seat = {}
+    by_name = {}
+
+    def record(student, index, normalized_name, info, confidence):
+        student['percentages'][index] = info['percentage']
+        if info.get('seat_no'):
+            by_seat[info['seat_no']] = student
+        by_name.setdefault(normalized_name, student)
+        if confidence is not None:
+            previous = student['confidence']
+            student['confidence'] = confidence if previous is None else min(previous, confidence)
+
+    def open_seat_match(index, info):
+        student = by_seat.get(info.get('seat_no'))
+        if student is not None and student['percentages'][index] is None:
+            return student
+        return None
+
+    for index, data in enumerate(semester_data):
+        # Hash joins, strongest first: each pass only sees the records the earlier ones left
+        pending = []
+        for normalized_name, info in data.items():
+            student = open_seat_match(index, info)
+            if student is not None and student['normalized_name'] == normalized_name:
+                record(student, index, normalized_name, info, 1.0)
+            else:
+                pending.append((normalized_name, info))
+
+        remaining = []
+        for normalized_name, info in pending:
+            student = by_name.get(normalized_name)
+            if student is not None and student['percentages'][index] is None:
+                record(student, index, normalized_name, info, 1.0)
+            else:
+                remaining.append((normalized_name, info))
+
+        unmatched = []
+        for normalized_name, info in remaining:
+            student = open_seat_match(index, info)
+            if student is not None:
+                similarity = name_similarity(student['normalized_name'], normalized_name)
+                if similarity >= FUZZY_MATCH_THRESHOLD:
+                    record(student, index, normalized_name, info, round(similarity, 2))
+                    continue
+            unmatched.append((normalized_name, info))
+
+        # Fuzzy fallback over the students still missing this semester
+        if unmatched:
+            index_of_missing = NameIndex()
+            for student in merged:
+                if student['percentages'][index] is None:
+                    index_of_missing.add(student['normalized_name'], student)
+
+            pairs = []
+            for position, (normalized_name, info) in enumerate(unmatched):
+                for similarity, student in index_of_missing.candidates(normalized_name):
+                    if similarity >= FUZZY_MATCH_THRESHOLD:
+                        pairs.append((similarity, position, student))
+
+            # Best pairs first, each student and each record used at most once
+            matched = set()
+            for similarity, position, student in sorted(pairs, key=lambda pair: (-pair[0], pair[1])):
+                if position in matched or student['percentages'][index] is not None:
+                    continue
+                normalized_name, info = unmatched[position]
+                record(student, index, normalized_name, info, round(similarity, 2))
+                matched.add(position)
+
+            for position, (normalized_name, info) in enumerate(unmatched):
+                if position not in matched:
+                    student = {
+                        'name': info['original_name'],
+                        'normalized_name': normalized_name,
+                        'percentages': [None] * semester_count,
+                        'confidence': None
+                    }
+                    merged.append(student)
+                    record(student, index, normalized_name, info, None)
+
     results = []
-    
-    for normalized_name in sorted(all_normalized_names):
-        sem1_info = sem1_data.get(normalized_name)
-        sem2_info = sem2_data.get(normalized_name)
-        
-        if sem1_info:
-            display_name = sem1_info['original_name']
-            sem1_percent = sem1_info['percentage']
-        else:
-            display_name = sem2_info['original_name'] if sem2_info else normalized_name
-            sem1_percent = None
-        
-        sem2_percent = sem2_info['percentage'] if sem2_info else None
-        
-        if sem1_percent is not None and sem2_percent is not None:
-            average = round((sem1_percent + sem2_percent) / 2, 2)
+
+    for student in sorted(merged, key=lambda student: student['normalized_name']):
+        percentages = student['percentages']
+
+        result = {'Name': student['name']}
+        for index, percentage in enumerate(percentages, 1):
+            result[f'Percentage Sem{index}'] = percentage
+
+        if None not in percentages:
+            result['Average'] = round(sum(percentages) / semester_count, 2)
         else:
-            average = None
-        
-        results.append({
-            'Name': display_name,
-            'Percentage Sem1': sem1_percent,
-            'Percentage Sem2': sem2_percent,
-            'Average': average
-        })
-    
+            result['Average'] = None
+
+        result['Match Confidence'] = student['confidence']
+        results.append(result)
+
     return results
 
 
-def analyze_single_pdf(file):
+def write_percentage_workbook(results, total_marks_map, excel_path):
+    """Percentages on a Results sheet, with the register's subjects on a Subject Structure sheet"""
+    df = pd.DataFrame(results)
+    try:
+        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+            df.to_excel(writer, sheet_name='Results', index=False)
+            subject_df = pd.DataFrame([
+                {'Subject Code': code, 'Maximum Marks': marks} 
+                for code, marks in total_marks_map.items()
+            ])
+            subject_df.to_excel(writer, sheet_name='Subject Structure', index=False)
+    except Exception as e:
+        raise ValueError(f"Excel generation error: {e}")
+
+def write_merged_workbook(merged_results, excel_path):
+    df = pd.DataFrame(merged_results)
+    try:
+        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+            df.to_excel(writer, sheet_name='Merged Results', index=False)
+    except Exception as e:
+        raise ValueError(f"Excel generation error: {e}")
+
+
+def parse_semester(task):
+    """
+    Extract and parse one semester's PDF; runs in a pool worker.
+    task is (label, pdf) where pdf is a file path or the PDF's bytes.
+    """
+    label, pdf = task
+    if isinstance(pdf, bytes):
+        pdf = PdfSource(buffer=pdf)
+
+    # Already in a pool worker, so the pages are not sharded over another pool
+    text = extract_text_from_pdf(pdf, workers=1)
+    if "error" in text.lower():
+        raise ValueError(f"{label} PDF extraction error: {text}")
+
+    marks_map = parse_subject_structure(text)
+    if not marks_map:
+        raise ValueError(f"Could not parse subjects from {label} PDF.")
+
+    students = parse_students(text, len(marks_map))
+    if not students:
+        raise ValueError(f"No student data found in {label} PDF.")
+
+    return calculate_percentages_multiple(students, marks_map)
+
+
+def analyze_semester_pdfs(files, formats=None):
         """
-        Analyze a single PDF.
-        Returns: results, json_url, excel_url
+        Analyze N semester PDFs, given in semester order.
+        Semesters are parsed concurrently, then merged in a single pass.
+        Returns: results and the {format: url} artifacts
         """
-        # Step 1: Save uploaded PDF
+        formats = tuple(formats or exports.DEFAULT_FORMATS)
+
+        # Identical uploads are answered from the result cache
+        cache_key = result_cache.make_key(
+            "get-multiple-pdf-percentage-analysis-data", PARSER_VERSION, ",".join(formats),
+            *(result_cache.upload_sha256(file) for file in files)
+        )
+        cached = result_cache.lookup(cache_key)
+        if cached:
+            return result_cache.load_results(cached), cached["files"]
+
+        # Step 1: Keep copies of the uploaded PDFs only if configured to
         upload_dir_name = "uploads"
         upload_dir = os.path.join(settings.MEDIA_ROOT, upload_dir_name)
         os.makedirs(upload_dir, exist_ok=True)
 
         file_id = uuid4()
-        pdf_path = os.path.join(upload_dir, f"{file_id}.pdf")
-        with open(pdf_path, "wb") as f:
-            for chunk in file.chunks():
-                f.write(chunk)
-
-        # Step 2: Extract text
-        extracted_text = extract_text_from_pdf(pdf_path)
-        if "error" in extracted_text.lower():
-            raise ValueError(f"PDF extraction error: {extracted_text}")
-
-        # Step 3: Parse subjects
-        total_marks_map = parse_subject_structure(extracted_text)
-        if not total_marks_map:
-            raise ValueError("Could not parse subjects from PDF.")
-
-        num_subjects = len(total_marks_map)
-
-        # Step 4: Parse students
-        students = parse_students(extracted_text, num_subjects)
-        if not students:
-            raise ValueError("No student data found in PDF.")
-
-        # Step 5: Calculate percentages
-        results, _ = calculate_percentages_single(students, total_marks_map)
-
-        # Step 6: Save Excel
-        excel_path = os.path.join(upload_dir, f"{file_id}.xlsx")
-        df = pd.DataFrame(results)
-        try:
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Results', index=False)
-                subject_df = pd.DataFrame([
-                    {'Subject Code': code, 'Maximum Marks': marks} 
-                    for code, marks in total_marks_map.items()
-                ])
-                subject_df.to_excel(writer, sheet_name='Subject Structure', index=False)
-        except Exception as e:
-            raise ValueError(f"Excel generation error: {e}")
-
-        # Step 7: Save JSON
-        json_path = os.path.join(upload_dir, f"{file_id}.json")
-        with open(json_path, "w", encoding="utf-8") as jf:
-            json.dump(results, jf, indent=2)
-
-        # Step 8: Return URLs
-        json_url = os.path.join(settings.MEDIA_URL, upload_dir_name, f"{file_id}.json").replace("\\", "/")
-        excel_url = os.path.join(settings.MEDIA_URL, upload_dir_name, f"{file_id}.xlsx").replace("\\", "/")
-
-        return results, json_url, excel_url
-
-def analyze_multiple_pdfs(sem1_file, sem2_file):
+        pdf_paths = [
+            retain_upload(file, os.path.join(upload_dir, f"{file_id}_sem{index}.pdf"))
+            for index, file in enumerate(files, 1)
+        ]
+
+        # Step 2: Parse every semester in the worker pool; file-backed uploads are
+        # reopened by path, in-memory ones are sent as bytes
+        tasks = []
+        for index, file in enumerate(files, 1):
+            path = upload_path(file)
+            if path is None:
+                file.seek(0)
+            tasks.append((f"SEM{index}", path or file.read()))
+        semester_data = list(map_tasks(parse_semester, tasks))
+
+        # Step 3: Merge results
+        merged_results = merge_results(*semester_data)
+
+        # Steps 4 and 5: Save the requested artifacts; the rest are built on first download
+        file_stem = f"{file_id}_merged"
+        written_now, _ = exports.plan(formats)
+        paths = exports.write_exports(
+            file_stem, written_now, merged_results,
+            table=lambda: pd.DataFrame(merged_results),
+            write_excel=lambda path: write_merged_workbook(merged_results, path)
+        )
+        exports.write_manifest(file_stem, "merged", paths)
+
+        # Step 6: Return URLs
+        files_by_format = exports.store_artifacts(cache_key, file_stem, formats, paths, pdf_paths)
+        fields = exports.artifact_fields(files_by_format)
+
+        result_store.save_percentages(str(file_id), [[
+            {'seat_no': info['seat_no'], 'name': info['original_name'],
+             'normalized_name': normalized_name, 'percentage': info['percentage']}
+            for normalized_name, info in data.items()
+        ] for data in semester_data], ", ".join(file.name for file in files), fields["json_file"] or "", fields["excel_file"] or "")
+
+        return merged_results, files_by_format
+
+
+def analyze_multiple_pdfs(sem1_file, sem2_file, formats=None):
         """
         Analyze multiple PDFs (SEM1 and SEM2).
-        Returns: results, json_url, excel_url
+        Returns: results and the {format: url} artifacts
         """
-        # Step 1: Save uploaded PDFs
-        upload_dir_name = "uploads"
-        upload_dir = os.path.join(settings.MEDIA_ROOT, upload_dir_name)
-        os.makedirs(upload_dir, exist_ok=True)
-
-        file_id = uuid4()
-        
-        # Save SEM1
-        sem1_pdf_path = os.path.join(upload_dir, f"{file_id}_sem1.pdf")
-        with open(sem1_pdf_path, "wb") as f:
-            for chunk in sem1_file.chunks():
-                f.write(chunk)
-        
-        # Save SEM2
-        sem2_pdf_path = os.path.join(upload_dir, f"{file_id}_sem2.pdf")
-        with open(sem2_pdf_path, "wb") as f:
-            for chunk in sem2_file.chunks():
-                f.write(chunk)
-
-        # Step 2: Process SEM1
-        sem1_text = extract_text_from_pdf(sem1_pdf_path)
-        if "error" in sem1_text.lower():
-            raise ValueError(f"SEM1 PDF extraction error: {sem1_text}")
-
-        sem1_marks_map = parse_subject_structure(sem1_text)
-        if not sem1_marks_map:
-            raise ValueError("Could not parse subjects from SEM1 PDF.")
-
-        sem1_students = parse_students(sem1_text, len(sem1_marks_map))
-        if not sem1_students:
-            raise ValueError("No student data found in SEM1 PDF.")
-
-        sem1_data = calculate_percentages_multiple(sem1_students, sem1_marks_map)
-
-        # Step 3: Process SEM2
-        sem2_text = extract_text_from_pdf(sem2_pdf_path)
-        if "error" in sem2_text.lower():
-            raise ValueError(f"SEM2 PDF extraction error: {sem2_text}")
-
-        sem2_marks_map = parse_subject_structure(sem2_text)
-        if not sem2_marks_map:
-            raise ValueError("Could not parse subjects from SEM2 PDF.")
-
-        sem2_students = parse_students(sem2_text, len(sem2_marks_map))
-        if not sem2_students:
-            raise ValueError("No student data found in SEM2 PDF.")
-
-        sem2_data = calculate_percentages_multiple(sem2_students, sem2_marks_map)
-
-        # Step 4: Merge results
-        merged_results = merge_results(sem1_data, sem2_data)
-
-        # Step 5: Save Excel
-        excel_path = os.path.join(upload_dir, f"{file_id}_merged.xlsx")
-        df = pd.DataFrame(merged_results)
-        try:
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Merged Results', index=False)
-        except Exception as e:
-            raise ValueError(f"Excel generation error: {e}")
-
-        # Step 6: Save JSON
-        json_path = os.path.join(upload_dir, f"{file_id}_merged.json")
-        with open(json_path, "w", encoding="utf-8") as jf:
-            json.dump(merged_results, jf, indent=2)
-
-        # Step 7: Return URLs
-        json_url = os.path.join(settings.MEDIA_URL, upload_dir_name, f"{file_id}_merged.json").replace("\\", "/")
-        excel_url = os.path.join(settings.MEDIA_URL, upload_dir_name, f"{file_id}_merged.xlsx").replace("\\", "/")
-
-        return merged_results, json_url, excel_url
+        return analyze_semester_pdfs([sem1_file, sem2_file], formats)
@@ -1,104 +1,108 @@
-import fitz
 import re
 import json
 import os
+import tempfile
+from contextlib import nullcontext
+from itertools import chain, islice
 import pandas as pd
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, Side
 from django.conf import settings
 from uuid import uuid4
-import PyPDF2
+from .pdf_text import extract_page_texts, iter_page_texts, open_upload, retain_upload
+from . import exports, result_cache
+from .PDFPercentageAnalyzer import PARSER_VERSION, normalize_name, scan_student_lines, scan_students, write_percentage_workbook
+from . import result_store
+from .grading import compile_grading_scheme, find_grading_lines
+from .register_results import RegisterResults
+
+# The subject table of a percentage register lies within this many characters of its header
+SUBJECT_SECTION_CHARS = 5000
+_UNIVERSITY_RE = re.compile(r'University\s+of\s+Mumbai', re.IGNORECASE)
 
 # --- your parsing helpers (same as before) ---
 def parse_grading_system(text):
-    ranges = []
-    marks_line = None
-    grade_line = None
-
-    for line in text.splitlines():
-        if line.strip().startswith("MARKS"):
-            marks_line = line
-        elif line.strip().startswith("GRADE") and not line.strip().startswith("GRADE POINT"):
-            grade_line = line
-
-    if not marks_line or not grade_line:
-        return []
-
-    marks_ranges = re.findall(r"(\d+\.?\d*)\s*to\s*(\d+\.?\d*)", marks_line)
-    grades = grade_line.split(":")[1].split()
-
-    for (low, high), grade in zip(marks_ranges, grades):
-        ranges.append((float(low), float(high), grade))
-
-    return ranges
+    """Compiled grading scheme from the register's MARKS/GRADE lines"""
+    return compile_grading_scheme(*find_grading_lines(text))
 
 def get_grade(total, grading_rules):
-    for low, high, grade in grading_rules:
-        if low <= total <= high:
-            return grade
-    return None
+    return grading_rules.grade(total)
 
-def extract_paper_mapping(doc):
+def extract_paper_mapping(page_texts):
     mapping = {}
     pattern = re.compile(r"([A-Z0-9]{3,})\s*[-–]\s*([A-Za-z0-9\s\(\)/&\.\-]+?)(?::|\n|$)")
     
-    for page_num in range(min(5, len(doc))):
-        page_text = doc[page_num].get_text()
+    for page_text in page_texts[:5]:
         for code, name in pattern.findall(page_text):
             mapping[code.strip()] = name.strip()
     
     return mapping
 
-def parse_student_block(block, grading_rules, paper_names):
-    lines = [l.strip() for l in block.split("\n") if l.strip()]
-    if not lines:
-        return None
+# Compiled once; parse_student_block runs for every block of every register
+_STUDENT_HEADER_RE = re.compile(r"(\d{7})\s+([A-Z\s/]+?)\s+\|(.+?)\|\s*(Successful|Unsuccessful)")
+_PAPER_CODE_RE = re.compile(r'\|([A-Z0-9]{3,})\s')
+_PAPER_CODE_LINE_RE = re.compile(r'\(\d+\)\w+|\|\s*[A-Z0-9]{3,}\s')
+# Last run of digits in each "|" separated cell
+_CELL_TOTAL_RE = re.compile(r'\|[^|]*?(\d+)[^|\d]*(?=\||$)')
+_SGPI_RE = re.compile(r"\b(\d+\.\d+)\b\s+--")
+_STUDENT_SPLIT_RE = re.compile(r"(?=\n\s*\d{7}\s)")
 
-    header_line = lines[0]
-    m = re.match(r"(\d{7})\s+([A-Z\s/]+?)\s+\|(.+?)\|\s*(Successful|Unsuccessful)", header_line)
+def tokenize_student_block(block):
+    """
+    Walk a student block once.
+    Returns (seat_no, name, result, [(paper_code, total), ...], sgpi) or None for non-student blocks.
+    """
+    # The header is the first non-blank line; reject other blocks before splitting them
+    head = block.lstrip()
+    header_line = head.split("\n", 1)[0].strip()
+    m = _STUDENT_HEADER_RE.match(header_line)
     if not m:
         return None
 
-    seat_no = m.group(1).strip()
-    name = m.group(2).strip()
-    result = m.group(4).strip()
+    lines = [line for line in (l.strip() for l in head.split("\n")) if line]
 
-    codes1 = re.findall(r'\|([A-Z0-9]{3,})\s', header_line)
-
-    totals1 = []
+    paper_totals = []
+    codes = _PAPER_CODE_RE.findall(header_line)
     if len(lines) > 1:
-        totals1 = [int(nums[-1]) for nums in [re.findall(r'\d+', seg) for seg in lines[1].split("|")[1:]] if nums]
+        paper_totals.extend(zip(codes, map(int, _CELL_TOTAL_RE.findall(lines[1]))))
 
-    codes2, totals2 = [], []
     for i, line in enumerate(lines):
-        if re.search(r"\(\d+\)\w+", line) or re.search(r'\|\s*[A-Z0-9]{3,}\s', line):
-            codes2 = re.findall(r'\|([A-Z0-9]{3,})\s', line)
+        if _PAPER_CODE_LINE_RE.search(line):
             if i + 1 < len(lines):
-                totals2 = [int(nums[-1]) for nums in [re.findall(r'\d+', seg) for seg in lines[i+1].split("|")[1:]] if nums]
+                codes = _PAPER_CODE_RE.findall(line)
+                paper_totals.extend(zip(codes, map(int, _CELL_TOTAL_RE.findall(lines[i + 1]))))
             break
 
-    papers = []
-    for c, t in zip(codes1, totals1):
-        papers.append({
-            "paper_code": c,
-            "paper_name": paper_names.get(c, "Unknown"),
-            "total": t,
-            "grade": get_grade(t, grading_rules)
-        })
-    for c, t in zip(codes2, totals2):
-        papers.append({
-            "paper_code": c,
-            "paper_name": paper_names.get(c, "Unknown"),
-            "total": t,
-            "grade": get_grade(t, grading_rules)
-        })
-
+    result = m.group(4)
     sgpi = None
-    if result.lower() == "successful":
+    if result == "Successful":
         for line in reversed(lines):
-            m = re.search(r"\b(\d+\.\d+)\b\s+--", line)
-            if m:
-                sgpi = m.group(1)
+            # Cheap substring test first; the SGPI pattern always needs a "--"
+            sgpi_match = "--" in line and _SGPI_RE.search(line)
+            if sgpi_match:
+                sgpi = sgpi_match.group(1)
                 break
 
+    return m.group(1), m.group(2).strip(), result, paper_totals, sgpi
+
+def parse_student_block(block, grading_rules, paper_names):
+    """
+    Parse one student block. With grading_rules=None grades are left as None,
+    for grading a whole register at once with grading.grade_students.
+    """
+    tokens = tokenize_student_block(block)
+    if tokens is None:
+        return None
+
+    seat_no, name, result, paper_totals, sgpi = tokens
+    papers = [{
+        "paper_code": code,
+        "paper_name": paper_names.get(code, "Unknown"),
+        "total": total,
+        "grade": None if grading_rules is None else grading_rules.grade(total)
+    } for code, total in paper_totals]
+
     return {
         "seat_no": seat_no,
         "name": name,
@@ -107,7 +111,211 @@ def parse_student_block(block, grading_rules, paper_names):
         "papers": papers
     }
 
-def extract_result(file=None):
+def iter_student_blocks(page_texts):
+    """
+    Yield the same blocks as splitting the "\\n"-joined pages, one page at a time.
+    The last block of each page is carried over, so blocks crossing a page boundary stay intact.
+    """
+    pending = None
+    for page_text in page_texts:
+        text = page_text if pending is None else pending + "\n" + page_text
+        blocks = _STUDENT_SPLIT_RE.split(text)
+        # A carried-over block starts at a split point, which re-splitting turns into a leading ""
+        if pending and not blocks[0]:
+            del blocks[0]
+        pending = blocks.pop()
+        yield from blocks
+    if pending is not None:
+        yield pending
+
+def iter_results(page_texts):
+    """
+    Yield parsed students from an iterable of page texts.
+    Paper names come from the first five pages and the grading table from the first
+    of those that carries one, so only those pages are held before students are emitted.
+    """
+    pages = iter(page_texts)
+    head_pages = list(islice(pages, 5))
+    paper_names = extract_paper_mapping(head_pages)
+    grading_rules = next((rules for rules in map(parse_grading_system, head_pages) if rules), compile_grading_scheme(None, None))
+
+    for block in iter_student_blocks(chain(head_pages, pages)):
+        student_data = parse_student_block(block, grading_rules, paper_names)
+        if student_data:
+            yield student_data
+
+def student_row(student_data):
+    """Flatten a student record into a workbook row"""
+    row = [student_data["seat_no"], student_data["name"], student_data["result"], student_data["sgpi"]]
+    for paper in student_data["papers"]:
+        row.extend([paper["paper_code"], paper["paper_name"], paper["total"], paper["grade"]])
+    return row
+
+def result_header(paper_count):
+    header = ["Seat No", "Name", "Result", "SGPI"]
+    for i in range(1, paper_count + 1):
+        header.extend([f"Paper {i} Code", f"Paper {i} Name", f"Paper {i} Marks", f"Paper {i} Grade"])
+    return header
+
+def write_result_sheet(workbook, title, rows, header):
+    """Append a sheet of result rows to a write-only workbook; the header is only written if there are rows"""
+    sheet = workbook.create_sheet(title)
+
+    thin = Side(style="thin")
+    header_cells = []
+    for value in header:
+        cell = WriteOnlyCell(sheet, value=value)
+        cell.font = Font(bold=True)
+        cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+        cell.alignment = Alignment(horizontal="center", vertical="top")
+        header_cells.append(cell)
+
+    has_rows = False
+    for row in rows:
+        if not has_rows:
+            sheet.append(header_cells)
+            has_rows = True
+        sheet.append(row)
+
+def write_result_workbook(rows, excel_path, paper_count):
+    """Write result rows in openpyxl write-only mode, laid out like DataFrame.to_excel"""
+    workbook = openpyxl.Workbook(write_only=True)
+    write_result_sheet(workbook, "Sheet1", rows, result_header(paper_count))
+    workbook.save(excel_path)
+
+def stream_result(pdf, json_path=None, excel_path=None, compact=False):
+    """
+    Yield each student as soon as it is parsed, reading pages lazily.
+    The JSON file is written record by record. Excel rows are spooled to a temporary
+    file as they arrive and streamed into the workbook once the paper count is known.
+    Either artifact is skipped when its path is None.
+    """
+    with (open(json_path, "w", encoding="utf-8") if json_path else nullcontext()) as json_file, \
+            (tempfile.TemporaryFile("w+", encoding="utf-8") if excel_path else nullcontext()) as row_spool:
+        students = iter_results(iter_page_texts(pdf))
+        if json_file:
+            students = exports.tee_json_array(json_file, students, compact, ensure_ascii=False)
+        paper_count = 0
+
+        for student_data in students:
+            if row_spool:
+                row_spool.write(json.dumps(student_row(student_data), ensure_ascii=False) + "\n")
+            paper_count = max(paper_count, len(student_data["papers"]))
+            yield student_data
+
+        if row_spool:
+            row_spool.seek(0)
+            write_result_workbook(map(json.loads, row_spool), excel_path, paper_count)
+
+class RecordSpool:
+    """
+    Records spooled to a temporary file as JSON lines, so a stream of students can be read
+    back (one reader at a time) without holding them in memory.
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile("w+", encoding="utf-8")
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._file.close()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, record):
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._count += 1
+
+    def __iter__(self):
+        self._file.flush()
+        self._file.seek(0)
+        for line in self._file:
+            yield json.loads(line)
+
+def result_table(results):
+    """The register as a flat DataFrame, one workbook row per student"""
+    paper_count = max((len(student_data["papers"]) for student_data in results), default=0)
+    return rows_table(map(student_row, results), paper_count)
+
+def rows_table(rows, paper_count):
+    """Flat workbook rows as a DataFrame"""
+    return pd.DataFrame(list(rows), columns=result_header(paper_count))
+
+def parse_register(full_text, paper_names, grading_scheme):
+    """Parse a whole register's text into a graded, column-wise RegisterResults"""
+    register = RegisterResults(paper_names)
+    for block in _STUDENT_SPLIT_RE.split(full_text):
+        tokens = tokenize_student_block(block)
+        if tokens:
+            register.append(*tokens)
+
+    # Grade every paper of the register in one vectorized pass
+    register.grade(grading_scheme)
+    return register
+
+def parse_register_pages(page_texts):
+    """Parse a whole register from its page texts"""
+    paper_names = extract_paper_mapping(page_texts)
+
+    # Pages are joined before splitting, so blocks that cross a page boundary stay intact
+    full_text = "\n".join(page_texts)
+    return parse_register(full_text, paper_names, parse_grading_system(full_text))
+
+def _extract_result_in_memory(pdf, file_stem, formats):
+    """Parse the whole register at once, then write the requested artifacts; returns the RegisterResults and {format: path}"""
+    register = parse_register_pages(extract_page_texts(pdf))
+
+    # Every artifact is written straight from the register columns, a student at a time
+    paths = exports.write_exports(
+        file_stem, formats, None,
+        records=register.iter_records,
+        table=lambda: rows_table(register.iter_rows(), register.paper_count),
+        write_excel=lambda path: write_result_workbook(register.iter_rows(), path, register.paper_count),
+        ensure_ascii=False
+    )
+    return register, paths
+
+def _cached_events(cached, results_key="student"):
+    """Replay a cache hit as events"""
+    analysis_id = cached["analysis_id"]
+    yield {"type": "header", "analysis_id": analysis_id, "cached": True}
+    results = result_cache.load_results(cached)
+    for record in results:
+        yield {"type": results_key, results_key: record}
+    yield {"type": "trailer", "count": len(results), "analysis_id": analysis_id, **exports.artifact_fields(cached["files"])}
+
+def _collect(events, results_key):
+    """Run an event generator to the end; returns results, the {format: url} artifacts and the analysis id"""
+    results = []
+    for event in events:
+        if event["type"] == results_key:
+            results.append(event[results_key])
+        elif event["type"] == "trailer":
+            return results, event["files"], event["analysis_id"]
+
+def iter_extract_result(file, streaming=None, formats=None):
+    """
+    get-analysis-data as a sequence of events: a header with the analysis id, one
+    "student" event per student, then a trailer with the analysis id and artifact URLs.
+    In streaming mode students are yielded as soon as they are parsed.
+    Only the requested export formats (json and xlsx by default) are written.
+    """
+    if streaming is None:
+        streaming = getattr(settings, "ANALYSIS_STREAMING", False)
+    formats = tuple(formats or exports.DEFAULT_FORMATS)
+
+    # Identical uploads are answered from the result cache
+    cache_key = result_cache.make_key("get-analysis-data", PARSER_VERSION, ",".join(formats), result_cache.upload_sha256(file))
+    cached = result_cache.lookup(cache_key)
+    if cached:
+        yield from _cached_events(cached)
+        return
+
     # The directory where files will be saved, inside your MEDIA_ROOT
     upload_dir_name = "uploads"
     upload_dir = os.path.join(settings.MEDIA_ROOT, upload_dir_name)
@@ -115,135 +323,153 @@ def extract_result(file=None):
     
     # Generate a unique filename
     file_id = uuid4()
-    
-    # Save the uploaded PDF
-    pdf_path = os.path.join(upload_dir, f"{file_id}.pdf")
-    with open(pdf_path, "wb") as f:
-        for chunk in file.chunks():
-            f.write(chunk)
-
-    # Define filesystem paths for output files
-    json_path = os.path.join(upload_dir, f"{file_id}.json")
-    excel_path = os.path.join(upload_dir, f"{file_id}.xlsx")
-    
-    # Extract results
-    with fitz.open(pdf_path) as doc:
-        paper_names = extract_paper_mapping(doc)
-        full_text = "\n".join(page.get_text() for page in doc)
-        grading_rules = parse_grading_system(full_text)
-
-    blocks = re.split(r"(?=\n\s*\d{7}\s)", full_text)
-    results, rows = [], []
+    yield {"type": "header", "analysis_id": str(file_id), "cached": False}
+
+    # Formats not written now are built by the artifact view on first download
+    written_now, _ = exports.plan(formats)
+
+    # In streaming mode students are spooled to disk for the tables and the database, not kept in memory
+    with (RecordSpool() if streaming else nullcontext()) as spool:
+        # The upload is parsed in place; a copy is only kept when RETAIN_UPLOADED_PDFS is set
+        with open_upload(file) as pdf:
+            if streaming:
+                # JSON and Excel are written as students arrive, tables once they are all parsed
+                paths = {name: exports.export_path(file_id, name) for name in written_now if name not in exports.TABLE_FORMATS}
+                results = spool
+                sgpis = []
+                for student_data in stream_result(pdf, exports.json_path(paths), paths.get("xlsx"), "json-compact" in paths):
+                    spool.append(student_data)
+                    sgpis.append(student_data["sgpi"])
+                    yield {"type": "student", "student": student_data}
+                paths.update(exports.write_exports(
+                    file_id, [name for name in written_now if name in exports.TABLE_FORMATS], None,
+                    table=lambda: result_table(spool)
+                ))
+            else:
+                # Student dicts are built from the register columns as they are sent or stored, never all at once
+                results, paths = _extract_result_in_memory(pdf, file_id, written_now)
+                sgpis = [student.sgpi for student in results.students]
+                for student_data in results.iter_records():
+                    yield {"type": "student", "student": student_data}
+        pdf_path = retain_upload(file, os.path.join(upload_dir, f"{file_id}.pdf"))
+
+        exports.write_manifest(file_id, "register", paths)
+        files = exports.store_artifacts(cache_key, file_id, formats, paths, [pdf_path], analysis_id=str(file_id))
+        fields = exports.artifact_fields(files)
+
+        result_store.save_register(str(file_id), results, file.name, fields["json_file"] or "", fields["excel_file"] or "", sgpis=sgpis)
+
+    yield {"type": "trailer", "count": len(results), "analysis_id": str(file_id), **fields}
+
+def extract_result(file=None, formats=None):
+    return _collect(iter_extract_result(file, formats=formats), "student")
+
+def _percentage_pages(pdf):
+    """Page texts of a percentage register, with extraction failures raised as ValueError"""
+    try:
+        yield from iter_page_texts(pdf)
+    except Exception as e:
+        raise ValueError(f"PDF extraction error: An error occurred: {e}")
 
-    for block in blocks:
-        student_data = parse_student_block(block, grading_rules, paper_names)
-        if student_data:
-            results.append(student_data)
-            
-            row = {
-                "Seat No": student_data["seat_no"],
-                "Name": student_data["name"],
-                "Result": student_data["result"],
-                "SGPI": student_data["sgpi"]
-            }
-            for i, paper in enumerate(student_data["papers"], start=1):
-                row[f"Paper {i} Code"] = paper["paper_code"]
-                row[f"Paper {i} Name"] = paper["paper_name"]
-                row[f"Paper {i} Marks"] = paper["total"]
-                row[f"Paper {i} Grade"] = paper["grade"]
-            rows.append(row)
-
-    # Save JSON
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
-
-    # Save Excel
-    df = pd.DataFrame(rows)
-    df.to_excel(excel_path, index=False)
-
-    json_url = os.path.join(settings.MEDIA_URL, upload_dir_name, f"{file_id}.json").replace("\\", "/")
-    excel_url = os.path.join(settings.MEDIA_URL, upload_dir_name, f"{file_id}.xlsx").replace("\\", "/")
-
-    return results, json_url, excel_url
-
-def analyze_pdf_percentage(file):
+def _read_subject_head(pages):
     """
-    Main function for API.
-    Accepts Django UploadedFile.
-    Returns results, json_url, excel_url.
+    Read pages until the subject table is complete: SUBJECT_SECTION_CHARS past the first
+    "University of Mumbai", or the whole document when it has none.
+    Returns the text read and where scan_students starts in it; the rest stays in pages.
+    """
+    head = ""
+    for page_text in pages:
+        head += page_text
+        match = _UNIVERSITY_RE.search(head)
+        if match and len(head) >= match.start() + SUBJECT_SECTION_CHARS:
+            return head, match.start()
+    match = _UNIVERSITY_RE.search(head)
+    return head, match.start() if match else 0
+
+def iter_lines(chunks):
+    """The lines of the chunks joined together, as str.split("\\n") gives them"""
+    tail = ""
+    for chunk in chunks:
+        lines = (tail + chunk).split("\n")
+        tail = lines.pop()
+        yield from lines
+    yield tail
+
+def iter_pdf_percentage(file, formats=None):
     """
-    # Step 1: Save uploaded PDF
+    Single PDF percentage analysis as a sequence of events: a header, one "result"
+    event per student as soon as it is scanned, then a trailer with the analysis id and artifact URLs.
+    """
+    formats = tuple(formats or exports.DEFAULT_FORMATS)
+
+    # Identical uploads are answered from the result cache
+    cache_key = result_cache.make_key("get-single-pdf-percentage-analysis-data", PARSER_VERSION, ",".join(formats), result_cache.upload_sha256(file))
+    cached = result_cache.lookup(cache_key)
+    if cached:
+        yield from _cached_events(cached, "result")
+        return
+
+    # Step 1: Open the uploaded PDF in place, keeping a copy only if configured to
     upload_dir_name = "uploads"
     upload_dir = os.path.join(settings.MEDIA_ROOT, upload_dir_name)
     os.makedirs(upload_dir, exist_ok=True)
 
     file_id = uuid4()
-    pdf_path = os.path.join(upload_dir, f"{file_id}.pdf")
-    with open(pdf_path, "wb") as f:
-        for chunk in file.chunks():
-            f.write(chunk)
-
-    # Step 2: Extract text
-    extracted_text = extract_text_from_pdf(pdf_path)
-    if "error" in extracted_text.lower():
-        raise ValueError(f"PDF extraction error: {extracted_text}")
-
-    # Step 3: Parse subjects
-    total_marks_map = parse_subject_structure(extracted_text)
-    if not total_marks_map:
-        raise ValueError("Could not parse subjects from PDF.")
-
-    num_subjects = len(total_marks_map)
-
-    # Step 4: Parse students
-    students = parse_students(extracted_text, num_subjects)
+    yield {"type": "header", "analysis_id": str(file_id), "cached": False}
+    pdf_path = retain_upload(file, os.path.join(upload_dir, f"{file_id}.pdf"))
+
+    # Step 2: Extract text lazily, holding only the pages that carry the subject table
+    with open_upload(file) as pdf:
+        pages = _percentage_pages(pdf)
+        head, start = _read_subject_head(pages)
+
+        # Step 3: Parse subjects
+        total_marks_map = parse_subject_structure(head)
+        if not total_marks_map:
+            raise ValueError("Could not parse subjects from PDF.")
+
+        num_subjects = len(total_marks_map)
+
+        # Steps 4 and 5: Parse students and calculate their percentages as they are found
+        students = []
+        results = []
+        for seat_no, name, marks in scan_student_lines(iter_lines(chain([head[start:]], pages)), num_subjects):
+            student = {'seat_no': seat_no, 'name': name, 'marks': marks}
+            result = calculate_percentages([student], total_marks_map)[0][0]
+            students.append(student)
+            results.append(result)
+            yield {"type": "result", "result": result}
     if not students:
         raise ValueError("No student data found in PDF.")
 
-    # Step 5: Calculate percentages
-    results, _ = calculate_percentages(students, total_marks_map)
-
-    # Step 6: Save Excel
-    excel_path = os.path.join(upload_dir, f"{file_id}.xlsx")
-    df = pd.DataFrame(results)
-    try:
-        with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-            df.to_excel(writer, sheet_name='Results', index=False)
-            subject_df = pd.DataFrame([
-                {'Subject Code': code, 'Maximum Marks': marks} 
-                for code, marks in total_marks_map.items()
-            ])
-            subject_df.to_excel(writer, sheet_name='Subject Structure', index=False)
-    except Exception as e:
-        raise ValueError(f"Excel generation error: {e}")
-
-    # Step 7: Save JSON
-    json_path = os.path.join(upload_dir, f"{file_id}.json")
-    with open(json_path, "w", encoding="utf-8") as jf:
-        json.dump(results, jf, indent=2)
+    # Steps 6 and 7: Save the requested artifacts; the rest are built on first download
+    written_now, _ = exports.plan(formats)
+    paths = exports.write_exports(
+        file_id, written_now, results,
+        table=lambda: pd.DataFrame(results),
+        write_excel=lambda path: write_percentage_workbook(results, total_marks_map, path)
+    )
+    exports.write_manifest(file_id, "percentage", paths, {"subjects": total_marks_map})
 
     # Step 8: Return URLs
-    json_url = os.path.join(settings.MEDIA_URL, upload_dir_name, f"{file_id}.json").replace("\\", "/")
-    excel_url = os.path.join(settings.MEDIA_URL, upload_dir_name, f"{file_id}.xlsx").replace("\\", "/")
+    files = exports.store_artifacts(cache_key, file_id, formats, paths, [pdf_path], analysis_id=str(file_id))
+    fields = exports.artifact_fields(files)
 
-    return results, json_url, excel_url
+    result_store.save_percentages(str(file_id), [[
+        {'seat_no': student['seat_no'], 'name': student['name'],
+         'normalized_name': normalize_name(student['name']), 'percentage': result['Percentage']}
+        for student, result in zip(students, results)
+    ]], file.name, fields["json_file"] or "", fields["excel_file"] or "")
 
-def extract_text_from_pdf(pdf_path):
-    """Extract text from PDF file"""
-    text = ""
-    try:
-        with open(pdf_path, 'rb') as pdf_file:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            num_pages = len(pdf_reader.pages)
-            
-            for page_num in range(num_pages):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text() or ""
-                   
-    except Exception as e:
-        return f"An error occurred: {e}"
-       
-    return text
+    yield {"type": "trailer", "count": len(results), "analysis_id": str(file_id), **fields}
+
+def analyze_pdf_percentage(file, formats=None):
+    """
+    Main function for API.
+    Accepts Django UploadedFile.
+    Returns results, the {format: url} artifacts and the analysis id.
+    """
+    return _collect(iter_pdf_percentage(file, formats), "result")
 
 def parse_subject_structure(text):
     """UNIVERSAL: Works for SEM1 (58651, FEC101) and SEM2 (FEC201, FEC201 TW)"""
@@ -261,7 +487,7 @@ def parse_subject_structure(text):
     else:
         start_pos = match.start()
     
-    subject_section = text[start_pos:start_pos + 5000]
+    subject_section = text[start_pos:start_pos + SUBJECT_SECTION_CHARS]
     
     total_marks_map = {}
     subject_order = []
@@ -278,63 +504,13 @@ def parse_subject_structure(text):
     
     return {code: total_marks_map[code] for code in subject_order}
 
-def extract_marks_from_cell(cell):
-    """Extract marks: handles AA, --, 7F, 10E, 23F"""
-    cell = cell.strip()
-    
-    match1 = re.match(r'^([A-Z0-9]+)\s+([A-Z0-9]+)\s+([A-Z0-9]+)$', cell)
-    if match1:
-        val3 = match1.group(3)
-        num = re.search(r'(\d+)', val3)
-        return int(num.group(1)) if num else 0
-    
-    match2 = re.match(r'^[‐\-–]+\s+([A-Z0-9]+)\s+([A-Z0-9]+)$', cell)
-    if match2:
-        val2 = match2.group(2)
-        num = re.search(r'(\d+)', val2)
-        return int(num.group(1)) if num else 0
-    
-    return None
-
 def parse_students(text, num_subjects):
     """Parse students"""
-    students = []
-    
-    match = re.search(r'University\s+of\s+Mumbai', text, re.IGNORECASE)
-    if match:
-        text = text[match.start():]
-    
-    lines = text.split('\n')
-    
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        student_match = re.search(r'(\d{7})\s+(/\s+)?([A-Z][A-Z\s]+?)\s+\|', line)
-        
-        if student_match:
-            seat_no = student_match.group(1)
-            name = student_match.group(3).strip()
-            
-            marks = []
-            for j in range(i, min(i + 20, len(lines))):
-                cells = lines[j].split('|')
-                for cell in cells:
-                    mark = extract_marks_from_cell(cell)
-                    if mark is not None and len(marks) < num_subjects:
-                        marks.append(mark)
-                if len(marks) >= num_subjects:
-                    break
-            
-            if len(marks) >= num_subjects:
-                students.append({
-                    'seat_no': seat_no,
-                    'name': name,
-                    'marks': marks[:num_subjects]
-                })
-        
-        i += 1
-    
-    return students
+    return [{
+        'seat_no': seat_no,
+        'name': name,
+        'marks': marks
+    } for seat_no, name, marks in scan_students(text, num_subjects)]
 
 def calculate_percentages(students, total_marks_map):
     """Calculate percentages - Returns only Name and Percentage"""
@@ -0,0 +1,83 @@
+import hashlib
+import json
+import os
+import re
+from uuid import uuid4
+import pandas as pd
+from . import exports, result_cache
+from .analysis_handler import result_table, student_row, write_result_workbook
+from .batch_handler import combined_table, write_batch_workbook
+from .PDFPercentageAnalyzer import write_merged_workbook, write_percentage_workbook
+
+# Artifact file stems: an analysis id, with the suffix of batch and merged analyses
+_FILE_STEM_RE = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}(_batch|_merged)?$")
+
+
+def _register_workbook(results, extra, path):
+    paper_count = max((len(student_data["papers"]) for student_data in results), default=0)
+    write_result_workbook(map(student_row, results), path, paper_count)
+
+# manifest kind -> (table(results, extra), write_excel(results, extra, path))
+ARTIFACT_KINDS = {
+    "register": (lambda results, extra: result_table(results), _register_workbook),
+    "batch": (lambda data, extra: combined_table(data["registers"]), lambda data, extra, path: write_batch_workbook(data, path)),
+    "percentage": (lambda results, extra: pd.DataFrame(results), lambda results, extra, path: write_percentage_workbook(results, extra["subjects"], path)),
+    "merged": (lambda results, extra: pd.DataFrame(results), lambda results, extra, path: write_merged_workbook(results, path)),
+}
+
+
+def artifact_version(file_stem, name):
+    """
+    The manifest of an analysis and the version of its artifact in format name, without building it.
+    Returns (manifest, etag, last modified timestamp); the version changes whenever the results JSON does.
+    Raises LookupError for unknown analyses and formats.
+    """
+    if not _FILE_STEM_RE.match(file_stem) or name not in exports.EXPORT_FORMATS:
+        raise LookupError("Artifact not found.")
+    try:
+        with open(exports.manifest_path(file_stem), encoding="utf-8") as f:
+            manifest = json.load(f)
+        stat = os.stat(exports.export_path(file_stem, manifest["results"]))
+    except FileNotFoundError:
+        raise LookupError("Artifact not found.")
+    # The results JSON is the artifact itself and only exists in its own layout
+    if name in exports.JSON_FORMATS and name != manifest["results"]:
+        raise LookupError("Artifact not found.")
+
+    etag = hashlib.sha256(f"{file_stem}:{name}:{stat.st_mtime_ns}:{stat.st_size}".encode()).hexdigest()[:32]
+    return manifest, etag, int(stat.st_mtime)
+
+def build_artifact(file_stem, name, manifest):
+    """
+    Path of the artifact in format name, built from the results JSON on first request and
+    rebuilt when it is older than the results (e.g. after a revaluation).
+    Raises ValueError if the format needs a dependency that is not installed.
+    """
+    results_path = exports.export_path(file_stem, manifest["results"])
+    path = exports.export_path(file_stem, name)
+    if name in exports.JSON_FORMATS:
+        return path
+    if os.path.exists(path) and os.stat(path).st_mtime_ns >= os.stat(results_path).st_mtime_ns:
+        return path
+
+    exports.check_dependencies([name])
+    with open(results_path, encoding="utf-8") as f:
+        data = json.load(f)
+    table, write_excel = ARTIFACT_KINDS[manifest["kind"]]
+
+    # Built under a temporary name (keeping the extension pandas checks), so concurrent
+    # downloads never see a partial file
+    root, extension = os.path.splitext(path)
+    tmp_path = f"{root}.{uuid4().hex}.tmp{extension}"
+    try:
+        if name == "xlsx":
+            write_excel(data, manifest["extra"], tmp_path)
+        else:
+            exports.write_table(table(data, manifest["extra"]), tmp_path, name)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    # Evicted with the cache entry of the upload it was built for
+    result_cache.adopt(results_path, path)
+    return path
@@ -0,0 +1,191 @@
+import os
+import re
+import tempfile
+import zipfile
+import openpyxl
+import pandas as pd
+from django.conf import settings
+from uuid import uuid4
+from .pdf_text import extract_page_texts
+from . import exports, result_cache, result_store
+from .worker_pool import map_tasks
+from .analysis_handler import PARSER_VERSION, parse_register_pages, result_header, student_row, write_result_sheet
+
+# Characters Excel does not allow in sheet titles
+_SHEET_TITLE_RE = re.compile(r"[\[\]:*?/\\]")
+COMBINED_SHEET = "Combined"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def _is_pdf(name):
+    base = os.path.basename(name)
+    return name.lower().endswith(".pdf") and not base.startswith(".") and not name.startswith("__MACOSX/")
+
+def _spool_batch(files, spool_dir):
+    """
+    Write every PDF in the uploads (plain PDFs, or PDFs inside ZIP archives) to spool_dir.
+    ZIPs are checked against BATCH_MAX_FILES and BATCH_MAX_BYTES before anything is extracted.
+    Returns [(display name, spooled path), ...] in upload order.
+    """
+    max_files = getattr(settings, "BATCH_MAX_FILES", 200)
+    max_bytes = getattr(settings, "BATCH_MAX_BYTES", 1024 * 1024 * 1024)
+    registers = []
+    spooled_bytes = 0
+
+    def check(file_count, size):
+        if len(registers) + file_count > max_files:
+            raise ValueError(f"A batch can contain at most {max_files} PDFs.")
+        if spooled_bytes + size > max_bytes:
+            raise ValueError(f"A batch can contain at most {max_bytes} bytes of PDFs.")
+
+    def spool(name, source):
+        nonlocal spooled_bytes
+        path = os.path.join(spool_dir, f"{len(registers)}.pdf")
+        with open(path, "wb") as f:
+            # Sizes in ZIP headers can lie, so the byte limit is also enforced while copying
+            while chunk := source.read(COPY_CHUNK_SIZE):
+                spooled_bytes += len(chunk)
+                check(0, 0)
+                f.write(chunk)
+        registers.append((name, path))
+
+    for uploaded_file in files:
+        if uploaded_file.name.lower().endswith(".zip") or zipfile.is_zipfile(uploaded_file):
+            uploaded_file.seek(0)
+            try:
+                archive = zipfile.ZipFile(uploaded_file)
+            except zipfile.BadZipFile:
+                raise ValueError(f"{uploaded_file.name} is not a valid ZIP file.")
+            with archive:
+                members = [member for member in archive.infolist() if not member.is_dir() and _is_pdf(member.filename)]
+                check(len(members), sum(member.file_size for member in members))
+                for member in members:
+                    with archive.open(member) as source:
+                        spool(member.filename, source)
+        elif _is_pdf(uploaded_file.name):
+            check(1, uploaded_file.size or 0)
+            uploaded_file.seek(0)
+            spool(uploaded_file.name, uploaded_file)
+
+    return registers
+
+def _analyze_register(task):
+    """Parse one spooled register; runs in a pool worker, so failures are returned, not raised"""
+    name, pdf_path = task
+    try:
+        # The batch pool already spreads work over the cores, so pages are read serially
+        register = parse_register_pages(extract_page_texts(pdf_path, workers=1))
+        return name, list(register.iter_records()), register.paper_count, None
+    except Exception as e:
+        # Report the file by its uploaded name, not its spool path
+        return name, [], 0, str(e).replace(pdf_path, name)
+
+def analyze_registers(registers):
+    """Parse spooled registers in parallel; yields (name, results, paper_count, error) in input order"""
+    return map_tasks(_analyze_register, registers)
+
+def _sheet_title(name, used):
+    """Excel-safe, unique sheet title of at most 31 characters"""
+    base = _SHEET_TITLE_RE.sub("_", os.path.splitext(os.path.basename(name))[0]).strip("'") or "Register"
+    title = base[:31]
+    suffix = 2
+    while title.lower() in used:
+        tail = f" ({suffix})"
+        title = base[:31 - len(tail)] + tail
+        suffix += 1
+    used.add(title.lower())
+    return title
+
+def _summarize(name, results, error, sheet):
+    if error is None and not results:
+        error = "No student records found."
+    return {
+        "file": name,
+        "success": error is None,
+        "sheet": sheet,
+        "students": len(results),
+        "successful": sum(1 for student in results if student["result"] == "Successful"),
+        "unsuccessful": sum(1 for student in results if student["result"] == "Unsuccessful"),
+        "message": error or "Analysis completed."
+    }
+
+def write_batch_workbook(analyzed, excel_path):
+    """One sheet per register, then a combined sheet of every student"""
+    workbook = openpyxl.Workbook(write_only=True)
+    for register in analyzed["registers"]:
+        if register["results"]:
+            write_result_sheet(workbook, register["sheet"], map(student_row, register["results"]), result_header(register["paper_count"]))
+
+    # The combined sheet goes last: write-only sheets are written in creation order
+    paper_count = max((register["paper_count"] for register in analyzed["registers"]), default=0)
+    write_result_sheet(workbook, COMBINED_SHEET, _combined_rows(analyzed["registers"]), ["Register"] + result_header(paper_count))
+    workbook.save(excel_path)
+
+def _combined_rows(registers):
+    return (
+        [register["file"]] + student_row(student)
+        for register in registers
+        for student in register["results"]
+    )
+
+def combined_table(registers):
+    paper_count = max((register["paper_count"] for register in registers), default=0)
+    return pd.DataFrame(list(_combined_rows(registers)), columns=["Register"] + result_header(paper_count))
+
+def _collect_batch(analyzed):
+    """The consolidated JSON document: the per-file summary and every register's results"""
+    used_titles = {COMBINED_SHEET.lower()}
+    summary = []
+    registers = []
+
+    for name, results, paper_count, error in analyzed:
+        sheet = _sheet_title(name, used_titles) if results else None
+        summary.append(_summarize(name, results, error, sheet))
+        registers.append({"file": name, "sheet": sheet, "paper_count": paper_count, "results": results})
+
+    return {"summary": summary, "registers": registers}
+
+def analyze_batch(files, formats=None):
+    """
+    Analyze every register PDF in the uploads (PDFs and/or ZIPs of PDFs) in parallel.
+    Returns the summary and the {format: url} artifacts; the consolidated JSON holds every register's results,
+    the tables and the workbook's combined sheet every student.
+    """
+    formats = tuple(formats or exports.DEFAULT_FORMATS)
+
+    # Identical batches are answered from the result cache
+    cache_key = result_cache.make_key(
+        "batch-analysis-data", PARSER_VERSION, ",".join(formats),
+        *(result_cache.upload_sha256(uploaded_file) for uploaded_file in files)
+    )
+    cached = result_cache.lookup(cache_key)
+    if cached:
+        return result_cache.load_results(cached)["summary"], cached["files"]
+
+    file_id = uuid4()
+    file_stem = f"{file_id}_batch"
+
+    with tempfile.TemporaryDirectory() as spool_dir:
+        registers = _spool_batch(files, spool_dir)
+        if not registers:
+            raise ValueError("No PDF files found in the upload.")
+        analyzed = _collect_batch(analyze_registers(registers))
+
+    # Formats not written now are built by the artifact view on first download
+    written_now, _ = exports.plan(formats)
+    paths = exports.write_exports(
+        file_stem, written_now, analyzed,
+        table=lambda: combined_table(analyzed["registers"]),
+        write_excel=lambda path: write_batch_workbook(analyzed, path),
+        ensure_ascii=False
+    )
+    exports.write_manifest(file_stem, "batch", paths)
+    files_by_format = exports.store_artifacts(cache_key, file_stem, formats, paths)
+    fields = exports.artifact_fields(files_by_format)
+
+    # Stored in this process; the pool workers only parse
+    for register in analyzed["registers"]:
+        if register["results"]:
+            result_store.save_register(file_stem, register["results"], register["file"], fields["json_file"] or "", fields["excel_file"] or "")
+
+    return analyzed["summary"], files_by_format
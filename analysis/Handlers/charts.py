@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+from io import BytesIO
+from uuid import uuid4
+from django.conf import settings
+from . import result_cache
+
+UPLOAD_DIR_NAME = "uploads"
+
+# Bump whenever the drawing changes, so cached charts are not reused
+CHART_VERSION = 1
+
+# chart= name -> file extension; "data" answers with the chart data alone
+CHART_FORMATS = {
+    "png": ".png",
+    "svg": ".svg",
+    "data": None,
+}
+MIN_DPI = 50
+
+
+def default_dpi():
+    return getattr(settings, "CHART_DEFAULT_DPI", 150)
+
+def parse_options(params):
+    """
+    Chart options from ?chart=png|svg|data&dpi=<n> (png at CHART_DEFAULT_DPI by default).
+    Raises ValueError for unknown formats and resolutions out of range.
+    """
+    chart_format = str(params.get("chart") or "png").lower()
+    if chart_format not in CHART_FORMATS:
+        raise ValueError(f"Unknown chart format '{chart_format}'; choose from: {', '.join(CHART_FORMATS)}")
+
+    max_dpi = getattr(settings, "CHART_MAX_DPI", 600)
+    try:
+        dpi = int(params.get("dpi") or default_dpi())
+    except ValueError:
+        raise ValueError("dpi must be a whole number.")
+    if not MIN_DPI <= dpi <= max_dpi:
+        raise ValueError(f"dpi must be between {MIN_DPI} and {max_dpi}.")
+    return {"chart_format": chart_format, "dpi": dpi}
+
+def render_pass_fail_chart(chart_data, chart_format="png", dpi=None):
+    """
+    Stacked bar chart of pass/fail (and absent) counts per course, as PNG or SVG bytes
+    (at CHART_DEFAULT_DPI unless dpi is given).
+    Drawn on its own Figure rather than through pyplot's global state, so it is safe to
+    call from concurrent requests.
+    """
+    from matplotlib.figure import Figure
+
+    courses = chart_data["courses"]
+    pass_counts = chart_data["pass_counts"]
+    fail_counts = chart_data["fail_counts"]
+    absent_counts = chart_data.get("absent_counts") or [0] * len(courses)
+
+    figure = Figure(figsize=(10, 6))
+    ax = figure.subplots()
+    positions = range(len(courses))
+    ax.bar(positions, pass_counts, label="Pass Count", color="#7dc87dff")
+    ax.bar(positions, fail_counts, bottom=pass_counts, label="Fail Count", color="#C97C7C")
+    if any(absent_counts):
+        absent_bottom = [passed + failed for passed, failed in zip(pass_counts, fail_counts)]
+        ax.bar(positions, absent_counts, bottom=absent_bottom, label="Absent Count", color="#9E9E9E")
+
+    # Add count labels on each bar
+    for i in positions:
+        ax.text(i, pass_counts[i] / 2, f"{pass_counts[i]}", ha="center", color="white", weight="bold")
+        ax.text(i, pass_counts[i] + fail_counts[i] / 2, f"{fail_counts[i]}", ha="center", color="white", weight="bold")
+        if absent_counts[i]:
+            ax.text(i, pass_counts[i] + fail_counts[i] + absent_counts[i] / 2, f"{absent_counts[i]}", ha="center", color="white", weight="bold")
+
+    ax.set_xlabel("Courses")
+    ax.set_ylabel("Number of Students")
+    ax.set_title("Pass vs Fail Count per Course")
+    ax.legend()
+    ax.set_xticks(positions, courses, rotation=45, ha="right")
+    figure.tight_layout()
+
+    buffer = BytesIO()
+    figure.savefig(buffer, format=chart_format, dpi=dpi or default_dpi(), bbox_inches="tight")
+    return buffer.getvalue()
+
+def chart_key(chart_data, chart_format, dpi):
+    """Cache key of a chart: a hash of its data plus the chart options"""
+    data_hash = hashlib.sha256(json.dumps(chart_data, sort_keys=True).encode("utf-8")).hexdigest()
+    return result_cache.make_key("pass-fail-chart", CHART_VERSION, data_hash, chart_format, str(dpi))
+
+def pass_fail_chart_url(chart_data, chart_format="png", dpi=None):
+    """
+    URL of the rendered chart, drawn once per distinct chart_data and options and
+    then answered from the result cache.
+    """
+    dpi = dpi or default_dpi()
+    key = chart_key(chart_data, chart_format, dpi)
+    cached = result_cache.lookup(key)
+    if cached:
+        return cached["chart_url"]
+
+    filename = f"{key}_chart{CHART_FORMATS[chart_format]}"
+    upload_dir = os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR_NAME)
+    os.makedirs(upload_dir, exist_ok=True)
+    path = os.path.join(upload_dir, filename)
+
+    # Written under a temporary name, so concurrent requests for the same chart never see a partial file
+    tmp_path = f"{path}.{uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(render_pass_fail_chart(chart_data, chart_format, dpi))
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    chart_url = os.path.join(settings.MEDIA_URL, UPLOAD_DIR_NAME, filename).replace("\\", "/")
+    result_cache.store(key, {"chart_url": chart_url}, [path])
+    return chart_url
@@ -1,13 +1,24 @@
 import pandas as pd
 import re
 import openpyxl
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import Font
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend for server
-import matplotlib.pyplot as plt
+from datetime import date, datetime
 import numpy as np
+import functools
 import os
+import sys
+import unicodedata
+from . import charts
+from .worker_pool import map_tasks
 
+# Bump whenever processing changes what an endpoint returns, so cached results are not reused
+PARSER_VERSION = 5
+
+# Ledger grade columns counted by the pass/fail analysis, and the grades marking a fail or an absence
+GRADE_COMPONENTS = ("SE", "TW", "OR", "TH", "PR")
+FAIL_GRADE = "F"
+ABSENT_GRADES = ("AB", "ABS")
 
 def process_excel_main(input_path, output_path):
     """
@@ -15,12 +26,10 @@ def process_excel_main(input_path, output_path):
     """
     print("🔄 Starting Excel processing...")
     
-    # Step 1: Process data and calculate percentages
+    # Process data and calculate percentages; names where Remark == 'F'
+    # are highlighted as the workbook is written
     processed_df = process_data_and_percentages(input_path, output_path)
     
-    # Step 2: Highlight names where Remark == 'F'
-    highlight_failed_students(output_path)
-    
     print(f"✅ Final file saved at: {output_path}")
     return output_path
 
@@ -38,110 +47,152 @@ def process_data_and_percentages(input_path, output_path):
     exam_total_col = 'ExamTotal'
     outof_col = 'OUTOF'
 
-    percentages = []
-    exam_totals = []
-
-    for idx, value in enumerate(df_data[exam_total_col]):
-        if pd.isna(value):
-            percentages.append('')
-            exam_totals.append('')
-            continue
-
-        val_str = str(value).strip()
-        parts = val_str.split()
-
-        if len(parts) >= 2:
-            first_part = parts[0]
-            second_part = parts[-1]
-            numeric_score = re.sub(r'@.*', '', second_part)
-
-            if first_part == '--':
-                try:
-                    outof_value = float(df_data.iloc[idx][outof_col])
-                    score_value = float(numeric_score)
-                    calculated_perc = (score_value / outof_value) * 100
-                    percentages.append(f"{calculated_perc:.2f}%")
-                except:
-                    percentages.append('--')
-            else:
-                percentages.append(first_part)
-
-            exam_totals.append(numeric_score)
-        else:
-            percentages.append('--')
-            exam_totals.append('')
+    percentages, exam_totals = split_exam_totals(df_data, exam_total_col, outof_col)
 
     # Insert Percentage column before ExamTotal
     exam_col_pos = df_data.columns.get_loc(exam_total_col)
     new_columns = list(df_data.columns)
     new_columns.insert(exam_col_pos, 'Percentage')
 
-    new_df = pd.DataFrame()
-    for i, col in enumerate(new_columns):
+    columns = {}
+    for col in new_columns:
         if col == 'Percentage':
-            new_df[col] = percentages
+            columns[col] = percentages
         elif col == exam_total_col:
-            new_df[col] = exam_totals
+            columns[col] = exam_totals
         else:
-            new_df[col] = df_data[col]
+            columns[col] = df_data[col]
+    new_df = pd.DataFrame(columns)
 
     # Reconstruct full file (metadata + header + data)
-    final_rows = []
+    final_rows = ledger_rows(df_original, new_df)
 
-    for i in range(4):
-        row = df_original.iloc[i].tolist()
-        while len(row) < len(new_df.columns):
-            row.append(None)
-        final_rows.append(row)
-
-    header_row = list(new_df.columns)
-    final_rows.append(header_row)
-
-    for i in range(len(new_df)):
-        final_rows.append(new_df.iloc[i].tolist())
-
-    final_df = pd.DataFrame(final_rows)
-    final_df.to_excel(output_path, index=False, header=False)
+    write_highlighted_workbook(final_rows, output_path)
 
     print("✅ Data processed and saved.")
     return new_df
 
-def highlight_failed_students(output_path):
+def split_exam_totals(df_data, exam_total_col='ExamTotal', outof_col='OUTOF'):
+    """
+    Split ExamTotal cells such as "61.93% 545@1" into (Percentage, ExamTotal) columns.
+    Where the percentage is given as "--" it is worked out from the score and OUTOF, read
+    with float() (so "1_000" is a number and an empty OUTOF gives "nan%"); it stays "--"
+    when either is not a number or OUTOF is 0. Empty cells give empty strings.
     """
-    Highlight names in RED where Remark == 'F'
+    values = df_data[exam_total_col]
+    missing = values.isna()
+    text = values.astype(object).where(~missing, '').astype(str).str.strip()
+
+    # First and last whitespace separated parts; a single part carries no score
+    first_part = text.str.extract(r'^(\S+)', expand=False)
+    numeric_score = text.str.extract(r'(\S+)$', expand=False).str.replace(r'@.*', '', regex=True)
+    has_score = text.str.contains(r'\s', regex=True)
+
+    # Percentages left as "--" in the register, from score / OUTOF; only those rows are worked out
+    needs_calculation = ~missing & has_score & (first_part == '--')
+    calculated = pd.Series('--', index=df_data.index, dtype=object)
+    if outof_col in df_data and needs_calculation.any():
+        scores, score_is_number = _float_values(numeric_score[needs_calculation])
+        outofs, outof_is_number = _float_values(df_data.loc[needs_calculation, outof_col])
+        divisible = score_is_number & outof_is_number & (outofs != 0)
+        ratios = (scores[divisible] / outofs[divisible] * 100).to_numpy(dtype=float)
+        calculated[divisible.index[divisible]] = np.char.mod('%.2f%%', ratios)
+
+    percentages = np.select(
+        [missing, ~has_score, needs_calculation],
+        ['', '--', calculated],
+        default=first_part.astype(object)
+    )
+    exam_totals = np.where(missing | ~has_score, '', numeric_score.astype(object))
+    return (pd.Series(percentages, index=df_data.index, dtype=object),
+            pd.Series(exam_totals, index=df_data.index, dtype=object))
+
+@functools.cache
+def _decimal_digits():
+    """str.translate table from every Unicode decimal digit, which float() reads, to its ASCII digit"""
+    return {code: str(unicodedata.decimal(chr(code))) for code in range(sys.maxunicode + 1)
+            if unicodedata.decimal(chr(code), None) is not None}
+
+def _float_values(values):
     """
-    workbook = openpyxl.load_workbook(output_path)
-    sheet = workbook.active
+    float() of every value, column-wise: returns (numbers, whether float() accepts the value).
+    As with float(), text may carry surrounding whitespace, underscores between digits,
+    non-ASCII digits and "nan", booleans are numbers and None is not.
+    """
+    values = values.astype(object)
+    text = values.astype(str).str.strip()
+    if not text.dropna().str.isascii().all():
+        text = text.str.translate(_decimal_digits())
+    numbers = pd.to_numeric(text.str.replace(r'(?<=\d)_(?=\d)', '', regex=True), errors='coerce').astype(float)
+    # Integer parsing loses the sign of "-0"
+    numbers = numbers.mask((numbers == 0) & text.str.startswith('-', na=False), -0.0)
+    # Only booleans are still unparsed among the values equal to True or False
+    booleans = numbers.isna() & values.isin([True, False])
+    numbers = numbers.mask(booleans, (values == True).astype(float))
+    is_nan = text.str.lower().isin(['nan', '+nan', '-nan']) | (values.isna() & ~values.isin([None]))
+    return numbers, numbers.notna() | is_nan
+
+def ledger_rows(df_original, new_df):
+    """
+    Rows of the processed workbook: the 4 metadata rows of the original sheet (padded
+    to the new width), the header and the data rows
+    """
+    final_rows = []
+    for row in df_original.head(4).astype(object).values.tolist():
+        final_rows.append(row + [None] * (len(new_df.columns) - len(row)))
+    final_rows.append(list(new_df.columns))
+    final_rows.extend(new_df.astype(object).values.tolist())
+    return final_rows
+
+def _excel_value(value):
+    """A cell value as DataFrame.to_excel writes it: missing values are left empty, dates get its formats"""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def write_highlighted_workbook(rows, output_path):
+    """
+    Write rows (all at least as wide as the header) to a single sheet in one pass,
+    using openpyxl write-only mode. Once the header (the first row with both 'Name'
+    and 'Remark') has gone by, the name of every student whose Remark is 'F' is written in red.
+    """
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    red = Font(color="FFFF0000")  # red font
 
-    header_row = None
     name_col = None
     remark_col = None
-
-    for row in sheet.iter_rows(min_row=1, max_row=sheet.max_row):
-        values = [str(cell.value).strip().lower() if cell.value else "" for cell in row]
-        if "name" in values and "remark" in values:
-            header_row = row[0].row
-            for cell in row:
-                val = str(cell.value).strip().lower() if cell.value else ""
-                if val == "name":
-                    name_col = cell.column
-                if val == "remark":
-                    remark_col = cell.column
-            break
-
-    if header_row and name_col and remark_col:
-        count = 0
-        for row in range(header_row + 1, sheet.max_row + 1):
-            remark_value = str(sheet.cell(row=row, column=remark_col).value).strip().upper()
-            if remark_value == "F":
-                name_cell = sheet.cell(row=row, column=name_col)
-                name_cell.font = Font(color="FFFF0000")  # red font
-                count += 1
-
-        workbook.save(output_path)
-        print(f"🎯 Highlighted {count} names in red where Remark = 'F'.")
-    else:
+    count = 0
+
+    for row in rows:
+        row = [_excel_value(value) for value in row]
+        for i, value in enumerate(row):
+            if isinstance(value, (datetime, date)):
+                cell = WriteOnlyCell(sheet, value=value)
+                cell.number_format = "YYYY-MM-DD HH:MM:SS" if isinstance(value, datetime) else "YYYY-MM-DD"
+                row[i] = cell
+
+        if remark_col is None:
+            values = [str(value).strip().lower() if value else "" for value in row]
+            if "name" in values and "remark" in values:
+                # The last matching column wins, as when the header was searched cell by cell
+                name_col = len(values) - 1 - values[::-1].index("name")
+                remark_col = len(values) - 1 - values[::-1].index("remark")
+        elif str(row[remark_col]).strip().upper() == "F":
+            name_cell = WriteOnlyCell(sheet, value=row[name_col])
+            name_cell.font = red
+            row[name_col] = name_cell
+            count += 1
+
+        sheet.append(row)
+
+    workbook.save(output_path)
+    if remark_col is None:
         print("❌ Could not detect 'Name' or 'Remark' headers.")
+    else:
+        print(f"🎯 Highlighted {count} names in red where Remark = 'F'.")
 
 def process_excel_file(input_path, output_path):
     """
@@ -150,12 +201,10 @@ def process_excel_file(input_path, output_path):
     """
     print("🔄 Starting Excel processing...")
     
-    # Step 1: Process data and create new columns
+    # Process data and create new columns; names where Remark = 'F'
+    # are highlighted as the workbook is written
     process_and_split_columns(input_path, output_path)
     
-    # Step 2: Highlight names where Remark = 'F'
-    highlight_failed_students(output_path)
-    
     print(f"✅ Final file saved at: {output_path}")
 
 def process_and_split_columns(input_path, output_path):
@@ -173,111 +222,30 @@ def process_and_split_columns(input_path, output_path):
     exam_total_col = 'ExamTotal'
     outof_col = 'OUTOF'
 
-    percentages = []
-    exam_totals = []
-
-    for idx, value in enumerate(df_data[exam_total_col]):
-        if pd.isna(value):
-            percentages.append('')
-            exam_totals.append('')
-            continue
-
-        val_str = str(value).strip()
-        parts = val_str.split()
-
-        if len(parts) >= 2:
-            first_part = parts[0]
-            second_part = parts[-1]
-            numeric_score = re.sub(r'@.*', '', second_part)
-
-            if first_part == '--':
-                try:
-                    outof_value = float(df_data.iloc[idx][outof_col])
-                    score_value = float(numeric_score)
-                    calculated_perc = (score_value / outof_value) * 100
-                    percentages.append(f"{calculated_perc:.2f}%")
-                except:
-                    percentages.append('--')
-            else:
-                percentages.append(first_part)
-
-            exam_totals.append(numeric_score)
-        else:
-            percentages.append('--')
-            exam_totals.append('')
+    percentages, exam_totals = split_exam_totals(df_data, exam_total_col, outof_col)
 
     # Insert Percentage column before ExamTotal
     exam_col_pos = df_data.columns.get_loc(exam_total_col)
     new_columns = list(df_data.columns)
     new_columns.insert(exam_col_pos, 'Percentage')
 
-    new_df = pd.DataFrame()
-    for i, col in enumerate(new_columns):
+    columns = {}
+    for col in new_columns:
         if col == 'Percentage':
-            new_df[col] = percentages
+            columns[col] = percentages
         elif col == exam_total_col:
-            new_df[col] = exam_totals
+            columns[col] = exam_totals
         else:
-            new_df[col] = df_data[col]
+            columns[col] = df_data[col]
+    new_df = pd.DataFrame(columns)
 
     # Reconstruct full file (metadata + header + data)
-    final_rows = []
-
-    for i in range(4):
-        row = df_original.iloc[i].tolist()
-        while len(row) < len(new_df.columns):
-            row.append(None)
-        final_rows.append(row)
-
-    header_row = list(new_df.columns)
-    final_rows.append(header_row)
+    final_rows = ledger_rows(df_original, new_df)
 
-    for i in range(len(new_df)):
-        final_rows.append(new_df.iloc[i].tolist())
-
-    final_df = pd.DataFrame(final_rows)
-    final_df.to_excel(output_path, index=False, header=False)
+    write_highlighted_workbook(final_rows, output_path)
 
     print("✅ Data processed and saved.")
 
-def highlight_failed_students(output_path):
-    """
-    Highlights names in RED where Remark == 'F'
-    """
-    workbook = openpyxl.load_workbook(output_path)
-    sheet = workbook.active
-
-    header_row = None
-    name_col = None
-    remark_col = None
-
-    # Find header row and column indices
-    for row in sheet.iter_rows(min_row=1, max_row=sheet.max_row):
-        values = [str(cell.value).strip().lower() if cell.value else "" for cell in row]
-        if "name" in values and "remark" in values:
-            header_row = row[0].row
-            for cell in row:
-                val = str(cell.value).strip().lower() if cell.value else ""
-                if val == "name":
-                    name_col = cell.column
-                if val == "remark":
-                    remark_col = cell.column
-            break
-
-    if header_row and name_col and remark_col:
-        count = 0
-        for row in range(header_row + 1, sheet.max_row + 1):
-            remark_value = str(sheet.cell(row=row, column=remark_col).value).strip().upper()
-            if remark_value == "F":
-                name_cell = sheet.cell(row=row, column=name_col)
-                name_cell.font = Font(color="FFFF0000")  # red font
-                count += 1
-
-        workbook.save(output_path)
-        print(f"🎯 Highlighted {count} names in red where Remark = 'F'.")
-    else:
-        print("❌ Could not detect 'Name' or 'Remark' headers.")
-
 def analyze_pass_fail(input_path, chart_output_path):
     """
     Main function for pass/fail analysis.
@@ -297,108 +265,112 @@ def analyze_pass_fail(input_path, chart_output_path):
 
 def extract_pass_fail_data(input_path):
     """
-    Extracts pass/fail counts for each subject from the Excel file.
+    Extracts pass/fail/absent counts for every course component from the Excel file.
+    Grade columns are detected from the two-row header (course, then component) and
+    counted together, with a breakdown per component.
     """
     # Load Excel (row 6 and 7 are headers)
     df = pd.read_excel(input_path, sheet_name="Sheet1", header=[5, 6])
-    
-    # Flatten the multi-index column names
-    df.columns = [
-        '_'.join([str(c) for c in col if str(c) != 'nan']).strip()
-        for col in df.columns
-    ]
-    
-    # Print columns for debugging
-    print("Available columns (first 40):")
-    print(df.columns.tolist()[:40])
-    
-    # Manually specify the grade columns you want to analyze
-    subjects = {
-        "COURSE-1_SE": "COURSE-1_SE.1",
-        "COURSE-2_SE": "COURSE-2_SE.1",
-        "COURSE-3_SE": "COURSE-3_SE.1",
-        "COURSE-4_SE": "COURSE-4_SE.1",
-        "COURSE-5_SE": "COURSE-5_SE.1",
-        "COURSE-6_SE": "COURSE-6_SE.1",
+
+    grade_columns = find_grade_columns(df)
+    if not grade_columns:
+        print("⚠️ No grade columns found.")
+        return {"courses": [], "pass_counts": [], "fail_counts": [], "absent_counts": [], "components": {}}
+
+    # Flatten the multi-index column names; the labels keep the <course>_<component> form
+    labels = {
+        position: '_'.join([str(c) for c in (course, component) if str(c) != 'nan']).strip()
+        for position, (course, component) in grade_columns.items()
     }
-    
-    # Prepare data
-    pass_counts = []
-    fail_counts = []
-    courses = []
-    
-    for course, grade_col in subjects.items():
-        if grade_col not in df.columns:
-            print(f"⚠️ Skipping {course} — column '{grade_col}' not found.")
-            continue
-        
-        results = df[grade_col].dropna().astype(str).str.strip().str.upper()
-        
-        total = len(results)
-        if total == 0:
-            continue
-        
-        failed = (results == "F").sum()
-        passed = total - failed
-        
-        pass_counts.append(int(passed))
-        fail_counts.append(int(failed))
-        courses.append(course)
-    
+
+    # One long frame of every grade, classified and counted per column
+    grades = df.iloc[:, list(grade_columns)].set_axis(list(grade_columns), axis=1)
+    grades = grades.melt(var_name="column", value_name="grade").dropna(subset=["grade"])
+    grades["grade"] = grades["grade"].astype(str).str.strip().str.upper()
+    grades = grades[grades["grade"] != ""]
+    grades["outcome"] = np.select(
+        [grades["grade"] == FAIL_GRADE, grades["grade"].isin(ABSENT_GRADES)],
+        ["fail", "absent"],
+        default="pass"
+    )
+    counts = (
+        grades.groupby(["column", "outcome"]).size()
+        .unstack(fill_value=0)
+        .reindex(index=list(grade_columns), columns=["pass", "fail", "absent"], fill_value=0)
+    )
+    counts = counts[counts.sum(axis=1) > 0]
+
     chart_data = {
-        "courses": courses,
-        "pass_counts": pass_counts,
-        "fail_counts": fail_counts
+        "courses": [labels[position] for position in counts.index],
+        "pass_counts": counts["pass"].astype(int).tolist(),
+        "fail_counts": counts["fail"].astype(int).tolist(),
+        "absent_counts": counts["absent"].astype(int).tolist(),
+        "components": {}
     }
-    
-    print(f"✅ Extracted data for {len(courses)} courses")
-    
+    for position, row in counts.iterrows():
+        course, component = grade_columns[position]
+        breakdown = chart_data["components"].setdefault(component, {
+            "courses": [], "pass_counts": [], "fail_counts": [], "absent_counts": []
+        })
+        breakdown["courses"].append(str(course))
+        breakdown["pass_counts"].append(int(row["pass"]))
+        breakdown["fail_counts"].append(int(row["fail"]))
+        breakdown["absent_counts"].append(int(row["absent"]))
+
+    print(f"✅ Extracted data for {len(chart_data['courses'])} course components")
+
     return chart_data
 
-def generate_pass_fail_chart(chart_data, output_path):
+def find_grade_columns(df):
     """
-    Generates a stacked bar chart showing pass/fail counts per course.
+    Grade columns of a ledger read with a two-row header, as {position: (course, component)}.
+    Each course component (SE, TW, OR, TH, PR) has a marks and a grade column under the same
+    header; the grade column is the one holding mostly non-numeric values (e.g. "A+", "F", "AB").
+    Where several qualify, the last one is used.
     """
-    courses = chart_data["courses"]
-    pass_counts = chart_data["pass_counts"]
-    fail_counts = chart_data["fail_counts"]
-    
-    # Create the plot
-    plt.figure(figsize=(10, 6))
-    plt.bar(courses, pass_counts, label="Pass Count", color="#7dc87dff")
-    plt.bar(courses, fail_counts, bottom=pass_counts, label="Fail Count", color="#C97C7C")
-    
-    # Add count labels on each bar
-    for i, course in enumerate(courses):
-        plt.text(i, pass_counts[i] / 2, f"{pass_counts[i]}", ha="center", color="white", weight="bold")
-        plt.text(i, pass_counts[i] + fail_counts[i] / 2, f"{fail_counts[i]}", ha="center", color="white", weight="bold")
-    
-    plt.xlabel("Courses")
-    plt.ylabel("Number of Students")
-    plt.title("Pass vs Fail Count per Course")
-    plt.legend()
-    plt.xticks(rotation=45, ha='right')
-    plt.tight_layout()
-    
-    # Save to file
-    plt.savefig(output_path, dpi=150, bbox_inches='tight')
-    plt.close()
+    candidates = {}
+    for position, (course, component) in enumerate(df.columns):
+        course = str(course).strip()
+        # pandas numbers repeated headers: SE, SE.1, ...
+        component = re.sub(r'\.\d+$', '', str(component)).strip().upper()
+        if component in GRADE_COMPONENTS and not course.startswith('Unnamed:'):
+            candidates[position] = (course, component)
+    if not candidates:
+        return {}
+
+    # Share of numeric values per column, in one pass over all candidates
+    values = df.iloc[:, list(candidates)].set_axis(list(candidates), axis=1)
+    values = values.melt(var_name="column", value_name="value").dropna(subset=["value"])
+    values["numeric"] = pd.to_numeric(values["value"], errors="coerce").notna()
+    numeric_share = values.groupby("column")["numeric"].mean()
+
+    grade_columns = {}
+    for position, key in candidates.items():
+        if numeric_share.get(position, 1.0) < 0.5:
+            grade_columns[key] = position
+    return {position: key for key, position in sorted(grade_columns.items(), key=lambda item: item[1])}
+
+def generate_pass_fail_chart(chart_data, output_path, dpi=None):
+    """
+    Generates a stacked bar chart showing pass/fail (and absent) counts per course,
+    as PNG or SVG depending on the extension of output_path (at CHART_DEFAULT_DPI by default).
+    """
+    chart_format = "svg" if output_path.lower().endswith(".svg") else "png"
+    with open(output_path, "wb") as f:
+        f.write(charts.render_pass_fail_chart(chart_data, chart_format, dpi))
     
     print(f"✅ Chart generated successfully")
 
 def calculate_semester_average(input_paths, output_path):
     """
     Main function to calculate average percentage across multiple semesters.
-    Calls helper functions to process each file and merge results.
+    Reads the semester files concurrently, then combines them in one pass.
     """
     print(f"🔄 Starting semester average calculation for {len(input_paths)} semesters...")
     
-    # Process each semester file
-    dfs = []
-    for i, fpath in enumerate(input_paths):
-        print(f"Processing semester {i+1}: {os.path.basename(fpath)}")
-        df = preprocess_semester_df(fpath, i+1)
-        dfs.append(df)
+    # Process each semester file in the worker pool
+    tasks = [(fpath, i+1) for i, fpath in enumerate(input_paths)]
+    dfs = list(map_tasks(_preprocess_semester_task, tasks))
     
     # Merge all dataframes
     merged_df = merge_semester_dfs(dfs, len(input_paths))
@@ -408,19 +380,22 @@ def calculate_semester_average(input_paths, output_path):
     
     print(f"✅ Semester average file saved at: {output_path}")
 
-def clean_percentage_value(val):
-    """Convert percentage string like '61.93%' or '--' to float or NaN."""
+def _float_or_nan(text):
     try:
-        if pd.isna(val):
-            return np.nan
-        txt = str(val).strip()
-        if txt == '--' or txt == '':
-            return np.nan
-        txt = txt.replace('%', '')
-        return float(txt)
-    except Exception:
+        return float(text)
+    except ValueError:
         return np.nan
 
+def clean_percentage_values(values):
+    """
+    Convert percentage strings like '61.93%' or '--' to floats, NaN where there is no number.
+    Each distinct value is parsed once, with float().
+    """
+    text = values.astype(object).where(values.notna(), '').astype(str)
+    text = text.str.replace('%', '', regex=False).str.strip()
+    distinct = text.unique()
+    return text.map(dict(zip(distinct, map(_float_or_nan, distinct)))).astype(float)
+
 def find_column_by_keywords(df, keywords):
     """Find column in dataframe that matches any of the given keywords."""
     for col in df.columns:
@@ -430,6 +405,10 @@ def find_column_by_keywords(df, keywords):
                 return col
     return None
 
+def _preprocess_semester_task(task):
+    fpath, perc_index = task
+    return preprocess_semester_df(fpath, perc_index)
+
 def preprocess_semester_df(fpath, perc_index):
     """
     Reads and preprocesses a single semester Excel file.
@@ -465,7 +444,7 @@ def preprocess_semester_df(fpath, perc_index):
     
     # Clean percentage
     perc_col_name = f'Percentage {perc_index}'
-    df[perc_col_name] = df[perc_col_name].apply(clean_percentage_value)
+    df[perc_col_name] = clean_percentage_values(df[perc_col_name])
     
     # Keep only necessary columns to avoid merge conflicts
     keep_cols = ['ROLLNO', 'NAME', 'ROLLNO_PRE', 'NAME_PRE', perc_col_name]
@@ -477,36 +456,32 @@ def preprocess_semester_df(fpath, perc_index):
 
 def merge_semester_dfs(dfs, n_sem):
     """
-    Merges multiple semester dataframes on Roll No and Name.
+    Combines the semester dataframes on the normalized Roll No and Name.
     Calculates average percentage across all semesters.
     """
-    # Start with first dataframe
-    merged = dfs[0]
-    
-    # Merge remaining dataframes one by one
-    for i in range(1, len(dfs)):
-        merged = pd.merge(
-            merged, dfs[i],
-            on=['ROLLNO_PRE', 'NAME_PRE'],
-            how='outer',
-            suffixes=('', '_right')
-        )
-        
-        # Fix ROLLNO and NAME if suffixed
-        for col in ['ROLLNO', 'NAME']:
-            right_col = col + '_right'
-            if right_col in merged.columns:
-                if col in merged.columns:
-                    merged[col] = merged[col].combine_first(merged[right_col])
-                else:
-                    merged[col] = merged[right_col]
-                merged = merged.drop(right_col, axis=1)
-    
-    # Drop the _PRE columns after merge
-    merged = merged.drop(['ROLLNO_PRE', 'NAME_PRE'], axis=1)
+    keys = ['ROLLNO_PRE', 'NAME_PRE']
+    percentage_cols = [f'Percentage {i+1}' for i in range(n_sem)]
+
+    # One long frame of every semester, in semester order
+    long = pd.concat([
+        df.rename(columns={f'Percentage {i+1}': 'Percentage'}).assign(semester=i+1)
+        for i, df in enumerate(dfs)
+    ], ignore_index=True)
+    grouped = long.groupby(keys, sort=True, dropna=False)
+
+    # Roll No and Name as spelled in the earliest semester that has them
+    merged = grouped[['ROLLNO', 'NAME']].first()
+
+    # One column per semester
+    percentages = (
+        long.groupby(keys + ['semester'], sort=True, dropna=False)['Percentage'].first()
+        .unstack('semester')
+        .reindex(columns=range(1, n_sem + 1))
+    )
+    percentages.columns = percentage_cols
+    merged = merged.join(percentages).reset_index(drop=True)
     
     # Calculate average percentage
-    percentage_cols = [f'Percentage {i+1}' for i in range(n_sem)]
     merged['Average Percentage'] = merged[percentage_cols].mean(axis=1, skipna=True).round(2)
     
     # Prepare final output columns
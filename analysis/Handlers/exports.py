@@ -0,0 +1,199 @@
+import importlib.util
+import json
+import os
+from django.conf import settings
+from django.urls import reverse
+from . import result_cache
+
+UPLOAD_DIR_NAME = "uploads"
+
+# format= name -> artifact extension; json and json-compact are two layouts of the same file
+EXPORT_FORMATS = {
+    "json": ".json",
+    "json-compact": ".json",
+    "xlsx": ".xlsx",
+    "csv": ".csv",
+    "parquet": ".parquet",
+    "arrow": ".arrow",
+}
+DEFAULT_FORMATS = ("json", "xlsx")
+JSON_FORMATS = ("json", "json-compact")
+TABLE_FORMATS = ("csv", "parquet", "arrow")
+# Written through pyarrow, which is an optional dependency
+ARROW_FORMATS = ("parquet", "arrow")
+CONTENT_TYPES = {
+    "json": "application/json",
+    "json-compact": "application/json",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.file",
+}
+
+
+def parse_formats(value=None):
+    """The export formats named by a comma separated format= value; json and xlsx when none are given"""
+    if not value:
+        return DEFAULT_FORMATS
+
+    formats = []
+    for name in str(value).lower().split(","):
+        name = name.strip()
+        if name not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown format '{name}'; choose from: {', '.join(EXPORT_FORMATS)}")
+        if name not in formats:
+            formats.append(name)
+
+    if all(name in formats for name in JSON_FORMATS):
+        raise ValueError("Request either json or json-compact, not both.")
+    check_dependencies(formats)
+    return tuple(formats)
+
+def check_dependencies(formats):
+    if any(name in ARROW_FORMATS for name in formats) and importlib.util.find_spec("pyarrow") is None:
+        raise ValueError("Parquet and Arrow exports need pyarrow, which is not installed.")
+
+def plan(formats):
+    """
+    Split formats into those written with the analysis and those left to the artifact view.
+    With LAZY_ARTIFACTS only the results JSON is written up front (in the requested layout,
+    or json when none was requested); everything else is built from it on first download.
+    """
+    if not getattr(settings, "LAZY_ARTIFACTS", True):
+        return tuple(formats), ()
+    results = next((name for name in formats if name in JSON_FORMATS), "json")
+    return (results,), tuple(name for name in formats if name not in JSON_FORMATS)
+
+def export_path(file_stem, name):
+    return os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR_NAME, f"{file_stem}{EXPORT_FORMATS[name]}")
+
+def export_url(file_stem, name):
+    return os.path.join(settings.MEDIA_URL, UPLOAD_DIR_NAME, f"{file_stem}{EXPORT_FORMATS[name]}").replace("\\", "/")
+
+def download_url(file_stem, name):
+    return reverse("artifact", args=[file_stem, name])
+
+def manifest_path(file_stem):
+    return os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR_NAME, f"{file_stem}.manifest.json")
+
+def artifact_fields(files):
+    """Response fields for a {format: url} mapping: the JSON and Excel URLs (None if not exported) and every file"""
+    return {
+        "json_file": files.get("json") or files.get("json-compact"),
+        "excel_file": files.get("xlsx"),
+        "files": files
+    }
+
+def write_json(path, data, compact=False, ensure_ascii=True):
+    with open(path, "w", encoding="utf-8") as f:
+        if compact:
+            json.dump(data, f, separators=(",", ":"), ensure_ascii=ensure_ascii)
+        else:
+            json.dump(data, f, indent=2, ensure_ascii=ensure_ascii)
+
+def tee_json_array(f, records, compact=False, ensure_ascii=True):
+    """
+    Yield records unchanged while writing them to the open file f as a JSON array,
+    matching write_json of the whole list byte for byte.
+    """
+    f.write("[")
+    count = 0
+    for record in records:
+        if compact:
+            f.write("," if count else "")
+            f.write(json.dumps(record, separators=(",", ":"), ensure_ascii=ensure_ascii))
+        else:
+            f.write(",\n  " if count else "\n  ")
+            f.write(json.dumps(record, indent=2, ensure_ascii=ensure_ascii).replace("\n", "\n  "))
+        count += 1
+        yield record
+    f.write("\n]" if count and not compact else "]")
+
+def _arrow_table(frame):
+    import pandas as pd
+    import pyarrow as pa
+
+    # Arrow columns hold one type; mixed object columns (e.g. marks next to "AB") become text
+    frame = frame.copy()
+    for column in frame.columns[frame.dtypes == object]:
+        if frame[column].dropna().map(type).nunique() > 1:
+            frame[column] = frame[column].map(lambda value: value if pd.isna(value) else str(value))
+    return pa.Table.from_pandas(frame, preserve_index=False)
+
+def write_table(frame, path, name):
+    """Write a DataFrame as csv, parquet or an Arrow IPC file"""
+    if name == "csv":
+        frame.to_csv(path, index=False)
+    elif name == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(_arrow_table(frame), path)
+    else:
+        import pyarrow as pa
+        table = _arrow_table(frame)
+        with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+def write_exports(file_stem, formats, data, table=None, write_excel=None, ensure_ascii=True, records=None):
+    """
+    Write the requested formats of one analysis as uploads/<file_stem>.<ext>.
+    data is the JSON document, or records() yields its records one at a time when data is None;
+    table() builds the DataFrame behind the csv/parquet/arrow files and write_excel(path) the
+    workbook. Each is only called when one of its formats is requested.
+    Returns {format: path}.
+    """
+    os.makedirs(os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR_NAME), exist_ok=True)
+    paths = {}
+    frame = None
+    for name in formats:
+        path = paths[name] = export_path(file_stem, name)
+        if name in JSON_FORMATS and data is None:
+            with open(path, "w", encoding="utf-8") as f:
+                for _ in tee_json_array(f, records(), compact=name == "json-compact", ensure_ascii=ensure_ascii):
+                    pass
+        elif name in JSON_FORMATS:
+            write_json(path, data, compact=name == "json-compact", ensure_ascii=ensure_ascii)
+        elif name == "xlsx":
+            write_excel(path)
+        else:
+            if frame is None:
+                frame = table()
+            write_table(frame, path, name)
+    return paths
+
+def json_path(paths):
+    """The JSON artifact among written {format: path}, which cache hits read results back from"""
+    return paths.get("json") or paths.get("json-compact")
+
+def write_manifest(file_stem, kind, paths, extra=None):
+    """
+    Record what the artifact view needs to build other formats from the results JSON:
+    the analysis kind, the JSON layout and any extra data (e.g. the subject structure).
+    Nothing is recorded for exports without a results JSON.
+    """
+    results = next((name for name in JSON_FORMATS if name in paths), None)
+    if results:
+        write_json(manifest_path(file_stem), {"kind": kind, "results": results, "extra": extra or {}})
+
+def store_artifacts(cache_key, file_stem, formats, paths, retained=(), analysis_id=None):
+    """
+    Cache the written artifacts, together with any retained upload copies; returns {format: url}
+    for the requested formats, pointing at the artifact view for those not written yet.
+    Hits are answered from the JSON artifact, so exports without one are not cached.
+    analysis_id is kept in the payload for analyses that report theirs.
+    """
+    files = {
+        name: export_url(file_stem, name) if name in paths else download_url(file_stem, name)
+        for name in formats
+    }
+    if json_path(paths):
+        # Hits need only the results and manifest: the other formats can be rebuilt from them,
+        # and those built later by the artifact view are adopted by the entry when they are
+        payload = {"results_path": json_path(paths), "files": files}
+        if analysis_id is not None:
+            payload["analysis_id"] = analysis_id
+        result_cache.store(
+            cache_key, payload,
+            [path for path in (*retained, *paths.values(), manifest_path(file_stem)) if path],
+            required=[json_path(paths), manifest_path(file_stem)]
+        )
+    return files
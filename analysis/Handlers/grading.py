@@ -0,0 +1,104 @@
+import re
+from bisect import bisect_right
+from functools import lru_cache
+import numpy as np
+
+
+class GradingScheme:
+    """
+    A register's MARKS/GRADE table compiled into sorted boundary arrays.
+    A total gets the grade of the first range with low <= total <= high.
+    """
+
+    def __init__(self, rules):
+        self.rules = list(rules)
+
+        order = sorted(range(len(self.rules)), key=lambda i: self.rules[i][0])
+        ordered = [self.rules[i] for i in order]
+        # Position of each original rule in the sorted arrays
+        self._sorted_position = {rule_idx: pos for pos, rule_idx in enumerate(order)}
+        self.lows = np.array([low for low, _, _ in ordered], dtype=float)
+        self.highs = np.array([high for _, high, _ in ordered], dtype=float)
+        # Trailing None is what out-of-range totals pick up
+        self.grades = np.array([grade for _, _, grade in ordered] + [None], dtype=object)
+
+        # Boundary search is only equivalent to a first-match scan when ranges do not overlap
+        self.searchable = bool(np.all(self.highs[:-1] < self.lows[1:]))
+        self._low_list = self.lows.tolist()
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def grade(self, total):
+        """Grade a single total"""
+        if not self.searchable:
+            for low, high, grade in self.rules:
+                if low <= total <= high:
+                    return grade
+            return None
+
+        idx = bisect_right(self._low_list, total) - 1
+        if idx >= 0 and total <= self.highs[idx]:
+            return self.grades[idx]
+        return None
+
+    def grade_indices(self, totals):
+        """
+        Index into self.grades for each total, in one searchsorted call.
+        Out-of-range totals get the last index, whose grade is None.
+        """
+        totals = np.asarray(totals, dtype=float)
+        if not self.rules:
+            return np.full(len(totals), 0, dtype=np.intp)
+
+        if not self.searchable:
+            none_idx = len(self.rules)
+            indices = []
+            for total in totals.tolist():
+                match = next((i for i, (low, high, _) in enumerate(self.rules) if low <= total <= high), None)
+                indices.append(none_idx if match is None else self._sorted_position[match])
+            return np.array(indices, dtype=np.intp)
+
+        idx = np.searchsorted(self.lows, totals, side="right") - 1
+        in_range = (idx >= 0) & (totals <= self.highs[np.maximum(idx, 0)])
+        return np.where(in_range, idx, len(self.rules))
+
+    def grade_all(self, totals):
+        """Grade a sequence of totals in one vectorized call; returns a list"""
+        return self.grades[self.grade_indices(totals)].tolist()
+
+
+def find_grading_lines(text):
+    """Return the last MARKS and GRADE header lines in text"""
+    marks_line = None
+    grade_line = None
+
+    for line in text.splitlines():
+        if line.strip().startswith("MARKS"):
+            marks_line = line
+        elif line.strip().startswith("GRADE") and not line.strip().startswith("GRADE POINT"):
+            grade_line = line
+
+    return marks_line, grade_line
+
+@lru_cache(maxsize=128)
+def compile_grading_scheme(marks_line, grade_line):
+    """Compile a MARKS/GRADE header pair; cached, since registers repeat the same table"""
+    if not marks_line or not grade_line:
+        return GradingScheme([])
+
+    marks_ranges = re.findall(r"(\d+\.?\d*)\s*to\s*(\d+\.?\d*)", marks_line)
+    grades = grade_line.split(":")[1].split()
+
+    return GradingScheme((float(low), float(high), grade) for (low, high), grade in zip(marks_ranges, grades))
+
+def grade_students(students, scheme):
+    """(Re)grade every paper of every student in place with one vectorized call"""
+    papers = [paper for student in students for paper in student["papers"]]
+    grades = scheme.grade_all([paper["total"] for paper in papers])
+    for paper, grade in zip(papers, grades):
+        paper["grade"] = grade
+    return students
@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import time
+from uuid import uuid4
+from django.conf import settings
+
+# Durable work queue in a single SQLite file. Workers claim jobs under a time-limited
+# lease; a job whose worker dies is picked up again once its lease expires.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_expires REAL,
+    available_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, available_at);
+"""
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _connect():
+    path = str(getattr(settings, "JOB_QUEUE_PATH", os.path.join(settings.BASE_DIR, "jobs.sqlite3")))
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _lease_seconds():
+    return getattr(settings, "JOB_LEASE_SECONDS", 300)
+
+def _to_dict(row):
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+def enqueue(kind, payload, job_id=None, max_attempts=None):
+    """Add a job and return its id"""
+    job_id = job_id or uuid4().hex
+    max_attempts = max_attempts or getattr(settings, "JOB_MAX_ATTEMPTS", 3)
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, payload, max_attempts, available_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, QUEUED, json.dumps(payload), max_attempts, now, now, now)
+        )
+    finally:
+        conn.close()
+    return job_id
+
+def get(job_id):
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _to_dict(row) if row else None
+
+def fail_expired():
+    """Fail the jobs whose lease expired on their final attempt; returns their ids"""
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        job_ids = [row["id"] for row in conn.execute(
+            "SELECT id FROM jobs WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+            (RUNNING, now)
+        )]
+        conn.executemany(
+            "UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, updated_at = ? WHERE id = ?",
+            [(FAILED, "Worker lease expired on the final attempt.", now, job_id) for job_id in job_ids]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return job_ids
+
+def claim(worker_id):
+    """
+    Lease the oldest runnable job to worker_id and return it, or None.
+    Jobs whose lease expired are claimable again until they run out of attempts;
+    fail_expired() then fails them.
+    """
+    now = time.time()
+    conn = _connect()
+    try:
+        # IMMEDIATE takes the write lock up front, so two workers never claim the same job
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE (status = ? AND available_at <= ?) "
+            "OR (status = ? AND lease_expires < ? AND attempts < max_attempts) "
+            "ORDER BY created_at LIMIT 1",
+            (QUEUED, now, RUNNING, now)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+
+        conn.execute(
+            "UPDATE jobs SET status = ?, lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+            "progress = 0, updated_at = ? WHERE id = ?",
+            (RUNNING, worker_id, now + _lease_seconds(), now, row["id"])
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+    return get(row["id"])
+
+def heartbeat(job_id, worker_id, progress=None):
+    """Extend worker_id's lease on a job; returns False if the lease was lost"""
+    now = time.time()
+    conn = _connect()
+    try:
+        cursor = conn.execute(
+            "UPDATE jobs SET lease_expires = ?, progress = COALESCE(?, progress), updated_at = ? "
+            "WHERE id = ? AND status = ? AND lease_owner = ?",
+            (now + _lease_seconds(), progress, now, job_id, RUNNING, worker_id)
+        )
+        return cursor.rowcount == 1
+    finally:
+        conn.close()
+
+def complete(job_id, worker_id, result, failed=False):
+    """Record a finished job's result"""
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET status = ?, result = ?, progress = 1, lease_owner = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (FAILED if failed else DONE, json.dumps(result), now, job_id, worker_id)
+        )
+    finally:
+        conn.close()
+
+def retry_or_fail(job_id, worker_id, error):
+    """Put a crashed job back in the queue with backoff, or fail it after its last attempt"""
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.execute(
+            "UPDATE jobs SET "
+            "status = CASE WHEN attempts >= max_attempts THEN ? ELSE ? END, "
+            "available_at = ? + 5 * attempts, error = ?, lease_owner = NULL, updated_at = ? "
+            "WHERE id = ? AND lease_owner = ?",
+            (FAILED, QUEUED, now, error, now, job_id, worker_id)
+        )
+    finally:
+        conn.close()
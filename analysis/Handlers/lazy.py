@@ -0,0 +1,31 @@
+from importlib import import_module
+from django.utils.functional import SimpleLazyObject
+
+# Handler modules that pull in pandas, numpy, openpyxl, matplotlib or PyMuPDF. The views
+# import them on first use, so a worker answers status-check/ without loading any of it.
+HEAVY_HANDLERS = (
+    "analysis.Handlers.analysis_handler",
+    "analysis.Handlers.artifacts",
+    "analysis.Handlers.batch_handler",
+    "analysis.Handlers.excel_handler",
+    "analysis.Handlers.PDFPercentageAnalyzer",
+    "analysis.Handlers.revaluation",
+)
+# Imported inside the functions that need them
+HEAVY_LIBRARIES = (
+    "matplotlib.figure",
+    "matplotlib.backends.backend_agg",
+)
+
+
+def lazy_module(name):
+    """A stand-in for module name that imports it on first attribute access"""
+    return SimpleLazyObject(lambda: import_module(name))
+
+def preload():
+    """
+    Import every heavy handler and library now. Called in the gunicorn master when
+    preloading (see gunicorn.conf.py), so forked workers start with them loaded.
+    """
+    for name in (*HEAVY_HANDLERS, *HEAVY_LIBRARIES):
+        import_module(name)
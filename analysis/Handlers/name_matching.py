@@ -0,0 +1,58 @@
+from collections import Counter, defaultdict
+from difflib import SequenceMatcher
+
+NGRAM_SIZE = 3
+# n-grams shared by more names than this are too common to narrow the search
+MAX_BLOCK_SIZE = 200
+# Names compared in full for each lookup
+MAX_CANDIDATES = 5
+
+
+def name_ngrams(name, n=NGRAM_SIZE):
+    """Character n-grams of a normalized name, padded so short names still have some"""
+    padded = f"^{name}$"
+    if len(padded) <= n:
+        return {padded}
+    return {padded[i:i + n] for i in range(len(padded) - n + 1)}
+
+def name_similarity(a, b):
+    """Similarity ratio between two normalized names, 0.0 to 1.0"""
+    return SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+
+class NameIndex:
+    """
+    n-gram blocking index over normalized names.
+    A lookup only compares the names that share the most n-grams with the query,
+    so matching a cohort stays near-linear instead of comparing every pair.
+    """
+
+    def __init__(self):
+        self.names = []
+        self.items = []
+        self.postings = defaultdict(list)
+
+    def add(self, name, item):
+        ident = len(self.names)
+        self.names.append(name)
+        self.items.append(item)
+        for gram in name_ngrams(name):
+            self.postings[gram].append(ident)
+
+    def candidates(self, name, limit=MAX_CANDIDATES):
+        """Up to limit (similarity, item) pairs for the names sharing the most n-grams with name, best first"""
+        postings = sorted(
+            (self.postings[gram] for gram in name_ngrams(name) if gram in self.postings),
+            key=len
+        )
+
+        shared = Counter()
+        for i, posting in enumerate(postings):
+            # The rarest n-gram is always used, so common names still get candidates
+            if i and len(posting) > MAX_BLOCK_SIZE:
+                break
+            shared.update(posting)
+
+        scored = [(name_similarity(name, self.names[ident]), ident) for ident, _ in shared.most_common(limit)]
+        scored.sort(key=lambda pair: (-pair[0], pair[1]))
+        return [(similarity, self.items[ident]) for similarity, ident in scored]
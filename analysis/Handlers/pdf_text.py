@@ -0,0 +1,187 @@
+import io
+import mmap
+import os
+import fitz
+from contextlib import contextmanager
+from django.conf import settings
+from . import progress
+from .worker_pool import get_pool
+
+
+class PdfSource:
+    """
+    A PDF to parse in place: an in-memory or memory-mapped buffer, the file path
+    behind it when there is one, or both. Plain paths are accepted wherever a source is.
+    """
+
+    def __init__(self, path=None, buffer=None):
+        self.path = path
+        self.buffer = buffer
+
+def _as_source(pdf):
+    return pdf if isinstance(pdf, PdfSource) else PdfSource(path=pdf)
+
+def upload_path(file):
+    """Path of the file behind an upload (temporary uploads, spooled job files), or None"""
+    if hasattr(file, "temporary_file_path"):
+        return file.temporary_file_path()
+    name = getattr(getattr(file, "file", file), "name", None)
+    return name if isinstance(name, str) and os.path.isfile(name) else None
+
+@contextmanager
+def open_upload(file):
+    """
+    Open a Django upload for parsing without copying it into MEDIA_ROOT.
+    File-backed uploads (large temporary uploads, spooled job files) are memory-mapped;
+    in-memory uploads are parsed through a view of their buffer.
+    """
+    underlying = getattr(file, "file", file)
+    path = upload_path(file)
+    if path and os.path.getsize(path):
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield PdfSource(path=path, buffer=view)
+            finally:
+                view.release()
+    elif isinstance(underlying, io.BytesIO):
+        view = underlying.getbuffer()
+        try:
+            yield PdfSource(buffer=view)
+        finally:
+            view.release()
+    else:
+        file.seek(0)
+        yield PdfSource(buffer=file.read())
+
+def retain_upload(file, path):
+    """Save the original upload to path if RETAIN_UPLOADED_PDFS is set; returns the path or None"""
+    if not getattr(settings, "RETAIN_UPLOADED_PDFS", False):
+        return None
+    with open(path, "wb") as f:
+        for chunk in file.chunks():
+            f.write(chunk)
+    return path
+
+
+# --- backends ---
+# Each backend provides count_pages(pdf), extract_range(pdf, start, stop), returning
+# the text of pages [start, stop) in page order, and iter_pages(pdf), which yields
+# page texts one at a time from a single open document. pdf is a path or a PdfSource.
+
+def _fitz_open(pdf):
+    source = _as_source(pdf)
+    if source.buffer is not None:
+        return fitz.open(stream=source.buffer, filetype="pdf")
+    return fitz.open(source.path)
+
+def _pymupdf_count_pages(pdf):
+    with _fitz_open(pdf) as doc:
+        return len(doc)
+
+def _pymupdf_extract_range(pdf, start, stop):
+    with _fitz_open(pdf) as doc:
+        return [doc[page_num].get_text() for page_num in range(start, stop)]
+
+def _pymupdf_iter_pages(pdf):
+    with _fitz_open(pdf) as doc:
+        for page in doc:
+            yield page.get_text()
+
+def _pypdf2_open(pdf):
+    source = _as_source(pdf)
+    if source.buffer is not None:
+        return io.BytesIO(source.buffer)
+    return open(source.path, 'rb')
+
+def _pypdf2_count_pages(pdf):
+    import PyPDF2
+    with _pypdf2_open(pdf) as pdf_file:
+        return len(PyPDF2.PdfReader(pdf_file).pages)
+
+def _pypdf2_extract_range(pdf, start, stop):
+    import PyPDF2
+    with _pypdf2_open(pdf) as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        return [pdf_reader.pages[page_num].extract_text() or "" for page_num in range(start, stop)]
+
+def _pypdf2_iter_pages(pdf):
+    import PyPDF2
+    with _pypdf2_open(pdf) as pdf_file:
+        for page in PyPDF2.PdfReader(pdf_file).pages:
+            yield page.extract_text() or ""
+
+BACKENDS = {
+    "pymupdf": (_pymupdf_count_pages, _pymupdf_extract_range, _pymupdf_iter_pages),
+    "pypdf2": (_pypdf2_count_pages, _pypdf2_extract_range, _pypdf2_iter_pages),
+}
+
+def register_backend(name, count_pages, extract_range, iter_pages=None):
+    """Register an extraction backend under the given name"""
+    if iter_pages is None:
+        def iter_pages(pdf):
+            for page_num in range(count_pages(pdf)):
+                yield extract_range(pdf, page_num, page_num + 1)[0]
+    BACKENDS[name] = (count_pages, extract_range, iter_pages)
+
+def get_backend(name=None):
+    name = name or getattr(settings, "PDF_TEXT_BACKEND", "pymupdf")
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown PDF text backend: {name}")
+
+
+# --- extraction ---
+
+def _extract_page_range(task):
+    backend, pdf_path, start, stop = task
+    return get_backend(backend)[1](pdf_path, start, stop)
+
+def extract_page_texts(pdf, backend=None, workers=None):
+    """
+    Extract the text of every page in page order.
+    Large registers that live in a file are split into page ranges that are
+    extracted in the shared worker pool; workers reopen the file by path.
+    """
+    backend = backend or getattr(settings, "PDF_TEXT_BACKEND", "pymupdf")
+    count_pages, extract_range, _ = get_backend(backend)
+    if workers is None:
+        workers = getattr(settings, "PDF_EXTRACTION_WORKERS", 1)
+
+    page_count = count_pages(pdf)
+    path = _as_source(pdf).path
+    if workers <= 1 or path is None or page_count < getattr(settings, "PDF_PARALLEL_MIN_PAGES", 40):
+        if not progress.is_reporting():
+            return extract_range(pdf, 0, page_count)
+        # Page by page, so a queued job's progress moves with every page
+        return list(iter_page_texts(pdf, backend))
+
+    # A few ranges per worker keeps the pool busy when some pages are denser than others
+    chunk_size = max(1, -(-page_count // (workers * 4)))
+    tasks = [(backend, str(path), start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+
+    page_texts = []
+    for texts in get_pool().map(_extract_page_range, tasks):
+        page_texts.extend(texts)
+        progress.report(len(page_texts), page_count)
+    return page_texts
+
+def iter_page_texts(pdf, backend=None):
+    """Yield page texts lazily, in page order, holding only one page at a time"""
+    count_pages, _, iter_pages = get_backend(backend)
+    page_count = count_pages(pdf) if progress.is_reporting() else 0
+    for done, page_text in enumerate(iter_pages(pdf), 1):
+        progress.report(done, page_count)
+        yield page_text
+
+def extract_text(pdf, backend=None, separator="", workers=None):
+    """Extract the whole document as one string, joining pages with separator"""
+    return separator.join(extract_page_texts(pdf, backend=backend, workers=workers))
+
+def extract_text_from_pdf(pdf, workers=None):
+    """Extract text from PDF file; pass workers=1 when already running in a pool worker"""
+    try:
+        return extract_text(pdf, workers=workers)
+    except Exception as e:
+        return f"An error occurred: {e}"
@@ -0,0 +1,33 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Progress of the queued job being run, reported by the handlers as they go (pages read,
+# registers parsed) and sent to the job queue by the worker. Plain requests have no
+# reporter, so their reports are dropped.
+_reporter = ContextVar("progress_reporter", default=None)
+
+
+@contextmanager
+def reporting(callback):
+    """Send progress reported inside the block to callback(fraction done); None drops it"""
+    token = _reporter.set(callback)
+    try:
+        yield
+    finally:
+        _reporter.reset(token)
+
+@contextmanager
+def part(index, count):
+    """Map progress reported inside the block onto the index-th of count equal parts of the current progress"""
+    callback = _reporter.get()
+    with reporting(None if callback is None else lambda fraction: callback((index + fraction) / count)):
+        yield
+
+def is_reporting():
+    return _reporter.get() is not None
+
+def report(done, total):
+    """Report that done of total units of work are finished"""
+    callback = _reporter.get()
+    if callback is not None and total:
+        callback(min(done / total, 1.0))
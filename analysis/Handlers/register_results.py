@@ -0,0 +1,103 @@
+import sys
+from array import array
+import numpy as np
+
+
+class StudentRecord:
+    """One student of a register; their papers are a slice of the register's paper columns"""
+    __slots__ = ("seat_no", "name", "result", "sgpi", "first_paper", "paper_count")
+
+    def __init__(self, seat_no, name, result, sgpi, first_paper, paper_count):
+        self.seat_no = seat_no
+        self.name = name
+        self.result = result
+        self.sgpi = sgpi
+        self.first_paper = first_paper
+        self.paper_count = paper_count
+
+
+class RegisterResults:
+    """
+    Parsed register held column-wise: a compact record per student plus parallel
+    arrays of paper code ids, totals and grade ids covering every paper in the register.
+    Paper codes and names are interned, so each distinct one is stored once.
+    """
+
+    def __init__(self, paper_names):
+        self.paper_names = paper_names
+        self.students = []
+        self.codes = []
+        self.code_names = []
+        self._code_ids = {}
+        self.paper_code_ids = array("i")
+        self.paper_totals = array("q")
+        # Filled in by grade(); grade_labels[paper_grade_ids[i]] is the grade of paper i
+        self.paper_grade_ids = None
+        self.grade_labels = None
+
+    def __len__(self):
+        return len(self.students)
+
+    def __iter__(self):
+        return self.iter_records()
+
+    def _code_id(self, code):
+        code_id = self._code_ids.get(code)
+        if code_id is None:
+            code_id = self._code_ids[code] = len(self.codes)
+            self.codes.append(sys.intern(code))
+            self.code_names.append(sys.intern(self.paper_names.get(code, "Unknown")))
+        return code_id
+
+    def append(self, seat_no, name, result, paper_totals, sgpi):
+        """Add a student from tokenize_student_block's (code, total) pairs"""
+        first_paper = len(self.paper_totals)
+        for code, total in paper_totals:
+            self.paper_code_ids.append(self._code_id(code))
+            self.paper_totals.append(total)
+        self.students.append(StudentRecord(seat_no, name, result, sgpi, first_paper, len(self.paper_totals) - first_paper))
+
+    def grade(self, scheme):
+        """Grade every paper in the register with one searchsorted call"""
+        totals = np.frombuffer(self.paper_totals, dtype=np.int64)
+        self.paper_grade_ids = scheme.grade_indices(totals).tolist()
+        self.grade_labels = scheme.grades.tolist()
+
+    @property
+    def paper_count(self):
+        """Most papers any student has; the number of paper column groups in the workbook"""
+        return max((student.paper_count for student in self.students), default=0)
+
+    def _grade(self, paper_idx):
+        if self.paper_grade_ids is None:
+            return None
+        return self.grade_labels[self.paper_grade_ids[paper_idx]]
+
+    def iter_records(self):
+        """Yield students as the API/JSON dicts"""
+        for student in self.students:
+            papers = []
+            for paper_idx in range(student.first_paper, student.first_paper + student.paper_count):
+                code_id = self.paper_code_ids[paper_idx]
+                papers.append({
+                    "paper_code": self.codes[code_id],
+                    "paper_name": self.code_names[code_id],
+                    "total": self.paper_totals[paper_idx],
+                    "grade": self._grade(paper_idx)
+                })
+            yield {
+                "seat_no": student.seat_no,
+                "name": student.name,
+                "result": student.result,
+                "sgpi": student.sgpi,
+                "papers": papers
+            }
+
+    def iter_rows(self):
+        """Yield students as flat workbook rows (Seat No, Name, Result, SGPI, then code/name/marks/grade per paper)"""
+        for student in self.students:
+            row = [student.seat_no, student.name, student.result, student.sgpi]
+            for paper_idx in range(student.first_paper, student.first_paper + student.paper_count):
+                code_id = self.paper_code_ids[paper_idx]
+                row.extend([self.codes[code_id], self.code_names[code_id], self.paper_totals[paper_idx], self._grade(paper_idx)])
+            yield row
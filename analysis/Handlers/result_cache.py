@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+from django.conf import settings
+
+CACHE_DIR_NAME = "cache"
+
+
+def _cache_dir():
+    cache_dir = os.path.join(settings.MEDIA_ROOT, CACHE_DIR_NAME)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+def _read_entry(entry_path):
+    try:
+        with open(entry_path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _write_entry(entry_path, entry):
+    tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    os.replace(tmp_path, entry_path)
+
+def _entries():
+    """(entry path, entry) of every entry in the cache"""
+    cache_dir = _cache_dir()
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        entry_path = os.path.join(cache_dir, name)
+        entry = _read_entry(entry_path)
+        if entry is not None:
+            yield entry_path, entry
+
+def _drop(entry_path, entry):
+    """Delete an entry together with the artifacts it owns"""
+    _remove(entry_path)
+    for path in entry["artifacts"]:
+        _remove(path)
+
+def upload_sha256(file):
+    """SHA-256 of an uploaded file, computed by the upload handler when available"""
+    digest = getattr(file, "sha256", None)
+    if digest:
+        return digest
+
+    sha256 = hashlib.sha256()
+    for chunk in file.chunks():
+        sha256.update(chunk)
+    file.sha256 = sha256.hexdigest()
+    return file.sha256
+
+def make_key(endpoint, parser_version, *file_hashes):
+    """Cache key for an endpoint, its parser version and the hashes of its input files (in order)"""
+    raw = "|".join([endpoint, str(parser_version), *file_hashes])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def lookup(key):
+    """
+    Return the payload stored for key, or None.
+    A hit refreshes the entry's position in the LRU order.
+    """
+    if not getattr(settings, "RESULT_CACHE_ENABLED", True):
+        return None
+
+    entry_path = os.path.join(_cache_dir(), f"{key}.json")
+    entry = _read_entry(entry_path)
+    if entry is None:
+        return None
+
+    # An entry whose required artifacts were removed by hand is useless; drop it with the rest
+    if not all(os.path.exists(path) for path in entry.get("required", entry["artifacts"])):
+        _drop(entry_path, entry)
+        return None
+
+    os.utime(entry_path)
+    return entry["payload"]
+
+def store(key, payload, artifact_paths, required=None):
+    """
+    Store payload under key. The entry owns artifact_paths, which are deleted
+    along with it when the cache grows past RESULT_CACHE_MAX_BYTES.
+    Lookups only hit while the required paths (default: all of them) exist.
+    """
+    if not getattr(settings, "RESULT_CACHE_ENABLED", True):
+        return
+
+    artifacts = [str(path) for path in artifact_paths]
+    entry = {
+        "payload": payload,
+        "artifacts": artifacts,
+        "required": artifacts if required is None else [str(path) for path in required],
+    }
+    _write_entry(os.path.join(_cache_dir(), f"{key}.json"), entry)
+
+    evict()
+
+def adopt(owner_path, artifact_path):
+    """
+    Hand artifact_path to every entry that owns owner_path, so it is evicted along with them.
+    Used for artifacts built after the entry was stored (e.g. exports built on first download).
+    """
+    owner_path, artifact_path = str(owner_path), str(artifact_path)
+    for entry_path, entry in _entries():
+        if owner_path in entry["artifacts"] and artifact_path not in entry["artifacts"]:
+            entry["artifacts"].append(artifact_path)
+            _write_entry(entry_path, entry)
+
+def evict(max_bytes=None):
+    """
+    Delete least recently used entries and their artifacts until the cache fits in max_bytes.
+    Artifacts are measured on disk, so those rebuilt after the entry was stored count at their current size.
+    """
+    if max_bytes is None:
+        max_bytes = getattr(settings, "RESULT_CACHE_MAX_BYTES", 2 * 1024 ** 3)
+
+    entries = []
+    for entry_path, entry in _entries():
+        try:
+            stat = os.stat(entry_path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, entry_path, entry, stat.st_size + sum(map(_size, entry["artifacts"]))))
+
+    total = sum(size for _, _, _, size in entries)
+    for _, entry_path, entry, size in sorted(entries, key=lambda item: item[:2]):
+        if total <= max_bytes:
+            break
+        _drop(entry_path, entry)
+        total -= size
+
+def load_results(payload):
+    """Read the results list back from the JSON artifact a payload points to"""
+    with open(payload["results_path"], encoding="utf-8") as f:
+        return json.load(f)
+
+def release(artifact_path):
+    """
+    Drop every entry that owns artifact_path, leaving the artifacts in place.
+    Used when an artifact is edited and no longer matches the upload it was cached for.
+    """
+    artifact_path = str(artifact_path)
+    for entry_path, entry in _entries():
+        if artifact_path in entry["artifacts"]:
+            _remove(entry_path)
@@ -0,0 +1,199 @@
+import base64
+import json
+from decimal import Decimal, InvalidOperation
+from django.db.models import Exists, OuterRef, Prefetch, Q
+from ..models import PaperResult, Register, SemesterPercentage, Student
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# ordering parameter -> (column, descending); the rank columns are the precomputed
+# sort indexes, where rank 1 is the highest SGPI / percentage
+STUDENT_ORDERINGS = {
+    "position": ("position", False),
+    "-position": ("position", True),
+    "seat_no": ("seat_no", False),
+    "-seat_no": ("seat_no", True),
+    "name": ("name", False),
+    "-name": ("name", True),
+    "-sgpi": ("sgpi_rank", False),
+    "sgpi": ("sgpi_rank", True),
+}
+PERCENTAGE_ORDERINGS = {
+    "name": ("normalized_name", False),
+    "-name": ("normalized_name", True),
+    "-percentage": ("percentage_rank", False),
+    "percentage": ("percentage_rank", True),
+}
+
+
+def _encode_cursor(value, ident):
+    raw = json.dumps([value, ident]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def _decode_cursor(cursor):
+    try:
+        value, ident = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return value, int(ident)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid cursor.")
+
+def _page_size(params, name="limit"):
+    try:
+        size = int(params.get(name, DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number.")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+def _decimal(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return Decimal(value)
+    except InvalidOperation:
+        raise ValueError(f"{name} must be a number.")
+
+def _register(analysis_id, kind, params):
+    """The register a query runs against; analyses with several registers (batches) need ?register=<id>"""
+    registers = Register.objects.filter(analysis_id=analysis_id, kind=kind)
+    if params.get("register"):
+        registers = registers.filter(id=params["register"]) if str(params["register"]).isdigit() else registers.none()
+
+    registers = list(registers[:21])
+    if not registers:
+        raise LookupError("Analysis not found.")
+    if len(registers) > 1:
+        choices = ", ".join(f"{register.id} ({register.source_name})" for register in registers[:20])
+        raise ValueError(f"This analysis has several registers; pass register=<id>, one of: {choices}")
+    return registers[0]
+
+def _keyset_page(queryset, column, descending, cursor, limit):
+    """One page in (column, id) order, continuing after the cursor's row"""
+    if cursor:
+        value, ident = _decode_cursor(cursor)
+        op = "lt" if descending else "gt"
+        queryset = queryset.filter(Q(**{f"{column}__{op}": value}) | Q(**{column: value, f"id__{op}": ident}))
+
+    order = [f"-{column}", "-id"] if descending else [column, "id"]
+    rows = list(queryset.order_by(*order)[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(getattr(rows[-1], column), rows[-1].id)
+    return rows, next_cursor
+
+def _ordering(params, orderings, default, top_ordering):
+    if params.get("top"):
+        return orderings[top_ordering]
+    ordering = params.get("ordering") or default
+    if ordering not in orderings:
+        raise ValueError(f"ordering must be one of: {', '.join(orderings)}")
+    return orderings[ordering]
+
+def _student_record(student, include_papers):
+    record = {
+        "seat_no": student.seat_no,
+        "name": student.name,
+        "result": student.result,
+        "sgpi": None if student.sgpi is None else f"{student.sgpi:.2f}",
+        "sgpi_rank": student.sgpi_rank,
+    }
+    if include_papers:
+        record["papers"] = [{
+            "paper_code": paper.paper_code,
+            "paper_name": paper.paper_name,
+            "total": paper.total,
+            "grade": paper.grade
+        } for paper in student.papers.all()]
+    return record
+
+def query_students(analysis_id, params):
+    """
+    Page through a stored result register.
+    Filters: result, seat_no, name (contains), sgpi_min, sgpi_max, paper_code and/or grade.
+    ordering is one of STUDENT_ORDERINGS; top=N returns the N highest SGPIs.
+    Pages continue from cursor; the total count is only given on the first page.
+    """
+    register = _register(analysis_id, Register.RESULT, params)
+    students = Student.objects.filter(register=register)
+
+    if params.get("result"):
+        students = students.filter(result=params["result"])
+    if params.get("seat_no"):
+        students = students.filter(seat_no=params["seat_no"])
+    if params.get("name"):
+        students = students.filter(name__icontains=params["name"])
+    sgpi_min, sgpi_max = _decimal(params, "sgpi_min"), _decimal(params, "sgpi_max")
+    if sgpi_min is not None:
+        students = students.filter(sgpi__gte=sgpi_min)
+    if sgpi_max is not None:
+        students = students.filter(sgpi__lte=sgpi_max)
+    if params.get("paper_code") or params.get("grade"):
+        papers = PaperResult.objects.filter(register=register, student=OuterRef("pk"))
+        if params.get("paper_code"):
+            papers = papers.filter(paper_code=params["paper_code"])
+        if params.get("grade"):
+            papers = papers.filter(grade=params["grade"])
+        students = students.filter(Exists(papers))
+
+    include_papers = params.get("papers", "1") not in ("0", "false")
+    if include_papers:
+        students = students.prefetch_related(Prefetch("papers", queryset=PaperResult.objects.order_by("position")))
+
+    column, descending = _ordering(params, STUDENT_ORDERINGS, "position", "-sgpi")
+    top = params.get("top")
+    limit = _page_size(params, "top" if top else "limit")
+    cursor = None if top else params.get("cursor")
+    count = students.count() if not cursor else None
+
+    rows, next_cursor = _keyset_page(students, column, descending, cursor, limit)
+    return {
+        "register": {"id": register.id, "source_name": register.source_name, "student_count": register.student_count},
+        "count": count,
+        "next_cursor": None if top else next_cursor,
+        "results": [_student_record(student, include_papers) for student in rows]
+    }
+
+def query_percentages(analysis_id, params):
+    """
+    Page through a stored percentage analysis, one semester at a time (semester=1 by default).
+    Filters: seat_no, name (contains), percentage_min, percentage_max.
+    ordering is one of PERCENTAGE_ORDERINGS; top=N returns the N highest percentages.
+    """
+    register = _register(analysis_id, Register.PERCENTAGE, params)
+    semester = params.get("semester", "1")
+    if not str(semester).isdigit():
+        raise ValueError("semester must be a number.")
+    records = SemesterPercentage.objects.filter(register=register, semester=int(semester))
+
+    if params.get("seat_no"):
+        records = records.filter(seat_no=params["seat_no"])
+    if params.get("name"):
+        records = records.filter(name__icontains=params["name"])
+    percentage_min, percentage_max = _decimal(params, "percentage_min"), _decimal(params, "percentage_max")
+    if percentage_min is not None:
+        records = records.filter(percentage__gte=float(percentage_min))
+    if percentage_max is not None:
+        records = records.filter(percentage__lte=float(percentage_max))
+
+    column, descending = _ordering(params, PERCENTAGE_ORDERINGS, "name", "-percentage")
+    top = params.get("top")
+    limit = _page_size(params, "top" if top else "limit")
+    cursor = None if top else params.get("cursor")
+    count = records.count() if not cursor else None
+
+    rows, next_cursor = _keyset_page(records, column, descending, cursor, limit)
+    return {
+        "register": {"id": register.id, "source_name": register.source_name, "student_count": register.student_count},
+        "semester": int(semester),
+        "count": count,
+        "next_cursor": None if top else next_cursor,
+        "results": [{
+            "seat_no": record.seat_no,
+            "name": record.name,
+            "percentage": record.percentage,
+            "percentage_rank": record.percentage_rank
+        } for record in rows]
+    }
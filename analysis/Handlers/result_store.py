@@ -0,0 +1,176 @@
+import heapq
+from itertools import islice
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from ..models import PaperResult, Register, SemesterPercentage, Student
+
+
+def _enabled():
+    return getattr(settings, "RESULT_DATABASE_ENABLED", True)
+
+def _batch_size():
+    return getattr(settings, "RESULT_DATABASE_BATCH_SIZE", 1000)
+
+# --- sort indexes ---
+# Ranks are precomputed when rows are stored, so sorted and top-N queries read an
+# index range instead of sorting the register on every call
+
+def _sgpi_order(sgpi, position):
+    return (sgpi is None, -float(sgpi or 0), position)
+
+def _percentage_order(percentage, normalized_name):
+    return (percentage is None, -(percentage or 0), normalized_name)
+
+def _ranked_ahead(register, sgpi, position):
+    """Ranked students of register that sort ahead of (sgpi, position) by SGPI"""
+    students = Student.objects.filter(register=register, sgpi_rank__gt=0)
+    if sgpi is None:
+        return students.filter(Q(sgpi__isnull=False) | Q(sgpi__isnull=True, position__lt=position))
+    return students.filter(sgpi__isnull=False).filter(Q(sgpi__gt=sgpi) | Q(sgpi=sgpi, position__lt=position))
+
+def _rerank_students(register, created, removed_ranks):
+    """
+    Give newly stored students (created, stored with rank 0) their SGPI ranks and close the
+    gaps left by the removed ranks, in one pass over the affected range: the ranked students
+    from the first removed rank or insertion point down are read once, in rank order, merged
+    with the new students and written back with a single bulk update.
+    """
+    if not created and not removed_ranks:
+        return
+    created = sorted(created, key=lambda student: _sgpi_order(student.sgpi, student.position))
+    start = _ranked_ahead(register, created[0].sgpi, created[0].position).count() + 1 if created else None
+    start = min(rank for rank in (start, *removed_ranks) if rank is not None)
+
+    ranked = Student.objects.filter(register=register, sgpi_rank__gte=start).order_by("sgpi_rank").only("sgpi", "position", "sgpi_rank")
+    merged = heapq.merge(ranked.iterator(), created, key=lambda student: _sgpi_order(student.sgpi, student.position))
+    changed = []
+    for rank, student in enumerate(merged, start):
+        if student.sgpi_rank != rank:
+            student.sgpi_rank = rank
+            changed.append(student)
+    Student.objects.bulk_update(changed, ["sgpi_rank"], batch_size=_batch_size())
+
+def _create_students(register, students_by_position, ranks=None):
+    """
+    bulk_create students ({position: student record}, with {position: sgpi rank}) and all
+    their papers; returns the created students
+    """
+    positions = sorted(students_by_position)
+    ranks = ranks or {}
+    created = Student.objects.bulk_create([
+        Student(
+            register=register,
+            position=position,
+            seat_no=students_by_position[position]["seat_no"],
+            name=students_by_position[position]["name"],
+            result=students_by_position[position]["result"] or "",
+            sgpi=students_by_position[position]["sgpi"],
+            sgpi_rank=ranks.get(position, 0)
+        )
+        for position in positions
+    ], batch_size=_batch_size())
+
+    # Backends that cannot return ids from a bulk insert need them read back
+    if created and created[0].pk is None:
+        created = list(Student.objects.filter(register=register, position__in=positions).order_by("position"))
+
+    PaperResult.objects.bulk_create([
+        PaperResult(
+            register=register,
+            student=student,
+            position=paper_position,
+            paper_code=paper["paper_code"],
+            paper_name=paper["paper_name"] or "",
+            total=paper["total"],
+            grade=paper["grade"]
+        )
+        for student, position in zip(created, positions)
+        for paper_position, paper in enumerate(students_by_position[position]["papers"])
+    ], batch_size=_batch_size())
+    return created
+
+def save_register(analysis_id, results, source_name="", json_file="", excel_file="", sgpis=None):
+    """
+    Store a parsed result register (get-analysis-data records) and its papers.
+    results is only iterated, a batch of RESULT_DATABASE_BATCH_SIZE students at a time, so it
+    can be a spool; it is read twice unless the students' SGPIs are passed in order as sgpis.
+    Registers already stored under the same analysis id and source (cache hits) are skipped.
+    """
+    if not _enabled() or Register.objects.filter(analysis_id=analysis_id, source_name=source_name).exists():
+        return None
+
+    if sgpis is None:
+        sgpis = [student["sgpi"] for student in results]
+    ordered = sorted(range(len(sgpis)), key=lambda position: _sgpi_order(sgpis[position], position))
+    ranks = {position: rank for rank, position in enumerate(ordered, 1)}
+
+    with transaction.atomic():
+        register = Register.objects.create(
+            analysis_id=analysis_id,
+            kind=Register.RESULT,
+            source_name=source_name,
+            json_file=json_file,
+            excel_file=excel_file,
+            student_count=len(ranks)
+        )
+        students = enumerate(results)
+        while batch := dict(islice(students, _batch_size())):
+            _create_students(register, batch, ranks)
+    return register
+
+def upsert_students(analysis_id, students_by_position):
+    """Replace or add the given students ({position: record}) of a stored register, matching on seat number"""
+    if not _enabled():
+        return
+    register = Register.objects.filter(analysis_id=analysis_id, kind=Register.RESULT).first()
+    if register is None:
+        return
+
+    with transaction.atomic():
+        seats = [student["seat_no"] for student in students_by_position.values()]
+        replaced = Student.objects.filter(register=register, seat_no__in=seats)
+        removed_ranks = [rank for rank in replaced.values_list("sgpi_rank", flat=True) if rank]
+        # Papers go with their students through the cascade
+        replaced.delete()
+        created = _create_students(register, students_by_position)
+        _rerank_students(register, created, removed_ranks)
+        register.student_count = register.students.count()
+        register.save(update_fields=["student_count"])
+
+def save_percentages(analysis_id, semesters, source_name="", json_file="", excel_file=""):
+    """
+    Store percentage records for one or more semesters.
+    semesters is a list (in semester order) of iterables of dicts with
+    seat_no, name, normalized_name and percentage.
+    """
+    if not _enabled() or Register.objects.filter(analysis_id=analysis_id, source_name=source_name).exists():
+        return None
+
+    with transaction.atomic():
+        register = Register.objects.create(
+            analysis_id=analysis_id,
+            kind=Register.PERCENTAGE,
+            source_name=source_name,
+            json_file=json_file,
+            excel_file=excel_file
+        )
+        records = []
+        for semester, semester_records in enumerate(semesters, 1):
+            semester_records = sorted(semester_records, key=lambda record: _percentage_order(record["percentage"], record["normalized_name"]))
+            records.extend(
+                SemesterPercentage(
+                    register=register,
+                    semester=semester,
+                    seat_no=record.get("seat_no") or "",
+                    name=record["name"],
+                    normalized_name=record["normalized_name"],
+                    percentage=record["percentage"],
+                    percentage_rank=rank
+                )
+                for rank, record in enumerate(semester_records, 1)
+            )
+        created = SemesterPercentage.objects.bulk_create(records, batch_size=_batch_size())
+        register.student_count = len({record.normalized_name for record in created})
+        register.save(update_fields=["student_count"])
+    return register
@@ -0,0 +1,342 @@
+import json
+import os
+from contextlib import contextmanager
+from uuid import UUID
+from django.conf import settings
+from .pdf_text import extract_page_texts, open_upload
+from . import exports, result_cache, result_store
+from .analysis_handler import parse_register_pages
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+UPLOAD_DIR_NAME = "uploads"
+
+
+def _read_manifest(analysis_id):
+    """The analysis manifest, or {} for analyses stored without one"""
+    try:
+        with open(exports.manifest_path(analysis_id), encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _analysis_paths(analysis_id):
+    """
+    JSON, workbook and statistics paths of a get-analysis-data analysis; the workbook may not be built yet.
+    Raises ValueError for ids of other kinds of analysis.
+    """
+    try:
+        analysis_id = str(UUID(analysis_id))
+    except ValueError:
+        raise ValueError("Invalid analysis id.")
+
+    upload_dir = os.path.join(settings.MEDIA_ROOT, UPLOAD_DIR_NAME)
+    json_path = os.path.join(upload_dir, f"{analysis_id}.json")
+    excel_path = os.path.join(upload_dir, f"{analysis_id}.xlsx")
+    if not os.path.exists(json_path):
+        raise FileNotFoundError("Analysis not found.")
+    if _read_manifest(analysis_id).get("kind", "register") != "register":
+        raise ValueError("Only result register analyses (get-analysis-data) can be revalued.")
+    return analysis_id, json_path, excel_path, os.path.join(upload_dir, f"{analysis_id}_stats.json")
+
+@contextmanager
+def _locked(path):
+    """Serialize updates to one analysis across server processes (where flock is available)"""
+    with open(f"{path}.lock", "w") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+def _replace_json(path, data, **kwargs):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, **kwargs)
+    os.replace(tmp_path, path)
+
+
+# --- summary statistics ---
+# Kept as running totals so an update only adds and removes the changed students
+
+def _contribution(student):
+    sgpi = student["sgpi"]
+    return {
+        "total_students": 1,
+        "successful": int(student["result"] == "Successful"),
+        "unsuccessful": int(student["result"] == "Unsuccessful"),
+        "graded": int(sgpi is not None),
+        "sgpi_total": float(sgpi) if sgpi is not None else 0.0
+    }
+
+def _apply(statistics, student, sign):
+    for field, value in _contribution(student).items():
+        statistics[field] += sign * value
+
+def _finish(statistics):
+    statistics["sgpi_total"] = round(statistics["sgpi_total"], 2)
+    statistics["average_sgpi"] = round(statistics["sgpi_total"] / statistics["graded"], 2) if statistics["graded"] else None
+    return statistics
+
+def _load_statistics(stats_path, results):
+    """Stored running totals, computed from the full results the first time an analysis is updated"""
+    try:
+        with open(stats_path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+
+    statistics = {"total_students": 0, "successful": 0, "unsuccessful": 0, "graded": 0, "sgpi_total": 0.0,
+                  "revaluations": 0, "updated_students": 0, "added_students": 0}
+    for student in results:
+        _apply(statistics, student, 1)
+    return _finish(statistics)
+
+
+# --- row index ---
+# <id>.rows.json holds the seat number and byte span of every student in the results
+# JSON, so an update reads, parses and serializes only the changed students and copies
+# the bytes of the others. Changed students that fit in their stored rows are written in
+# place, padded with spaces, so the common update touches only the delta's bytes
+
+def _row_layout(analysis_id):
+    """The results JSON layout (json or json-compact) recorded in the analysis manifest"""
+    return _read_manifest(analysis_id).get("results", "json")
+
+def _dump_row(student, layout):
+    """A student as it appears inside the results array, like stream_result writes it"""
+    if layout == "json-compact":
+        return json.dumps(student, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return json.dumps(student, indent=2, ensure_ascii=False).replace("\n", "\n  ").encode("utf-8")
+
+def _array_bytes(layout):
+    """(prefix, separator, suffix) around the rows of a non-empty results array"""
+    if layout == "json-compact":
+        return b"[", b",", b"]"
+    return b"[\n  ", b",\n  ", b"\n]"
+
+def _file_version(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+def _load_row_index(index_path, json_path):
+    """The stored row index, or None if it is missing or the results JSON changed since"""
+    try:
+        with open(index_path, encoding="utf-8") as f:
+            index = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    return index if index["version"] == _file_version(json_path) else None
+
+def _build_row_index(json_path):
+    """Index every student of the results JSON; parses the whole file, once per analysis"""
+    with open(json_path, "rb") as f:
+        raw = f.read()
+    text = raw.decode("utf-8")
+    decoder = json.JSONDecoder()
+
+    students, seats, spans = [], [], []
+    position = text.index("[") + 1
+    byte_position = len(text[:position].encode("utf-8"))
+    while True:
+        # Skip the whitespace and comma between rows
+        start = position
+        while text[position] in " \t\r\n,":
+            position += 1
+        if text[position] == "]":
+            break
+        byte_position += position - start
+        student, end = decoder.raw_decode(text, position)
+        length = len(text[position:end].encode("utf-8"))
+        students.append(student)
+        seats.append(student["seat_no"])
+        spans.append([byte_position, byte_position + length])
+        byte_position += length
+        position = end
+    return {"seats": seats, "spans": spans}, students
+
+def _read_rows(json_path, spans):
+    """Parse only the students at the given byte spans"""
+    with open(json_path, "rb") as f:
+        rows = []
+        for start, end in spans:
+            f.seek(start)
+            rows.append(json.loads(f.read(end - start)))
+        return rows
+
+def _copy_range(source, target, start, end, chunk_size=1024 * 1024):
+    source.seek(start)
+    remaining = end - start
+    while remaining > 0:
+        chunk = source.read(min(chunk_size, remaining))
+        target.write(chunk)
+        remaining -= len(chunk)
+
+def _patch_rows(json_path, index, changed, layout):
+    """
+    Write the changed students ({position: record}; positions past the end are appended)
+    into the results JSON in place. Each updated student overwrites its stored row, padded
+    with spaces to the row's length, and new students are written over the closing bracket.
+    Returns the updated index, or None (leaving the file untouched) if an updated student
+    no longer fits in its row.
+    """
+    spans = [list(span) for span in index["spans"]]
+    rows = {position: _dump_row(student, layout) for position, student in changed.items()}
+    if not spans or any(position < len(spans) and len(data) > spans[position][1] - spans[position][0]
+                        for position, data in rows.items()):
+        return None
+
+    _, separator, suffix = _array_bytes(layout)
+    seats = list(index["seats"])
+    with open(json_path, "r+b") as f:
+        appended = []
+        for position in sorted(rows):
+            if position >= len(spans):
+                appended.append(position)
+                continue
+            start, end = spans[position]
+            f.seek(start)
+            f.write(rows[position].ljust(end - start))
+            spans[position] = [start, start + len(rows[position])]
+            seats[position] = changed[position]["seat_no"]
+
+        if appended:
+            f.seek(spans[-1][1])
+            for position in appended:
+                f.write(separator)
+                spans.append([f.tell(), f.tell() + len(rows[position])])
+                f.write(rows[position])
+                seats.append(changed[position]["seat_no"])
+            f.write(suffix)
+            f.truncate()
+    return {"seats": seats, "spans": spans}
+
+def _splice_rows(json_path, index, changed, layout):
+    """
+    Rewrite the results JSON with the changed students ({position: record}; positions past
+    the end are appended), for updates _patch_rows cannot make in place. Runs of unchanged
+    students are copied byte for byte. Returns the updated index.
+    """
+    prefix, separator, suffix = _array_bytes(layout)
+    spans = index["spans"]
+    seats = list(index["seats"])
+    row_count = max(len(spans), max(changed) + 1)
+    new_spans = []
+
+    tmp_path = f"{json_path}.{os.getpid()}.tmp"
+    with open(json_path, "rb") as source, open(tmp_path, "wb") as target:
+        target.write(prefix)
+        position = 0
+        while position < row_count:
+            if position:
+                target.write(separator)
+            if position in changed:
+                data = _dump_row(changed[position], layout)
+                new_spans.append([target.tell(), target.tell() + len(data)])
+                target.write(data)
+                if position < len(seats):
+                    seats[position] = changed[position]["seat_no"]
+                else:
+                    seats.append(changed[position]["seat_no"])
+                position += 1
+                continue
+
+            # The run of unchanged students up to the next change, separators included
+            end = position
+            while end + 1 < len(spans) and end + 1 not in changed:
+                end += 1
+            shift = target.tell() - spans[position][0]
+            _copy_range(source, target, spans[position][0], spans[end][1])
+            new_spans.extend([start + shift, stop + shift] for start, stop in spans[position:end + 1])
+            position = end + 1
+        target.write(suffix)
+    os.replace(tmp_path, json_path)
+    return {"seats": seats, "spans": new_spans}
+
+
+# --- artifacts ---
+
+def _drop_derived_artifacts(analysis_id):
+    """
+    Remove the workbook and table exports built from the previous results. The artifact
+    view builds them again from the updated JSON on their next download.
+    """
+    for name in exports.EXPORT_FORMATS:
+        if name not in exports.JSON_FORMATS:
+            path = exports.export_path(analysis_id, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+def apply_delta(analysis_id, file):
+    """
+    Upsert the students of a revaluation or supplementary PDF into an existing
+    get-analysis-data analysis, by seat number.
+    Only the delta is parsed. The results JSON is updated through its row index: the
+    changed students are the only ones parsed and serialized, and are written in place
+    unless one outgrows its stored row, which makes the file be spliced into a copy.
+    Built workbook and table exports are dropped and rebuilt from the JSON on their next
+    download; they are compressed or whole-file formats that cannot be patched per row.
+    Returns (changed students, statistics, json_url, excel_url).
+    """
+    analysis_id, json_path, excel_path, stats_path = _analysis_paths(analysis_id)
+    index_path = os.path.join(os.path.dirname(json_path), f"{analysis_id}.rows.json")
+
+    with open_upload(file) as pdf:
+        delta = list(parse_register_pages(extract_page_texts(pdf)).iter_records())
+    if not delta:
+        raise ValueError("No student records found in the delta PDF.")
+
+    with _locked(json_path):
+        index = _load_row_index(index_path, json_path)
+        if index is None or not os.path.exists(stats_path):
+            index, results = _build_row_index(json_path)
+            statistics = _load_statistics(stats_path, results)
+        else:
+            statistics = _load_statistics(stats_path, ())
+        positions = {seat_no: position for position, seat_no in enumerate(index["seats"])}
+
+        # Only the stored rows of the delta's seats are read back
+        existing = sorted({positions[student["seat_no"]] for student in delta if student["seat_no"] in positions})
+        stored = dict(zip(existing, _read_rows(json_path, [index["spans"][position] for position in existing])))
+
+        changed = {}
+        updated = added = 0
+        row_count = len(index["seats"])
+        for student in delta:
+            position = positions.get(student["seat_no"])
+            if position is None:
+                position = positions[student["seat_no"]] = row_count
+                row_count += 1
+                stored[position] = student
+                added += 1
+            elif stored[position] != student:
+                _apply(statistics, stored[position], -1)
+                stored[position] = student
+                updated += 1
+            else:
+                continue
+            _apply(statistics, student, 1)
+            changed[position] = student
+
+        if changed:
+            layout = _row_layout(analysis_id)
+            index = _patch_rows(json_path, index, changed, layout) or _splice_rows(json_path, index, changed, layout)
+            _drop_derived_artifacts(analysis_id)
+            # The artifacts no longer match the upload they were cached for
+            result_cache.release(json_path)
+            result_store.upsert_students(analysis_id, changed)
+        index["version"] = _file_version(json_path)
+        _replace_json(index_path, index)
+
+        statistics["revaluations"] += 1
+        statistics["updated_students"] += updated
+        statistics["added_students"] += added
+        _replace_json(stats_path, _finish(statistics), indent=2)
+
+    json_url = os.path.join(settings.MEDIA_URL, UPLOAD_DIR_NAME, f"{analysis_id}.json").replace("\\", "/")
+    if os.path.exists(excel_path):
+        excel_url = os.path.join(settings.MEDIA_URL, UPLOAD_DIR_NAME, f"{analysis_id}.xlsx").replace("\\", "/")
+    else:
+        excel_url = exports.download_url(analysis_id, "xlsx")
+    return [changed[position] for position in sorted(changed)], statistics, json_url, excel_url
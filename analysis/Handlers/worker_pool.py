@@ -0,0 +1,40 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from . import progress
+
+_pool = None
+
+
+def pool_size():
+    """Processes in the shared pool: enough for both page range extraction and batch parsing"""
+    return max(getattr(settings, "PDF_EXTRACTION_WORKERS", 1), getattr(settings, "BATCH_ANALYSIS_WORKERS", 1), 1)
+
+def get_pool():
+    """
+    One pool per server process, shared by every handler that fans work out (page
+    ranges of large PDFs, batch registers, semesters), instead of one pool each
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=pool_size())
+    return _pool
+
+def _report_tasks(results, total):
+    """Yield results, reporting progress as each task finishes"""
+    for done in range(total):
+        # Progress a task reports itself (only seen when run inline) fills in its share
+        with progress.part(done, total):
+            result = next(results)
+        progress.report(done + 1, total)
+        yield result
+
+def map_tasks(func, tasks, workers=None):
+    """
+    Map func over tasks in the pool, yielding results in task order.
+    Runs inline when there is only one worker or one task.
+    """
+    if workers is None:
+        workers = getattr(settings, "BATCH_ANALYSIS_WORKERS", 1)
+    if workers <= 1 or len(tasks) < 2:
+        return _report_tasks(map(func, tasks), len(tasks))
+    return _report_tasks(get_pool().map(func, tasks), len(tasks))
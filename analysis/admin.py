@@ -1,3 +1,8 @@
 from django.contrib import admin
+from .models import PaperResult, Register, SemesterPercentage, Student
 
 # Register your models here.
+admin.site.register(Register)
+admin.site.register(Student)
+admin.site.register(PaperResult)
+admin.site.register(SemesterPercentage)
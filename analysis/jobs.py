@@ -0,0 +1,124 @@
+import hashlib
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from uuid import uuid4
+from django.conf import settings
+from django.core.files import File
+from django.utils.datastructures import MultiValueDict
+from .Handlers import job_queue, progress
+
+logger = logging.getLogger(__name__)
+
+JOBS_DIR_NAME = "jobs"
+
+
+def _job_dir(job_id):
+    return os.path.join(settings.MEDIA_ROOT, JOBS_DIR_NAME, job_id)
+
+def submit(kind, files, params=None):
+    """
+    Spool a request's uploads next to the queue and enqueue them as a job.
+    params are the endpoint's URL arguments, if any.
+    Returns the job id; a worker later replays the endpoint on the spooled files.
+    """
+    job_id = uuid4().hex
+    job_dir = _job_dir(job_id)
+    os.makedirs(job_dir, exist_ok=True)
+
+    spooled = []
+    for field, uploads in files.lists():
+        for i, uploaded_file in enumerate(uploads):
+            path = os.path.join(job_dir, f"{field}_{i}")
+            sha256 = hashlib.sha256()
+            with open(path, "wb") as f:
+                for chunk in uploaded_file.chunks():
+                    sha256.update(chunk)
+                    f.write(chunk)
+            spooled.append({"field": field, "name": uploaded_file.name, "path": path, "sha256": sha256.hexdigest()})
+
+    job_queue.enqueue(kind, {"files": spooled, "params": params or {}}, job_id=job_id)
+    return job_id
+
+def run_job(job):
+    """Run a claimed job through its endpoint; returns (status_code, response body)"""
+    from .views import JOB_VIEWS
+
+    files = MultiValueDict()
+    opened = []
+    try:
+        for spooled in job["payload"]["files"]:
+            handle = open(spooled["path"], "rb")
+            opened.append(handle)
+            uploaded_file = File(handle, name=spooled["name"])
+            uploaded_file.sha256 = spooled["sha256"]
+            files.appendlist(spooled["field"], uploaded_file)
+
+        response = JOB_VIEWS[job["kind"]]().handle(files, **job["payload"].get("params", {}))
+        return response.status_code, response.data
+    finally:
+        for handle in opened:
+            handle.close()
+
+def _keep_lease(job_id, worker_id, stop, current):
+    """
+    Renew the job's lease every third of JOB_LEASE_SECONDS, and send the progress the
+    handlers report (current[0]) every JOB_PROGRESS_SECONDS while it changes.
+    """
+    lease_interval = getattr(settings, "JOB_LEASE_SECONDS", 300) / 3
+    interval = min(getattr(settings, "JOB_PROGRESS_SECONDS", 2), lease_interval)
+    reported = renewed = None
+    while not stop.wait(interval):
+        fraction = current[0]
+        if fraction == reported and time.monotonic() - renewed < lease_interval:
+            continue
+        if not job_queue.heartbeat(job_id, worker_id, fraction):
+            return
+        reported, renewed = fraction, time.monotonic()
+
+def work(poll_interval=1.0, max_jobs=None):
+    """Claim and run jobs until max_jobs have run (forever by default)"""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    processed = 0
+
+    while max_jobs is None or processed < max_jobs:
+        # Jobs abandoned on their final attempt will not run again, so their spooled uploads go
+        for job_id in job_queue.fail_expired():
+            shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+
+        job = job_queue.claim(worker_id)
+        if job is None:
+            if max_jobs is not None:
+                return processed
+            time.sleep(poll_interval)
+            continue
+
+        # The handlers report progress into current, which the lease keeper sends on
+        current = [0.0]
+
+        def report(fraction):
+            current[0] = fraction
+
+        stop = threading.Event()
+        lease_keeper = threading.Thread(target=_keep_lease, args=(job["id"], worker_id, stop, current), daemon=True)
+        lease_keeper.start()
+        try:
+            with progress.reporting(report):
+                status_code, body = run_job(job)
+            # Endpoint responses are final; only crashes are retried
+            job_queue.complete(job["id"], worker_id, {"status_code": status_code, "body": body}, failed=status_code >= 400)
+            shutil.rmtree(_job_dir(job["id"]), ignore_errors=True)
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {e}", exc_info=True)
+            job_queue.retry_or_fail(job["id"], worker_id, str(e))
+            if job["attempts"] >= job["max_attempts"]:
+                shutil.rmtree(_job_dir(job["id"]), ignore_errors=True)
+        finally:
+            stop.set()
+            lease_keeper.join()
+        processed += 1
+
+    return processed
@@ -0,0 +1,58 @@
+import json
+import subprocess
+import sys
+from statistics import median
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Run in a fresh interpreter per measurement: loads the WSGI application and the URLconf
+# as a new worker does (and with "preload", every heavy handler as the gunicorn master does)
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Marksheet_Analyzer_Server.settings")
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+from django.urls import get_resolver
+get_resolver().url_patterns
+if sys.argv[1] == "preload":
+    from analysis.Handlers.lazy import preload
+    preload()
+seconds = time.perf_counter() - start
+
+rss_mb = None
+try:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                rss_mb = int(line.split()[1]) / 1024
+except OSError:
+    import resource
+    # Peak rather than current RSS; kilobytes on Linux, bytes on macOS
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+
+libraries = ("pandas", "numpy", "openpyxl", "matplotlib", "fitz", "PyPDF2")
+print(json.dumps({"seconds": seconds, "rss_mb": rss_mb, "loaded": [name for name in libraries if name in sys.modules]}))
+"""
+
+
+class Command(BaseCommand):
+    help = "Measure the import time and memory of a freshly started worker, with and without preloading the analysis handlers."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start per mode; the median is reported.")
+
+    def handle(self, *args, **options):
+        for mode in ("lazy", "preload"):
+            samples = []
+            for _ in range(options["runs"]):
+                completed = subprocess.run(
+                    [sys.executable, "-c", PROBE, mode],
+                    cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+                )
+                samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+            seconds = median(sample["seconds"] for sample in samples)
+            rss_mb = median(sample["rss_mb"] for sample in samples)
+            loaded = ", ".join(samples[-1]["loaded"]) or "none"
+            self.stdout.write(f"{mode:>8}: {seconds * 1000:7.0f} ms  {rss_mb:6.1f} MB RSS  heavy libraries loaded: {loaded}")
@@ -0,0 +1,34 @@
+import multiprocessing
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+from analysis import jobs
+
+
+class Command(BaseCommand):
+    help = "Drain the analysis job queue with a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=getattr(settings, "JOB_WORKER_PROCESSES", 1),
+            help="Number of worker processes to run on this host."
+        )
+        parser.add_argument(
+            "--poll-interval", type=float, default=1.0,
+            help="Seconds to wait before polling an empty queue again."
+        )
+
+    def handle(self, *args, **options):
+        # Children must not share the parent's database connections
+        connections.close_all()
+
+        processes = [
+            multiprocessing.Process(target=jobs.work, kwargs={"poll_interval": options["poll_interval"]})
+            for _ in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"Started {len(processes)} analysis worker(s).")
+
+        for process in processes:
+            process.join()
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Register',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('analysis_id', models.CharField(db_index=True, max_length=64)),
+                ('kind', models.CharField(choices=[('result', 'Result register'), ('percentage', 'Semester percentages')], default='result', max_length=20)),
+                ('source_name', models.CharField(blank=True, max_length=255)),
+                ('json_file', models.CharField(blank=True, max_length=255)),
+                ('excel_file', models.CharField(blank=True, max_length=255)),
+                ('student_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Student',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField()),
+                ('seat_no', models.CharField(db_index=True, max_length=20)),
+                ('name', models.CharField(max_length=255)),
+                ('result', models.CharField(blank=True, max_length=20)),
+                ('sgpi', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('register', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='students', to='analysis.register')),
+            ],
+            options={
+                'ordering': ['register', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PaperResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveSmallIntegerField()),
+                ('paper_code', models.CharField(db_index=True, max_length=20)),
+                ('paper_name', models.CharField(blank=True, max_length=255)),
+                ('total', models.IntegerField(blank=True, null=True)),
+                ('grade', models.CharField(blank=True, max_length=5, null=True)),
+                ('register', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='paper_results', to='analysis.register')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='papers', to='analysis.student')),
+            ],
+            options={
+                'ordering': ['student', 'position'],
+            },
+        ),
+        migrations.CreateModel(
+            name='SemesterPercentage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('semester', models.PositiveSmallIntegerField(default=1)),
+                ('seat_no', models.CharField(blank=True, db_index=True, max_length=20)),
+                ('name', models.CharField(max_length=255)),
+                ('normalized_name', models.CharField(db_index=True, max_length=255)),
+                ('percentage', models.FloatField(blank=True, null=True)),
+                ('register', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='percentages', to='analysis.register')),
+            ],
+            options={
+                'ordering': ['register', 'semester', 'normalized_name'],
+                'indexes': [models.Index(fields=['register', 'semester', 'percentage'], name='analysis_se_registe_093ac4_idx')],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['register', 'seat_no'], name='analysis_st_registe_974d37_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['register', 'position'], name='analysis_st_registe_9df79a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['register', 'result'], name='analysis_st_registe_5639bd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paperresult',
+            index=models.Index(fields=['register', 'paper_code', 'grade'], name='analysis_pa_registe_673704_idx'),
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:55
+
+from django.db import migrations, models
+
+
+def rank_existing_rows(apps, schema_editor):
+    """Fill the sort indexes for registers stored before they existed"""
+    Register = apps.get_model('analysis', 'Register')
+    Student = apps.get_model('analysis', 'Student')
+    SemesterPercentage = apps.get_model('analysis', 'SemesterPercentage')
+
+    for register in Register.objects.all():
+        students = list(Student.objects.filter(register=register))
+        students.sort(key=lambda student: (student.sgpi is None, -(student.sgpi or 0), student.position))
+        for rank, student in enumerate(students, 1):
+            student.sgpi_rank = rank
+        Student.objects.bulk_update(students, ['sgpi_rank'], batch_size=1000)
+
+        records = list(SemesterPercentage.objects.filter(register=register))
+        records.sort(key=lambda record: (record.semester, record.percentage is None, -(record.percentage or 0), record.normalized_name))
+        rank = 0
+        for i, record in enumerate(records):
+            rank = 1 if i == 0 or records[i - 1].semester != record.semester else rank + 1
+            record.percentage_rank = rank
+        SemesterPercentage.objects.bulk_update(records, ['percentage_rank'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('analysis', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='semesterpercentage',
+            name='percentage_rank',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='sgpi_rank',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='semesterpercentage',
+            index=models.Index(fields=['register', 'semester', 'normalized_name'], name='analysis_se_registe_1ea3f2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='semesterpercentage',
+            index=models.Index(fields=['register', 'semester', 'percentage_rank'], name='analysis_se_registe_55a521_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['register', 'name'], name='analysis_st_registe_bcd11f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='student',
+            index=models.Index(fields=['register', 'sgpi_rank'], name='analysis_st_registe_84da76_idx'),
+        ),
+        migrations.RunPython(rank_existing_rows, migrations.RunPython.noop),
+    ]
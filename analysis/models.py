@@ -1,3 +1,89 @@
 from django.db import models
 
-# Create your models here.
+
+class Register(models.Model):
+    """One analyzed PDF; analysis_id is the id its JSON/Excel artifacts are named after"""
+    RESULT = "result"
+    PERCENTAGE = "percentage"
+    KIND_CHOICES = [
+        (RESULT, "Result register"),
+        (PERCENTAGE, "Semester percentages"),
+    ]
+
+    analysis_id = models.CharField(max_length=64, db_index=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, default=RESULT)
+    source_name = models.CharField(max_length=255, blank=True)
+    json_file = models.CharField(max_length=255, blank=True)
+    excel_file = models.CharField(max_length=255, blank=True)
+    student_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.analysis_id} {self.source_name}".strip()
+
+
+class Student(models.Model):
+    register = models.ForeignKey(Register, on_delete=models.CASCADE, related_name="students")
+    # Order of the student in the register's artifacts
+    position = models.PositiveIntegerField()
+    seat_no = models.CharField(max_length=20, db_index=True)
+    name = models.CharField(max_length=255)
+    result = models.CharField(max_length=20, blank=True)
+    sgpi = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    # Precomputed sort index: 1 is the highest SGPI in the register, students without one come last
+    sgpi_rank = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["register", "position"]
+        indexes = [
+            models.Index(fields=["register", "seat_no"]),
+            models.Index(fields=["register", "position"]),
+            models.Index(fields=["register", "result"]),
+            models.Index(fields=["register", "name"]),
+            models.Index(fields=["register", "sgpi_rank"]),
+        ]
+
+    def __str__(self):
+        return f"{self.seat_no} {self.name}"
+
+
+class PaperResult(models.Model):
+    # register is denormalized so per-register paper aggregates need no join
+    register = models.ForeignKey(Register, on_delete=models.CASCADE, related_name="paper_results")
+    student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name="papers")
+    position = models.PositiveSmallIntegerField()
+    paper_code = models.CharField(max_length=20, db_index=True)
+    paper_name = models.CharField(max_length=255, blank=True)
+    total = models.IntegerField(null=True, blank=True)
+    grade = models.CharField(max_length=5, null=True, blank=True)
+
+    class Meta:
+        ordering = ["student", "position"]
+        indexes = [
+            models.Index(fields=["register", "paper_code", "grade"]),
+        ]
+
+    def __str__(self):
+        return f"{self.paper_code} {self.total} {self.grade}"
+
+
+class SemesterPercentage(models.Model):
+    register = models.ForeignKey(Register, on_delete=models.CASCADE, related_name="percentages")
+    semester = models.PositiveSmallIntegerField(default=1)
+    seat_no = models.CharField(max_length=20, blank=True, db_index=True)
+    name = models.CharField(max_length=255)
+    normalized_name = models.CharField(max_length=255, db_index=True)
+    percentage = models.FloatField(null=True, blank=True)
+    # Precomputed sort index: 1 is the highest percentage in the register's semester
+    percentage_rank = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["register", "semester", "normalized_name"]
+        indexes = [
+            models.Index(fields=["register", "semester", "percentage"]),
+            models.Index(fields=["register", "semester", "normalized_name"]),
+            models.Index(fields=["register", "semester", "percentage_rank"]),
+        ]
+
+    def __str__(self):
+        return f"{self.name} Sem{self.semester}: {self.percentage}"
@@ -1,3 +1,849 @@
-from django.test import TestCase
+import importlib.util
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import struct
+import zipfile
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+import fitz
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils.datastructures import MultiValueDict
+
+from . import jobs
+from .views import PassFailAnalysisView
+from .models import Register, Student
+from .Handlers.excel_handler import _excel_value, clean_percentage_values, ledger_rows, merge_semester_dfs, split_exam_totals
+from .Handlers.PDFPercentageAnalyzer import merge_results, normalize_name
+from .Handlers.revaluation import _build_row_index, _patch_rows, _splice_rows
+from .Handlers import job_queue, result_cache
+from .Handlers.result_store import _sgpi_order, save_percentages, save_register, upsert_students
+
+
+def semester(*students):
+    """Semester data as merge_results takes it, from (seat_no, name, percentage) tuples"""
+    return {
+        normalize_name(name): {'original_name': name, 'seat_no': seat_no, 'percentage': percentage}
+        for seat_no, name, percentage in students
+    }
+
+
+class MergeResultsTests(SimpleTestCase):
+    def by_name(self, results):
+        return {result['Name']: result for result in results}
+
+    def test_reissued_seat_number_does_not_join_different_students(self):
+        # Seat 100 went to another student in the second exam
+        results = self.by_name(merge_results(
+            semester(('100', 'RAHUL SHARMA', 70.0)),
+            semester(('100', 'RAHUL VERMA', 65.0), ('200', 'RAHUL SHARMA', 72.0)),
+        ))
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(results['RAHUL SHARMA']['Percentage Sem1'], 70.0)
+        self.assertEqual(results['RAHUL SHARMA']['Percentage Sem2'], 72.0)
+        self.assertEqual(results['RAHUL SHARMA']['Match Confidence'], 1.0)
+        self.assertIsNone(results['RAHUL VERMA']['Percentage Sem1'])
+        self.assertEqual(results['RAHUL VERMA']['Percentage Sem2'], 65.0)
+
+    def test_reissued_seat_number_without_the_name_in_the_next_semester(self):
+        results = self.by_name(merge_results(
+            semester(('100', 'RAHUL SHARMA', 70.0)),
+            semester(('100', 'RAHUL VERMA', 65.0)),
+        ))
+
+        self.assertEqual(len(results), 2)
+        self.assertIsNone(results['RAHUL SHARMA']['Percentage Sem2'])
+
+    def test_seat_number_joins_a_respelled_name(self):
+        results = merge_results(
+            semester(('100', 'PRIYANKA DESHPANDE', 80.0)),
+            semester(('100', 'PRIYANKA DESHPANDEY', 84.0)),
+        )
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['Average'], 82.0)
+        self.assertLess(results[0]['Match Confidence'], 1.0)
+
+    def test_seat_number_separates_students_with_the_same_name(self):
+        results = merge_results(
+            semester(('100', 'AMIT KUMAR', 60.0)),
+            semester(('100', 'AMIT KUMAR', 62.0)),
+        )
+
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['Percentage Sem2'], 62.0)
+        self.assertEqual(results[0]['Match Confidence'], 1.0)
+
+
+class UpsertStudentsTests(TestCase):
+    def record(self, seat_no, sgpi):
+        return {"seat_no": seat_no, "name": f"STUDENT {seat_no}", "result": "", "sgpi": sgpi, "papers": []}
+
+    def test_ranks_match_a_full_sort_after_an_upsert(self):
+        results = [self.record(f"{seat}", sgpi) for seat, sgpi in
+                   enumerate([7.5, None, 9.1, 7.5, 6.0, None, 8.2, 9.1])]
+        save_register("analysis", results)
+
+        changed = {
+            1: self.record("1", 8.2),      # gains an SGPI
+            2: self.record("2", None),     # loses it
+            6: self.record("6", 5.0),      # drops
+            8: self.record("8", 9.1),      # appended, tied with the top
+            9: self.record("9", None),     # appended without an SGPI
+        }
+        upsert_students("analysis", changed)
+
+        students = {**dict(enumerate(results)), **changed}
+        self.assertRanksMatchAFullSort(students)
+
+    def test_ranks_match_a_full_sort_after_repeated_upserts(self):
+        rng = random.Random(14)
+        sgpi = lambda: rng.choice([None, round(rng.uniform(4, 10), 2), 7.5])
+        students = {position: self.record(f"{position}", sgpi()) for position in range(60)}
+        save_register("analysis", [students[position] for position in range(60)])
+
+        for _ in range(5):
+            positions = rng.sample(range(len(students) + 3), 8)
+            changed = {position: self.record(f"{position}", sgpi()) for position in positions if position < len(students)}
+            changed.update((position, self.record(f"{position}", sgpi())) for position in range(len(students), len(students) + 2))
+            upsert_students("analysis", changed)
+            students.update(changed)
+            self.assertRanksMatchAFullSort(students)
+
+    def assertRanksMatchAFullSort(self, students):
+        expected = sorted(students, key=lambda position: _sgpi_order(students[position]["sgpi"], position))
+        ranks = dict(Student.objects.values_list("position", "sgpi_rank"))
+        self.assertEqual([ranks[position] for position in expected], list(range(1, len(students) + 1)))
+
+
+def loop_exam_totals(df_data, exam_total_col='ExamTotal', outof_col='OUTOF'):
+    """The per-row loop split_exam_totals replaced"""
+    percentages = []
+    exam_totals = []
+    for idx, value in enumerate(df_data[exam_total_col]):
+        if pd.isna(value):
+            percentages.append('')
+            exam_totals.append('')
+            continue
+        parts = str(value).strip().split()
+        if len(parts) >= 2:
+            numeric_score = re.sub(r'@.*', '', parts[-1])
+            if parts[0] == '--':
+                try:
+                    outof_value = float(df_data.iloc[idx][outof_col])
+                    percentages.append(f"{float(numeric_score) / outof_value * 100:.2f}%")
+                except Exception:
+                    percentages.append('--')
+            else:
+                percentages.append(parts[0])
+            exam_totals.append(numeric_score)
+        else:
+            percentages.append('--')
+            exam_totals.append('')
+    return percentages, exam_totals
+
+def loop_ledger_rows(df_original, new_df):
+    """The row-by-row reconstruction ledger_rows replaced"""
+    final_rows = []
+    for i in range(4):
+        row = df_original.iloc[i].tolist()
+        final_rows.append(row + [None] * (len(new_df.columns) - len(row)))
+    final_rows.append(list(new_df.columns))
+    for i in range(len(new_df)):
+        final_rows.append(new_df.iloc[i].tolist())
+    return final_rows
+
+def same_cells(test, actual, expected):
+    """Compare lists of cells, treating NaNs as equal"""
+    test.assertEqual(len(actual), len(expected))
+    for a, e in zip(actual, expected):
+        if isinstance(e, float) and np.isnan(e):
+            test.assertTrue(isinstance(a, float) and np.isnan(a), f"{a!r} is not NaN")
+        else:
+            test.assertEqual((type(a), a), (type(e), e))
+
+
+class LedgerTransformTests(SimpleTestCase):
+    # (ExamTotal, OUTOF) rows, one frame per case
+    CASES = {
+        "given percentages": [("61.93% 545@1", 880), ("70.00% 616", 880)],
+        "calculated": [("-- 545@1", 880), ("-- 616", "880")],
+        "empty and single part cells": [(np.nan, 880), ("545", 880), ("  ", 880)],
+        "missing OUTOF": [("-- 545@1", np.nan), ("-- 545", None)],
+        "zero OUTOF": [("-- 545", 0), ("-- 545", 0.0)],
+        "non-numeric OUTOF": [("-- 545", "N/A"), ("-- 545", "--")],
+        "non-numeric score": [("-- AB", 880), ("-- 5x@1", 880)],
+        "float() spellings": [("-- 1_000", 880), ("-- nan", 880), ("-- 1e3", 880), ("-- 545", "1_000")],
+        "numeric cells": [(545, 880), (61.5, 880)],
+    }
+
+    def frame(self, rows, outof=True):
+        df = pd.DataFrame(rows, columns=["ExamTotal", "OUTOF"])
+        df.insert(0, "Name", [f"STUDENT {i}" for i in range(len(df))])
+        return df if outof else df.drop(columns="OUTOF")
+
+    def test_split_exam_totals_matches_the_row_loop(self):
+        for case, rows in self.CASES.items():
+            for outof in (True, False):
+                with self.subTest(case, outof=outof):
+                    df = self.frame(rows, outof)
+                    percentages, exam_totals = split_exam_totals(df)
+                    self.assertEqual((percentages.tolist(), exam_totals.tolist()), loop_exam_totals(df))
+
+    def test_split_exam_totals_worked_out_percentages(self):
+        percentages, _ = split_exam_totals(self.frame([("-- 1_000", 880), ("-- 545", np.nan), ("-- 545", 0)]))
+        self.assertEqual(percentages.tolist(), ["113.64%", "nan%", "--"])
+
+    def test_ledger_rows_match_the_row_loop(self):
+        df_original = pd.DataFrame([["University", None, None], ["Ledger", 2024, None], [None, None, None], [1, 2.5, "x"], ["Name", "ExamTotal", "OUTOF"]])
+        for case, rows in self.CASES.items():
+            with self.subTest(case):
+                new_df = self.frame(rows)
+                new_df.insert(1, "Percentage", split_exam_totals(new_df)[0])
+                new_df["Seats"] = range(len(new_df))
+                expected = loop_ledger_rows(df_original, new_df)
+                actual = ledger_rows(df_original, new_df)
+                self.assertEqual(len(actual), len(expected))
+                # Compared as the workbook writes them, so numpy and Python scalars are alike
+                for actual_row, expected_row in zip(actual, expected):
+                    same_cells(self, list(map(_excel_value, actual_row)), list(map(_excel_value, expected_row)))
+
+
+def semester_df(semester, rows):
+    """A preprocessed semester frame from (roll no, name, percentage) rows"""
+    df = pd.DataFrame(rows, columns=["ROLLNO", "NAME", f"Percentage {semester}"])
+    df["ROLLNO_PRE"] = df["ROLLNO"].astype(str).str.upper().str.strip()
+    df["NAME_PRE"] = df["NAME"].astype(str).str.upper().str.strip()
+    return df[["ROLLNO", "NAME", "ROLLNO_PRE", "NAME_PRE", f"Percentage {semester}"]]
+
+def chained_merge(dfs):
+    """The chain of outer merges merge_semester_dfs replaced"""
+    merged = dfs[0]
+    for df in dfs[1:]:
+        merged = pd.merge(merged, df, on=["ROLLNO_PRE", "NAME_PRE"], how="outer", suffixes=("", "_right"))
+        for col in ["ROLLNO", "NAME"]:
+            merged[col] = merged[col].combine_first(merged[col + "_right"])
+            merged = merged.drop(col + "_right", axis=1)
+    return merged.drop(["ROLLNO_PRE", "NAME_PRE"], axis=1)
+
+def loop_percentage_value(value):
+    """The per-value cleanup clean_percentage_values replaced"""
+    try:
+        if pd.isna(value):
+            return np.nan
+        text = str(value).strip()
+        if text in ('--', ''):
+            return np.nan
+        return float(text.replace('%', ''))
+    except Exception:
+        return np.nan
+
+
+class SemesterAverageTests(SimpleTestCase):
+    def rows(self, merged):
+        return merged.astype(object).where(merged.notna(), None).values.tolist()
+
+    def test_matches_the_chained_merges_for_unique_keys(self):
+        cases = {
+            "same students": [[(1, "A", 50.0), (2, "B", 60.0)], [(1, "A", 55.0), (2, "B", 65.0)]],
+            "joiners and leavers": [[(1, "A", 50.0), (3, "C", 70.0)], [(1, "a ", 55.0), (4, "D", np.nan)], [(4, "D", 80.0)]],
+            "without roll numbers": [[(1, "A", 50.0), (np.nan, "B", 60.0)], [(np.nan, "B", 65.0), (np.nan, "E", 90.0)]],
+        }
+        for case, semesters in cases.items():
+            with self.subTest(case):
+                dfs = [semester_df(i, rows) for i, rows in enumerate(semesters, 1)]
+                merged = merge_semester_dfs(dfs, len(dfs))
+                self.assertEqual(self.rows(merged.drop(columns="Average Percentage")), self.rows(chained_merge(dfs)))
+
+    def test_duplicate_keys_keep_the_first_record_of_each_semester(self):
+        # The chained merges gave one row per pair of duplicates
+        dfs = [
+            semester_df(1, [(1, "A", 50.0), (1, "A", 52.0), (np.nan, "B", 60.0), (np.nan, "B", 62.0)]),
+            semester_df(2, [(1, "A", 55.0), (np.nan, "B", 65.0), (np.nan, "B", 67.0)]),
+        ]
+        self.assertEqual(self.rows(merge_semester_dfs(dfs, 2)), [
+            [1.0, "A", 50.0, 55.0, 52.5],
+            [None, "B", 60.0, 65.0, 62.5],
+        ])
+
+    def test_clean_percentage_values_matches_the_value_loop(self):
+        cases = {
+            "percent strings": ["61.93%", " 70 % ", "100%"],
+            "no number": ["--", "", "  ", "AB", None, np.nan],
+            "numeric cells": [61.93, 70, 0],
+            "float() spellings": ["1_000%", "nan", "1e2%", "inf"],
+        }
+        for case, values in cases.items():
+            with self.subTest(case):
+                values = pd.Series(values, dtype=object)
+                same_cells(self, clean_percentage_values(values).tolist(), [loop_percentage_value(value) for value in values])
+
+
+# The sample register shipped in uploads/ (103 students)
+SAMPLE_REGISTER = settings.BASE_DIR / "uploads" / "1586fd09-39f1-46f7-aeff-396f1e6645a1.pdf"
+
+
+class MediaTestCase(TestCase):
+    """Runs each test against an empty MEDIA_ROOT and job queue"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root,
+            JOB_QUEUE_PATH=os.path.join(media_root, "jobs.sqlite3"),
+            RESULT_CACHE_ENABLED=True,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+
+    def upload(self, url, field="marksheet", path=SAMPLE_REGISTER, **extra):
+        with open(path, "rb") as f:
+            return self.client.post(url, {field: f}, **extra)
+
+    def cache_entries(self):
+        cache_dir = os.path.join(self.media_root, "cache")
+        entries = []
+        for name in sorted(os.listdir(cache_dir)):
+            with open(os.path.join(cache_dir, name), encoding="utf-8") as f:
+                entries.append(json.load(f))
+        return entries
+
+
+class ResultCacheTests(MediaTestCase):
+    def artifact(self, name, size=100):
+        path = os.path.join(self.media_root, name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        return path
+
+    def test_identical_uploads_are_answered_from_the_cache(self):
+        with override_settings(LAZY_ARTIFACTS=False):
+            first = self.upload("/analysis/get-analysis-data/").json()
+            second = self.upload("/analysis/get-analysis-data/").json()
+
+        self.assertEqual(second["analysis_id"], first["analysis_id"])
+        self.assertEqual(second["results"], first["results"])
+        self.assertEqual(second["files"], first["files"])
+        self.assertEqual(Register.objects.count(), 1)
+
+    def test_keys_depend_on_endpoint_version_and_inputs(self):
+        key = result_cache.make_key("get-analysis-data", 1, "a", "b")
+        self.assertEqual(key, result_cache.make_key("get-analysis-data", 1, "a", "b"))
+        for other in [("pass-fail-analysis", 1, "a", "b"), ("get-analysis-data", 2, "a", "b"), ("get-analysis-data", 1, "b", "a")]:
+            with self.subTest(other):
+                self.assertNotEqual(key, result_cache.make_key(*other))
+
+    def test_entries_are_evicted_least_recently_used_first(self):
+        paths = {}
+        for age, key in enumerate(["newest", "middle", "oldest"]):
+            paths[key] = self.artifact(key)
+            result_cache.store(key, {"key": key}, [paths[key]])
+            # Entries stored in the same instant would tie on mtime
+            entry_path = os.path.join(self.media_root, "cache", f"{key}.json")
+            os.utime(entry_path, (1000 - age, 1000 - age))
+
+        # A hit makes the oldest entry the most recently used
+        self.assertEqual(result_cache.lookup("oldest"), {"key": "oldest"})
+        entry_size = os.path.getsize(os.path.join(self.media_root, "cache", "newest.json"))
+        result_cache.evict(max_bytes=2 * (100 + entry_size))
+
+        self.assertIsNone(result_cache.lookup("middle"))
+        self.assertFalse(os.path.exists(paths["middle"]))
+        self.assertEqual(result_cache.lookup("newest"), {"key": "newest"})
+        self.assertEqual(result_cache.lookup("oldest"), {"key": "oldest"})
+
+    def test_released_artifacts_are_kept_but_no_longer_hit(self):
+        path = self.artifact("results.json")
+        result_cache.store("key", {}, [path])
+        result_cache.release(path)
+
+        self.assertIsNone(result_cache.lookup("key"))
+        self.assertTrue(os.path.exists(path))
+
+    @override_settings(RESULT_CACHE_ENABLED=False)
+    def test_disabled_cache_never_hits(self):
+        result_cache.store("key", {}, [self.artifact("results.json")])
+        self.assertIsNone(result_cache.lookup("key"))
+
+
+@override_settings(LAZY_ARTIFACTS=True)
+class LazyArtifactCacheTests(MediaTestCase):
+    def test_repeated_upload_is_a_cache_hit(self):
+        first = self.upload("/analysis/get-analysis-data/").json()
+        second = self.upload("/analysis/get-analysis-data/").json()
+
+        self.assertTrue(second["success"])
+        self.assertEqual(second["analysis_id"], first["analysis_id"])
+        self.assertEqual(second["results"], first["results"])
+        self.assertEqual(Student.objects.filter(register__analysis_id=first["analysis_id"]).count(), 103)
+
+    def test_artifacts_built_on_download_are_owned_by_the_entry(self):
+        analysis_id = self.upload("/analysis/get-analysis-data/").json()["analysis_id"]
+        response = self.client.get(f"/analysis/artifacts/{analysis_id}/xlsx/")
+        b"".join(response.streaming_content)
+        xlsx_path = os.path.join(self.media_root, "uploads", f"{analysis_id}.xlsx")
+
+        [entry] = self.cache_entries()
+        self.assertIn(xlsx_path, entry["artifacts"])
+        self.assertEqual(self.upload("/analysis/get-analysis-data/").json()["analysis_id"], analysis_id)
+
+    def test_a_miss_deletes_the_files_of_the_entry(self):
+        analysis_id = self.upload("/analysis/get-analysis-data/").json()["analysis_id"]
+        upload_dir = os.path.join(self.media_root, "uploads")
+        os.remove(os.path.join(upload_dir, f"{analysis_id}.json"))
+
+        second = self.upload("/analysis/get-analysis-data/").json()
+        self.assertNotEqual(second["analysis_id"], analysis_id)
+        self.assertEqual([name for name in os.listdir(upload_dir) if name.startswith(analysis_id)], [])
+
+    def test_eviction_removes_artifacts_built_on_download(self):
+        analysis_id = self.upload("/analysis/get-analysis-data/").json()["analysis_id"]
+        b"".join(self.client.get(f"/analysis/artifacts/{analysis_id}/xlsx/").streaming_content)
+
+        result_cache.evict(max_bytes=0)
+        upload_dir = os.path.join(self.media_root, "uploads")
+        self.assertEqual([name for name in os.listdir(upload_dir) if name.startswith(analysis_id)], [])
+        self.assertEqual(os.listdir(os.path.join(self.media_root, "cache")), [])
+
+
+@override_settings(LAZY_ARTIFACTS=True)
+class ArtifactViewTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.analysis_id = self.upload("/analysis/get-analysis-data/").json()["analysis_id"]
+        self.url = f"/analysis/artifacts/{self.analysis_id}/xlsx/"
+
+    def test_validators_answer_304(self):
+        response = self.client.get(self.url)
+        b"".join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Cache-Control"], "no-cache")
+
+        for header, value in [("HTTP_IF_NONE_MATCH", response["ETag"]), ("HTTP_IF_MODIFIED_SINCE", response["Last-Modified"])]:
+            with self.subTest(header):
+                revalidated = self.client.get(self.url, **{header: value})
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(revalidated["ETag"], response["ETag"])
+
+    def test_changed_results_change_the_etag_and_rebuild(self):
+        response = self.client.get(self.url)
+        b"".join(response.streaming_content)
+        xlsx_path = os.path.join(self.media_root, "uploads", f"{self.analysis_id}.xlsx")
+        built = os.stat(xlsx_path).st_mtime_ns
+
+        # As after a revaluation: the results are newer than the built workbook
+        json_path = os.path.join(self.media_root, "uploads", f"{self.analysis_id}.json")
+        later = os.stat(json_path).st_mtime + 10
+        os.utime(json_path, (later, later))
+
+        changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        b"".join(changed.streaming_content)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], response["ETag"])
+        self.assertGreater(os.stat(xlsx_path).st_mtime_ns, built)
+
+    def test_unknown_artifacts(self):
+        for url in [
+            "/analysis/artifacts/not-an-id/xlsx/",
+            "/analysis/artifacts/0f8fad5b-d9cb-469f-a165-70867728950e/xlsx/",
+            f"/analysis/artifacts/{self.analysis_id}/pdf/",
+            f"/analysis/artifacts/{self.analysis_id}/json-compact/",
+        ]:
+            with self.subTest(url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class ExportFormatTests(MediaTestCase):
+    def test_analysis_id_is_reported_for_every_format(self):
+        for export_format in ["xlsx", "csv", "json-compact"]:
+            with self.subTest(export_format):
+                url = f"/analysis/get-analysis-data/?format={export_format}"
+                first = self.upload(url).json()
+                cached = self.upload(url).json()
+
+                self.assertTrue(Register.objects.filter(analysis_id=first["analysis_id"]).exists())
+                self.assertEqual(cached["analysis_id"], first["analysis_id"])
+                self.assertEqual(list(first["files"]), [export_format])
+
+    def media_file(self, url):
+        return os.path.join(self.media_root, url[len(settings.MEDIA_URL):])
+
+    def download(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    @override_settings(LAZY_ARTIFACTS=False)
+    def test_requested_formats_are_written(self):
+        body = self.upload("/analysis/get-analysis-data/?format=csv,json-compact,xlsx").json()
+
+        self.assertEqual(list(body["files"]), ["csv", "json-compact", "xlsx"])
+        with open(self.media_file(body["json_file"]), encoding="utf-8") as f:
+            compact = f.read()
+        self.assertEqual(compact, json.dumps(body["results"], separators=(",", ":"), ensure_ascii=False))
+        table = pd.read_csv(self.media_file(body["files"]["csv"]), dtype=str)
+        self.assertEqual(table["Seat No"].tolist(), [student["seat_no"] for student in body["results"]])
+        workbook = pd.read_excel(self.media_file(body["excel_file"]), dtype=str)
+        self.assertEqual(list(workbook.columns), list(table.columns))
+
+    def test_lazy_formats_match_the_eager_ones(self):
+        with override_settings(LAZY_ARTIFACTS=False):
+            eager = self.upload("/analysis/get-analysis-data/?format=csv").json()
+        with override_settings(LAZY_ARTIFACTS=True):
+            lazy = self.upload("/analysis/get-analysis-data/?format=json,csv").json()
+
+        self.assertEqual(lazy["files"]["csv"], f"/analysis/artifacts/{lazy['analysis_id']}/csv/")
+        with open(self.media_file(eager["files"]["csv"]), "rb") as f:
+            self.assertEqual(self.download(lazy["files"]["csv"]), f.read())
+
+    def test_invalid_formats_are_rejected(self):
+        cases = ["pdf", "json,json-compact"]
+        if importlib.util.find_spec("pyarrow") is None:
+            cases.append("parquet")
+        for export_format in cases:
+            with self.subTest(export_format):
+                response = self.upload(f"/analysis/get-analysis-data/?format={export_format}")
+                self.assertEqual(response.status_code, 400)
+        self.assertFalse(Register.objects.exists())
+
+
+class RevaluationTests(MediaTestCase):
+    def results_file(self, students, layout):
+        path = os.path.join(self.media_root, "results.json")
+        with open(path, "w", encoding="utf-8") as f:
+            if layout == "json-compact":
+                json.dump(students, f, separators=(",", ":"), ensure_ascii=False)
+            else:
+                json.dump(students, f, indent=2, ensure_ascii=False)
+        return path
+
+    def test_rows_are_patched_in_place_when_they_fit(self):
+        students = [{"seat_no": f"{seat}", "name": f"STUDENT {seat}", "result": "Unsuccessful"} for seat in range(5)]
+        changed = {
+            1: {"seat_no": "1", "name": "STUDENT 1", "result": "Successful"},    # shorter
+            5: {"seat_no": "5", "name": "STUDENT 5", "result": "Successful"},    # appended
+        }
+        for layout in ["json", "json-compact"]:
+            with self.subTest(layout):
+                path = self.results_file(students, layout)
+                index, _ = _build_row_index(path)
+                patched = _patch_rows(path, index, changed, layout)
+
+                expected = students[:1] + [changed[1]] + students[2:] + [changed[5]]
+                with open(path, encoding="utf-8") as f:
+                    self.assertEqual(json.load(f), expected)
+                self.assertEqual(patched, _build_row_index(path)[0])
+
+    def test_rows_that_outgrow_their_span_are_spliced(self):
+        students = [{"seat_no": f"{seat}", "name": f"STUDENT {seat}", "result": "Successful"} for seat in range(5)]
+        changed = {2: {"seat_no": "2", "name": "STUDENT 2", "result": "Unsuccessful"}}
+        path = self.results_file(students, "json")
+        index, _ = _build_row_index(path)
+        with open(path, "rb") as f:
+            before = f.read()
+
+        self.assertIsNone(_patch_rows(path, index, changed, "json"))
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual(_splice_rows(path, index, changed, "json"), _build_row_index(path)[0])
+        with open(path, encoding="utf-8") as f:
+            self.assertEqual(json.load(f), students[:2] + [changed[2]] + students[3:])
+
+    def test_other_kinds_of_analysis_are_rejected(self):
+        analysis_id = "0f8fad5b-d9cb-469f-a165-70867728950e"
+        upload_dir = os.path.join(self.media_root, "uploads")
+        os.makedirs(upload_dir)
+        with open(os.path.join(upload_dir, f"{analysis_id}.json"), "w", encoding="utf-8") as f:
+            json.dump([{"Seat No": "1", "Name": "STUDENT 1", "Percentage": 61.5}], f)
+        with open(os.path.join(upload_dir, f"{analysis_id}.manifest.json"), "w", encoding="utf-8") as f:
+            json.dump({"kind": "percentage", "results": "json", "extra": {}}, f)
+
+        response = self.upload(f"/analysis/revaluation/{analysis_id}/")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(response.json()["success"])
+
+
+class JobQueueTests(MediaTestCase):
+    def test_async_request_is_run_by_a_worker(self):
+        response = self.upload("/analysis/get-analysis-data/?async=1")
+        self.assertEqual(response.status_code, 202)
+        queued = self.client.get(response.json()["status_url"]).json()
+        self.assertEqual(queued["status"], job_queue.QUEUED)
+
+        self.assertEqual(jobs.work(max_jobs=1), 1)
+
+        done = self.client.get(response.json()["status_url"]).json()
+        self.assertEqual(done["status"], job_queue.DONE)
+        self.assertEqual(done["progress"], 1)
+        self.assertEqual(done["status_code"], 200)
+        self.assertEqual(done["result"], self.upload("/analysis/get-analysis-data/").json())
+        # The spooled uploads go once the job is done
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, "jobs", done["job_id"])))
+
+    def test_failed_endpoint_responses_are_final(self):
+        job_id = jobs.submit("get-analysis-data", MultiValueDict(), {"formats": ["json"]})
+        jobs.work(max_jobs=1)
+
+        job = job_queue.get(job_id)
+        self.assertEqual(job["status"], job_queue.FAILED)
+        self.assertEqual(job["attempts"], 1)
+        self.assertEqual(job["result"]["status_code"], 400)
+
+    @override_settings(JOB_LEASE_SECONDS=-1)
+    def test_expired_leases_are_claimed_again_until_out_of_attempts(self):
+        job_id = job_queue.enqueue("get-analysis-data", {"files": []}, max_attempts=2)
+
+        self.assertEqual(job_queue.claim("worker-1")["id"], job_id)
+        self.assertEqual(job_queue.fail_expired(), [])
+        reclaimed = job_queue.claim("worker-2")
+        self.assertEqual((reclaimed["id"], reclaimed["attempts"]), (job_id, 2))
+        self.assertFalse(job_queue.heartbeat(job_id, "worker-1"))
+
+        self.assertIsNone(job_queue.claim("worker-3"))
+        self.assertEqual(job_queue.fail_expired(), [job_id])
+        self.assertEqual(job_queue.get(job_id)["status"], job_queue.FAILED)
+
+    def test_unknown_job(self):
+        self.assertEqual(self.client.get("/analysis/jobs/missing/").status_code, 404)
+
+
+@override_settings(BATCH_ANALYSIS_WORKERS=1)
+class BatchAnalysisTests(MediaTestCase):
+    def zip_file(self, name, members):
+        buffer = BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            for member, data in members.items():
+                archive.writestr(member, data)
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="application/zip")
+
+    def post_batch(self, *files):
+        return self.client.post("/analysis/batch-analysis-data/", {"files": list(files)})
+
+    def test_pdfs_inside_and_outside_zips_are_analyzed(self):
+        register = SAMPLE_REGISTER.read_bytes()
+        blank = fitz.open()
+        blank.new_page()
+        archive = self.zip_file("registers.zip", {
+            "sem1/register.pdf": register,
+            "sem2/register.pdf": register,
+            "__MACOSX/sem1/._register.pdf": b"",
+            "notes.txt": b"not a register",
+            "blank.pdf": blank.tobytes(),
+        })
+        response = self.post_batch(archive, SimpleUploadedFile("register.pdf", register, content_type="application/pdf"))
+
+        body = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body["registers"], 4)
+        self.assertEqual(body["failed_registers"], 1)
+        self.assertEqual([item["file"] for item in body["summary"]], ["sem1/register.pdf", "sem2/register.pdf", "blank.pdf", "register.pdf"])
+        self.assertEqual([item["students"] for item in body["summary"]], [103, 103, 0, 103])
+        self.assertEqual([item["sheet"] for item in body["summary"]], ["register", "register (2)", None, "register (3)"])
+
+    def test_zips_over_the_limits_are_rejected_before_extraction(self):
+        register = SAMPLE_REGISTER.read_bytes()
+        limits = {
+            "files": ({"BATCH_MAX_FILES": 1}, "at most 1 PDFs"),
+            "bytes": ({"BATCH_MAX_BYTES": len(register) - 1}, f"at most {len(register) - 1} bytes"),
+        }
+        for case, (limit, message) in limits.items():
+            with self.subTest(case), override_settings(**limit):
+                archive = self.zip_file("registers.zip", {"a.pdf": register, "b.pdf": register})
+                response = self.post_batch(archive)
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, response.json()["message"])
+                self.assertFalse(Register.objects.exists())
+
+    def test_invalid_uploads(self):
+        cases = {
+            "corrupt zip": (SimpleUploadedFile("registers.zip", b"PK not really a zip"), "not a valid ZIP file"),
+            "no pdfs": (self.zip_file("registers.zip", {"notes.txt": b"text"}), "No PDF files found"),
+        }
+        for case, (upload, message) in cases.items():
+            with self.subTest(case):
+                response = self.post_batch(upload)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, response.json()["message"])
+
+
+class StoredResultQueryTests(TestCase):
+    def setUp(self):
+        rng = random.Random(16)
+        self.students = [{
+            "seat_no": f"{1000 + position}",
+            "name": f"STUDENT {rng.choice('ABC')}{position:02d}",
+            "result": rng.choice(["Successful", "Unsuccessful"]),
+            "sgpi": rng.choice([None, 7.5, round(rng.uniform(4, 10), 2)]),
+            "papers": [{"paper_code": f"P{paper}", "paper_name": f"Paper {paper}", "total": 50, "grade": rng.choice("ABF")} for paper in range(3)],
+        } for position in range(40)]
+        save_register("analysis", self.students, "register.pdf")
+
+    def get(self, path, **params):
+        return self.client.get(f"/analysis/analyses/{path}", params)
+
+    def walk(self, path, **params):
+        """Every page of a query, following next_cursor"""
+        pages = [self.get(path, **params).json()]
+        while pages[-1]["next_cursor"]:
+            pages.append(self.get(path, cursor=pages[-1]["next_cursor"], **params).json())
+        return pages
+
+    def test_cursor_pages_cover_the_ordering(self):
+        orderings = {
+            "position": lambda position: position,
+            "name": lambda position: (self.students[position]["name"], position),
+            "-sgpi": lambda position: _sgpi_order(self.students[position]["sgpi"], position),
+        }
+        for ordering, key in orderings.items():
+            with self.subTest(ordering):
+                pages = self.walk("analysis/students/", ordering=ordering, limit=7, papers=0)
+
+                self.assertEqual([len(page["results"]) for page in pages], [7, 7, 7, 7, 7, 5])
+                self.assertEqual([page["count"] for page in pages], [40] + [None] * 5)
+                expected = [self.students[position]["seat_no"] for position in sorted(range(40), key=key)]
+                self.assertEqual([student["seat_no"] for page in pages for student in page["results"]], expected)
+
+    def test_filters(self):
+        cases = {
+            "result": ({"result": "Successful"}, lambda student: student["result"] == "Successful"),
+            "sgpi range": ({"sgpi_min": "6", "sgpi_max": "8"}, lambda student: student["sgpi"] is not None and 6 <= student["sgpi"] <= 8),
+            "paper grade": ({"paper_code": "P1", "grade": "F"}, lambda student: student["papers"][1]["grade"] == "F"),
+            "name": ({"name": "student b"}, lambda student: "STUDENT B" in student["name"]),
+        }
+        for case, (params, matches) in cases.items():
+            with self.subTest(case):
+                pages = self.walk("analysis/students/", limit=500, **params)
+                self.assertEqual(
+                    [student["seat_no"] for student in pages[0]["results"]],
+                    [student["seat_no"] for student in self.students if matches(student)]
+                )
+
+    def test_top_students(self):
+        body = self.get("analysis/students/", top=3).json()
+        expected = sorted(range(40), key=lambda position: _sgpi_order(self.students[position]["sgpi"], position))[:3]
+        self.assertEqual([student["seat_no"] for student in body["results"]], [self.students[position]["seat_no"] for position in expected])
+        self.assertEqual([student["sgpi_rank"] for student in body["results"]], [1, 2, 3])
+        self.assertIsNone(body["next_cursor"])
+
+    def test_percentages_by_semester(self):
+        save_percentages("percentages", [
+            [{"seat_no": "1", "name": "A", "normalized_name": "a", "percentage": 61.5},
+             {"seat_no": "2", "name": "B", "normalized_name": "b", "percentage": 72.0}],
+            [{"seat_no": "1", "name": "A", "normalized_name": "a", "percentage": 80.0}],
+        ], "sem.pdf")
+
+        first = self.get("percentages/percentages/", ordering="-percentage").json()
+        self.assertEqual([record["name"] for record in first["results"]], ["B", "A"])
+        second = self.get("percentages/percentages/", semester=2).json()
+        self.assertEqual([(record["name"], record["percentage"]) for record in second["results"]], [("A", 80.0)])
+
+    def test_invalid_queries(self):
+        cases = {
+            "unknown analysis": ("missing/students/", {}, 404),
+            "wrong kind": ("analysis/percentages/", {}, 404),
+            "ordering": ("analysis/students/", {"ordering": "grade"}, 400),
+            "cursor": ("analysis/students/", {"cursor": "not-a-cursor"}, 400),
+            "number": ("analysis/students/", {"sgpi_min": "high"}, 400),
+        }
+        for case, (path, params, status_code) in cases.items():
+            with self.subTest(case):
+                response = self.get(path, **params)
+                self.assertEqual(response.status_code, status_code)
+                self.assertFalse(response.json()["success"])
+
+
+def percentage_register(path, students=30):
+    """Write a small percentage register PDF, a few pages of students after a subject table"""
+    rng = random.Random(17)
+    lines = ["University of Mumbai", "OFFICE REGISTER"] + [f"ABC1{subject} - Subject {subject}: x 100/0" for subject in range(5)]
+    for student in range(students):
+        lines.append(f"{1000000 + student} STUDENT {chr(65 + student % 26)}{chr(65 + student // 26)} | x")
+        lines.append("| " + " | ".join(f"1 2 {rng.randint(20, 99)}" for _ in range(5)) + " |")
+
+    document = fitz.open()
+    for start in range(0, len(lines), 40):
+        page = document.new_page(width=800, height=1200)
+        for line_number, line in enumerate(lines[start:start + 40]):
+            page.insert_text((20, 20 + 11 * line_number), line, fontsize=8)
+    document.save(path)
+    return path
+
+
+class StreamingTests(MediaTestCase):
+    def events(self, response):
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in b"".join(response.streaming_content).decode("utf-8").splitlines()]
+
+    def test_students_are_streamed_between_a_header_and_a_trailer(self):
+        events = self.events(self.upload("/analysis/get-analysis-data/?stream=1"))
+
+        header, *students, trailer = events
+        self.assertEqual(header, {"type": "header", "analysis_id": header["analysis_id"], "cached": False})
+        self.assertEqual({event["type"] for event in students}, {"student"})
+        self.assertEqual((trailer["type"], trailer["count"], trailer["analysis_id"]), ("trailer", 103, header["analysis_id"]))
+
+        with override_settings(RESULT_CACHE_ENABLED=False):
+            results = self.upload("/analysis/get-analysis-data/").json()["results"]
+        self.assertEqual([event["student"] for event in students], results)
+
+    def test_cache_hits_are_replayed(self):
+        first = self.events(self.upload("/analysis/get-analysis-data/?stream=1"))
+        second = self.events(self.upload("/analysis/get-analysis-data/?stream=1"))
+
+        self.assertTrue(second[0]["cached"])
+        self.assertEqual(second[1:], first[1:])
+
+    def test_percentage_results_are_streamed(self):
+        path = percentage_register(os.path.join(self.media_root, "percentages.pdf"))
+        events = self.events(self.upload("/analysis/get-single-pdf-percentage-analysis-data/?stream=1", path=path))
+
+        self.assertEqual([event["type"] for event in events], ["header"] + ["result"] * 30 + ["trailer"])
+        with override_settings(RESULT_CACHE_ENABLED=False):
+            body = self.upload("/analysis/get-single-pdf-percentage-analysis-data/", path=path).json()
+        self.assertEqual([event["result"] for event in events[1:-1]], body["results"])
+
+    def test_errors_after_the_header_are_streamed(self):
+        with self.assertLogs("analysis.views", "ERROR"):
+            events = self.events(self.upload("/analysis/get-single-pdf-percentage-analysis-data/?stream=1"))
+
+        self.assertEqual([event["type"] for event in events], ["header", "error"])
+        self.assertEqual(events[-1]["message"], "No student data found in PDF.")
+
+    def test_missing_upload(self):
+        response = self.client.post("/analysis/get-analysis-data/?stream=1", {})
+        self.assertEqual(response.status_code, 400)
+
+
+class PassFailChartTests(MediaTestCase):
+    CHART_DATA = {"courses": ["FEC101", "FEC102"], "pass_counts": [40, 35], "fail_counts": [5, 10], "absent_counts": [0, 1]}
+
+    def png_width(self, url):
+        with open(os.path.join(self.media_root, url[len(settings.MEDIA_URL):]), "rb") as f:
+            header = f.read(24)
+        return struct.unpack(">I", header[16:20])[0]
+
+    def chart_width(self, **params):
+        ledger = SimpleUploadedFile("ledger.xlsx", b"ledger")
+        with mock.patch("analysis.Handlers.excel_handler.extract_pass_fail_data", return_value=self.CHART_DATA):
+            response = PassFailAnalysisView().handle(MultiValueDict({"file": [ledger]}), **params)
+        return self.png_width(response.data["chart_url"])
+
+    def test_png_resolution_defaults_to_the_setting(self):
+        with override_settings(CHART_DEFAULT_DPI=50):
+            low = self.chart_width()
+        with override_settings(CHART_DEFAULT_DPI=100):
+            high = self.chart_width()
+        self.assertAlmostEqual(high / low, 2, delta=0.05)
+        self.assertEqual(self.chart_width(dpi=100), high)
@@ -4,6 +4,8 @@ from .views import *
 urlpatterns = [
     path('status-check/', StatusCheck.as_view(), name='analysis'),
     path('get-analysis-data/', AnalysisView.as_view(), name='analysis'),
+    path('batch-analysis-data/', BatchAnalysisView.as_view(), name='batch_analysis'),
+    path('revaluation/<str:analysis_id>/', RevaluationView.as_view(), name='revaluation'),
 
     path('get-single-pdf-percentage-analysis-data/', SinglePDFPercentageAnalysisView.as_view(), name='single_pdf_percentage_analysis'),
     path('get-multiple-pdf-percentage-analysis-data/', MultiplePDFPercentageAnalysisView.as_view(), name='multiple_pdf_percentage_analysis'),
@@ -12,4 +14,9 @@ urlpatterns = [
     path('pass-fail-analysis/', PassFailAnalysisView.as_view(), name='pass_fail_analysis'),
     path('average-semesters/', AverageSemestersView.as_view(), name='average_semesters'),
 
+    path('jobs/<str:job_id>/', JobStatusView.as_view(), name='job_status'),
+    path('artifacts/<str:file_stem>/<str:export_format>/', ArtifactView.as_view(), name='artifact'),
+    path('analyses/<str:analysis_id>/students/', StudentQueryView.as_view(), name='analysis_students'),
+    path('analyses/<str:analysis_id>/percentages/', PercentageQueryView.as_view(), name='analysis_percentages'),
+
 ]
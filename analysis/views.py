@@ -1,10 +1,26 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .Handlers import analysis_handler, PDFPercentageAnalyzer, excel_handler
+from .Handlers import charts, exports, result_cache, result_queries, job_queue
+from .Handlers.lazy import lazy_module
+from . import jobs
 import os
 import uuid
 from django.conf import settings   
+from django.urls import reverse
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+import json
+
+# Imported on first use; these pull in pandas, openpyxl, matplotlib and PyMuPDF
+analysis_handler = lazy_module("analysis.Handlers.analysis_handler")
+artifacts = lazy_module("analysis.Handlers.artifacts")
+batch_handler = lazy_module("analysis.Handlers.batch_handler")
+excel_handler = lazy_module("analysis.Handlers.excel_handler")
+PDFPercentageAnalyzer = lazy_module("analysis.Handlers.PDFPercentageAnalyzer")
+revaluation = lazy_module("analysis.Handlers.revaluation")
+
 class StatusCheck(APIView):    
     def post(self, request):
         return Response({"success": True, "message": "Students System Working."}, status=status.HTTP_200_OK)
@@ -15,22 +31,159 @@ import logging
 # It's good practice to log errors for debugging
 logger = logging.getLogger(__name__)
 
-class AnalysisView(APIView):
-    def post(self, request):
+class QueueableAPIView(APIView):
+    """
+    Runs handle(files, **url_kwargs) inside the request, or with ?async=1 queues
+    the uploads for the analysis workers and answers at once with a job id.
+    Views that define events(files, **url_kwargs) can also answer ?stream=1 with
+    newline-delimited JSON, one record per line as the analysis produces it.
+    Exportable views take ?format=csv,json,... and pass the parsed formats to handle().
+    """
+    job_kind = None
+    events = None
+    exportable = False
+
+    def post(self, request, *args, **kwargs):
+        if self.exportable:
+            try:
+                kwargs['formats'] = list(exports.parse_formats(request.query_params.get('format')))
+            except ValueError as e:
+                return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.query_params.get('async') in ('1', 'true'):
+            try:
+                job_id = jobs.submit(self.job_kind, request.FILES, kwargs)
+            except Exception as e:
+                logger.error(f"Error queueing {self.job_kind} job: {e}", exc_info=True)
+                return Response({"success": False, "message": f"Could not queue job: {str(e)}"}, status=500)
+            return Response({
+                "success": True,
+                "message": "Job queued.",
+                "job_id": job_id,
+                "status_url": reverse('job_status', args=[job_id])
+            }, status=status.HTTP_202_ACCEPTED)
+
+        if self.events and request.query_params.get('stream') in ('1', 'true'):
+            return self.stream(request.FILES, **kwargs)
+
+        return self.handle(request.FILES, **kwargs)
+
+    def stream(self, files, **kwargs):
+        pdf_file = files.get('marksheet')
+        if not pdf_file:
+            return Response({"success": False, "message": "No PDF uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+
+        def lines():
+            try:
+                for event in self.events(pdf_file, **kwargs):
+                    yield json.dumps(event, ensure_ascii=False) + "\n"
+            except Exception as e:
+                # Headers are already sent, so errors are reported in the stream
+                logger.error(f"Error during streamed {self.job_kind}: {e}", exc_info=True)
+                yield json.dumps({"type": "error", "message": str(e)}) + "\n"
+
+        response = StreamingHttpResponse(lines(), content_type="application/x-ndjson")
+        response["Cache-Control"] = "no-cache"
+        # Keep reverse proxies from buffering the stream
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+class JobStatusView(APIView):
+    def get(self, request, job_id):
+        job = job_queue.get(job_id)
+        if not job:
+            return Response({"success": False, "message": "Job not found."}, status=404)
+
+        body = {
+            "success": job["status"] != job_queue.FAILED,
+            "job_id": job["id"],
+            "status": job["status"],
+            "progress": job["progress"],
+            "attempts": job["attempts"]
+        }
+        if job["result"]:
+            # The endpoint's own response, including its artifact URLs
+            body["status_code"] = job["result"]["status_code"]
+            body["result"] = job["result"]["body"]
+        elif job["error"]:
+            body["error"] = job["error"]
+        return Response(body, status=200)
+
+class ArtifactView(APIView):
+    """
+    Download an analysis artifact in one of the export formats. Files are built from the
+    stored results on first request, then served from disk with ETag/Last-Modified validators.
+    """
+
+    def get(self, request, file_stem, export_format):
         try:
-            pdf_file = request.FILES.get('marksheet')
+            manifest, etag, last_modified = artifacts.artifact_version(file_stem, export_format)
+        except LookupError as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = quote_etag(etag)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            try:
+                path = artifacts.build_artifact(file_stem, export_format, manifest)
+            except ValueError as e:
+                return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except Exception as e:
+                logger.error(f"Error building {export_format} artifact of {file_stem}: {e}", exc_info=True)
+                return Response({"success": False, "message": f"Could not build artifact: {str(e)}"}, status=500)
+            response = FileResponse(
+                open(path, "rb"), as_attachment=True, filename=os.path.basename(path),
+                content_type=exports.CONTENT_TYPES[export_format]
+            )
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+        # Artifacts change when an analysis is revalued, so clients revalidate every time
+        response["Cache-Control"] = "no-cache"
+        return response
+
+class StoredResultsView(APIView):
+    """Paginated, filterable reads of a stored analysis; see result_queries for the parameters"""
+    query = None
+
+    def get(self, request, analysis_id):
+        try:
+            data = type(self).query(analysis_id, request.query_params)
+        except LookupError as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"success": True, "analysis_id": analysis_id, **data}, status=status.HTTP_200_OK)
+
+class StudentQueryView(StoredResultsView):
+    query = result_queries.query_students
+
+class PercentageQueryView(StoredResultsView):
+    query = result_queries.query_percentages
+
+class AnalysisView(QueueableAPIView):
+    job_kind = 'get-analysis-data'
+    exportable = True
+
+    def events(self, pdf_file, formats=None):
+        # Students are sent as the pages are parsed
+        return analysis_handler.iter_extract_result(pdf_file, streaming=True, formats=formats)
+
+    def handle(self, files, formats=None):
+        try:
+            pdf_file = files.get('marksheet')
             if not pdf_file:
                 return Response({"success": False, "message": "No PDF uploaded."}, status=status.HTTP_400_BAD_REQUEST)
 
             # Call the handler
-            results, json_path, excel_path = analysis_handler.extract_result(file=pdf_file)
+            results, artifacts, analysis_id = analysis_handler.extract_result(file=pdf_file, formats=formats)
 
             return Response({
                 "success": True,
                 "message": "Analysis completed.",
+                "analysis_id": analysis_id,
                 "results": results,
-                "json_file": json_path,
-                "excel_file": excel_path
+                **exports.artifact_fields(artifacts)
             }, status=status.HTTP_200_OK)
 
         except Exception as e:
@@ -43,21 +196,93 @@ class AnalysisView(APIView):
                 "message": f"An error occurred during analysis: {str(e)}"
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class SinglePDFPercentageAnalysisView(APIView):
-    def post(self, request):
+class BatchAnalysisView(QueueableAPIView):
+    """Analyze many registers at once: PDFs and/or ZIPs of PDFs under the 'files' field"""
+
+    job_kind = 'batch-analysis-data'
+    exportable = True
+
+    def handle(self, files, formats=None):
+        try:
+            uploaded_files = files.getlist('files')
+            if not uploaded_files:
+                return Response({"success": False, "message": "No files uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+
+            summary, artifacts = batch_handler.analyze_batch(uploaded_files, formats)
+
+            return Response({
+                "success": True,
+                "message": "Batch analysis completed.",
+                "registers": len(summary),
+                "failed_registers": sum(1 for item in summary if not item["success"]),
+                "summary": summary,
+                **exports.artifact_fields(artifacts)
+            }, status=status.HTTP_200_OK)
+
+        except ValueError as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error during batch analysis: {e}", exc_info=True)
+            return Response({
+                "success": False,
+                "message": f"An error occurred during analysis: {str(e)}"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class RevaluationView(QueueableAPIView):
+    """Apply a revaluation or supplementary result PDF ('marksheet') to an existing analysis"""
+
+    job_kind = 'revaluation'
+
+    def handle(self, files, analysis_id):
         try:
-            pdf_file = request.FILES.get('marksheet')
+            pdf_file = files.get('marksheet')
+            if not pdf_file:
+                return Response({"success": False, "message": "No PDF uploaded."}, status=status.HTTP_400_BAD_REQUEST)
+
+            students, statistics, json_url, excel_url = revaluation.apply_delta(analysis_id, pdf_file)
+
+            return Response({
+                "success": True,
+                "message": f"{len(students)} student(s) updated.",
+                "analysis_id": analysis_id,
+                "students": students,
+                "statistics": statistics,
+                "json_file": json_url,
+                "excel_file": excel_url
+            }, status=status.HTTP_200_OK)
+
+        except FileNotFoundError as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except ValueError as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            logger.error(f"Error during revaluation update: {e}", exc_info=True)
+            return Response({
+                "success": False,
+                "message": f"An error occurred during analysis: {str(e)}"
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+class SinglePDFPercentageAnalysisView(QueueableAPIView):
+    job_kind = 'get-single-pdf-percentage-analysis-data'
+    exportable = True
+
+    def events(self, pdf_file, formats=None):
+        return analysis_handler.iter_pdf_percentage(pdf_file, formats)
+
+    def handle(self, files, formats=None):
+        try:
+            pdf_file = files.get('marksheet')
             if not pdf_file:
                 return Response({"success": False, "message": "No PDF uploaded."}, status=400)
 
-            results, json_url, excel_url = analysis_handler.analyze_pdf_percentage(pdf_file)
+            results, artifacts, analysis_id = analysis_handler.analyze_pdf_percentage(pdf_file, formats)
 
             return Response({
                 "success": True,
                 "message": "Percentage analysis completed.",
+                "analysis_id": analysis_id,
                 "results": results,
-                "json_file": json_url,
-                "excel_file": excel_url
+                **exports.artifact_fields(artifacts)
             })
         except Exception as e:
             return Response({
@@ -65,49 +290,55 @@ class SinglePDFPercentageAnalysisView(APIView):
                 "message": f"An error occurred: {str(e)}"
             }, status=500)
 
-class MultiplePDFPercentageAnalysisView(APIView):
-    """Multiple PDF percentage analysis (SEM1 + SEM2 merge)"""
+class MultiplePDFPercentageAnalysisView(QueueableAPIView):
+    """
+    Multiple PDF percentage analysis: merges any number of semesters,
+    uploaded as sem1_pdf, sem2_pdf, ... semN_pdf
+    """
     
-    def post(self, request):
+    job_kind = 'get-multiple-pdf-percentage-analysis-data'
+    exportable = True
+
+    def handle(self, files, formats=None):
         try:
-            sem1_file = request.FILES.get('sem1_pdf')
-            sem2_file = request.FILES.get('sem2_pdf')
+            semester_files = []
+            while files.get(f'sem{len(semester_files) + 1}_pdf'):
+                semester_files.append(files.get(f'sem{len(semester_files) + 1}_pdf'))
             
-            if not sem1_file or not sem2_file:
+            if len(semester_files) < 2:
                 return Response({
                     "success": False,
-                    "message": "Both SEM1 and SEM2 PDFs are required."
+                    "message": "At least SEM1 and SEM2 PDFs are required."
                 }, status=400)
 
             # Validate file types
-            if not sem1_file.name.endswith('.pdf') or not sem2_file.name.endswith('.pdf'):
+            if not all(semester_file.name.endswith('.pdf') for semester_file in semester_files):
                 return Response({
                     "success": False,
                     "message": "Only PDF files are allowed."
                 }, status=400)
 
-            results, json_url, excel_url = PDFPercentageAnalyzer.analyze_multiple_pdfs(
-                sem1_file, 
-                sem2_file
-            )
+            results, artifacts = PDFPercentageAnalyzer.analyze_semester_pdfs(semester_files, formats)
 
             # Calculate statistics
-            both_sems = sum(1 for r in results if r['Percentage Sem1'] is not None and r['Percentage Sem2'] is not None)
-            only_sem1 = sum(1 for r in results if r['Percentage Sem1'] is not None and r['Percentage Sem2'] is None)
-            only_sem2 = sum(1 for r in results if r['Percentage Sem1'] is None and r['Percentage Sem2'] is not None)
+            semesters = range(1, len(semester_files) + 1)
+            present = [[r[f'Percentage Sem{i}'] is not None for i in semesters] for r in results]
+            statistics = {
+                "total_students": len(results),
+                "semesters": len(semester_files),
+                "all_semesters": sum(1 for flags in present if all(flags))
+            }
+            if len(semester_files) == 2:
+                statistics["both_semesters"] = statistics["all_semesters"]
+            for i in semesters:
+                statistics[f"only_sem{i}"] = sum(1 for flags in present if flags[i - 1] and sum(flags) == 1)
 
             return Response({
                 "success": True,
                 "message": "Multiple PDF analysis completed.",
                 "results": results,
-                "statistics": {
-                    "total_students": len(results),
-                    "both_semesters": both_sems,
-                    "only_sem1": only_sem1,
-                    "only_sem2": only_sem2
-                },
-                "json_file": json_url,
-                "excel_file": excel_url
+                "statistics": statistics,
+                **exports.artifact_fields(artifacts)
             })
             
         except Exception as e:
@@ -116,17 +347,26 @@ class MultiplePDFPercentageAnalysisView(APIView):
                 "message": f"An error occurred: {str(e)}"
             }, status=500)
 
-class ProcessExcelView(APIView):
-    def post(self, request, *args, **kwargs):
+class ProcessExcelView(QueueableAPIView):
+    job_kind = 'get-kt-students'
+
+    def handle(self, files):
         # Check if file is present in request
         try:
-            if 'file' not in request.FILES:
+            if 'file' not in files:
                 return Response({'error': 'No file uploaded'}, status=400)
-            uploaded_file = request.FILES['file']
+            uploaded_file = files['file']
             
             # Validate file extension
             if not uploaded_file.name.endswith('.xlsx'):
                 return Response({'error': 'Only .xlsx files are allowed'}, status=400)            
+
+            # Identical uploads are answered from the result cache
+            cache_key = result_cache.make_key("get-kt-students", excel_handler.PARSER_VERSION, result_cache.upload_sha256(uploaded_file))
+            cached = result_cache.lookup(cache_key)
+            if cached:
+                return Response(cached, status=200)
+
             # Generate unique file ID
             file_id = str(uuid.uuid4())
             
@@ -157,23 +397,46 @@ class ProcessExcelView(APIView):
                 if os.path.exists(input_path):
                     os.remove(input_path)
 
+                result_cache.store(cache_key, {'excel_file': excel_url}, [output_path])
+
                 return Response({'excel_file': excel_url}, status=200)            
             except Exception as e:
                 return Response({'error': f'Error processing Excel file: {str(e)}'}, status=500)
         except Exception as e:
             return Response({'error': f'An unexpected error occurred: {str(e)}'}, status=500)
 
-class PassFailAnalysisView(APIView):
-    def post(self, request):
+class PassFailAnalysisView(QueueableAPIView):
+    """
+    Pass/fail counts of a ledger, with the chart as ?chart=png (default), svg or data
+    (counts only) and ?dpi=<n> for PNGs.
+    """
+    job_kind = 'pass-fail-analysis'
+
+    def post(self, request, *args, **kwargs):
+        try:
+            kwargs.update(charts.parse_options(request.query_params))
+        except ValueError as e:
+            return Response({"success": False, "message": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return super().post(request, *args, **kwargs)
+
+    def handle(self, files, chart_format="png", dpi=None):
         try:
-            if 'file' not in request.FILES:
+            if 'file' not in files:
                 return Response({'error': 'No file uploaded'}, status=400)
             
-            uploaded_file = request.FILES['file']
+            uploaded_file = files['file']
             
             # Validate file extension
             if not uploaded_file.name.endswith(('.xlsx', '.xls')):
                 return Response({'error': 'Only Excel files are allowed'}, status=400)        
+
+            # Identical uploads are answered from the result cache, and identical
+            # counts from the chart cache
+            cache_key = result_cache.make_key("pass-fail-analysis", excel_handler.PARSER_VERSION, result_cache.upload_sha256(uploaded_file))
+            cached = result_cache.lookup(cache_key)
+            if cached:
+                return Response(self.payload(cached["chart_data"], chart_format, dpi), status=200)
+
             # Generate unique file ID
             file_id = str(uuid.uuid4())
             upload_dir_name = 'uploads'
@@ -191,19 +454,11 @@ class PassFailAnalysisView(APIView):
                     destination.write(chunk)
             
             try:
-                # Analyze pass/fail and generate chart
-                chart_filename = f"{file_id}_chart.png"
-                chart_path = os.path.join(upload_dir, chart_filename)
-                
-                chart_data = excel_handler.analyze_pass_fail(input_path, chart_path)
-                
-                # Generate response URL
-                chart_url = os.path.join(settings.MEDIA_URL, upload_dir_name, chart_filename).replace("\\", "/")
-                
-                return Response({
-                    "chart_url": chart_url,
-                    "chart_data": chart_data
-                }, status=200)
+                # Analyze pass/fail; the chart is rendered (or reused) separately
+                chart_data = excel_handler.extract_pass_fail_data(input_path)
+                result_cache.store(cache_key, {"chart_data": chart_data}, [input_path])
+
+                return Response(self.payload(chart_data, chart_format, dpi), status=200)
             
             except Exception as e:
                 return Response({
@@ -214,11 +469,19 @@ class PassFailAnalysisView(APIView):
                 "error": f"An unexpected error occurred: {str(e)}"
             }, status=500)
         
-class AverageSemestersView(APIView):
-    def post(self, request):
+    def payload(self, chart_data, chart_format, dpi):
+        payload = {"chart_format": chart_format, "chart_data": chart_data}
+        if chart_format != "data":
+            payload["chart_url"] = charts.pass_fail_chart_url(chart_data, chart_format, dpi)
+        return payload
+
+class AverageSemestersView(QueueableAPIView):
+    job_kind = 'average-semesters'
+
+    def handle(self, files):
         try:
         # Get all uploaded files with keys like 'file1', 'file2', etc.
-            files_dict = request.FILES
+            files_dict = files
             
             if not files_dict:
                 return Response({"error": "No files provided"}, status=400)
@@ -242,6 +505,15 @@ class AverageSemestersView(APIView):
                         "error": f"Invalid file format for {uploaded_file.name}. Only .xlsx and .xls are allowed."
                     }, status=400)
             
+            # Identical uploads are answered from the result cache
+            cache_key = result_cache.make_key(
+                "average-semesters", excel_handler.PARSER_VERSION,
+                *[result_cache.upload_sha256(uploaded_file) for uploaded_file in uploaded_files]
+            )
+            cached = result_cache.lookup(cache_key)
+            if cached:
+                return Response(cached, status=200)
+
             # Generate unique file ID
             file_id = str(uuid.uuid4())
             upload_dir_name = 'uploads'
@@ -272,6 +544,8 @@ class AverageSemestersView(APIView):
                 # Generate response URL
                 excel_url = os.path.join(settings.MEDIA_URL, upload_dir_name, output_filename).replace("\\", "/")
                 
+                result_cache.store(cache_key, {"excel_file": excel_url}, input_paths + [output_path])
+
                 return Response({
                     "excel_file": excel_url
                 }, status=200)
@@ -284,3 +558,15 @@ class AverageSemestersView(APIView):
             return Response({
                 "error": f"An unexpected error occurred: {str(e)}"
             }, status=500)
+
+# Endpoints the analysis workers can run, by job kind
+JOB_VIEWS = {view.job_kind: view for view in [
+    AnalysisView,
+    BatchAnalysisView,
+    RevaluationView,
+    SinglePDFPercentageAnalysisView,
+    MultiplePDFPercentageAnalysisView,
+    ProcessExcelView,
+    PassFailAnalysisView,
+    AverageSemestersView,
+]}
@@ -0,0 +1,15 @@
+import os
+
+# Set GUNICORN_PRELOAD=1 to load the application, together with the heavy analysis
+# libraries (pandas, openpyxl, matplotlib, PyMuPDF), once in the master. Workers are
+# then forked with them imported and share those pages copy-on-write. Otherwise each
+# worker starts with Django alone and imports them on the first request that needs them.
+preload_app = os.environ.get("GUNICORN_PRELOAD", "") == "1"
+
+
+def when_ready(server):
+    # Runs in the master after the application is loaded, before any worker is forked
+    if preload_app:
+        from analysis.Handlers.lazy import preload
+        preload()
+        server.log.info("Preloaded analysis handlers")